@@ -0,0 +1,135 @@
+"""
+Compare the DuckDB engine with PostgreSQL on identical data
+
+Every SQL query class of the suite runs on the synthetic database of each size and with DuckDBConnection on its
+Parquet copy, written by convert_parquet from the database. Results of both engines are checked to be equal and
+DuckDB is run with each number of --threads.
+
+Usage:
+    python benchmarks/engines.py --sizes small,medium
+    python benchmarks/engines.py --sizes small --threads 1,4 --cases MeasurementsMissing
+    python benchmarks/engines.py --sizes small --no-load --parquet-dir bench_parquet --output engines.json
+
+The database options are read from the DEDDIAG_DB_* environment variables, as for the CLI.
+Each size is loaded into the database deddiag_bench_<size>, which is created or replaced, unless --no-load is given.
+"""
+import argparse
+import fnmatch
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import ExitStack
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+import synthetic
+from suite import QUERIES, _connection, _context, _loader
+
+def _median_ms(run: Callable[[], pd.DataFrame], repeat: int) -> float:
+    seconds = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - t0)
+    return float(np.median(seconds) * 1000)
+
+
+def _equal(a: pd.DataFrame, b: pd.DataFrame) -> bool:
+    """Equal up to the row order of DISTINCT queries and float32 values rounded by PostgreSQL"""
+    a, b = a.reset_index(drop=True), b.reset_index(drop=True)
+    if list(a.columns) != list(b.columns) or len(a) != len(b):
+        return False
+    a = a.sort_values(list(a.columns), ignore_index=True)
+    b = b.sort_values(list(b.columns), ignore_index=True)
+    try:
+        pd.testing.assert_frame_equal(a, b, check_exact=False, rtol=1e-6, check_dtype=len(a) > 0)
+    except AssertionError:
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default='small', help=f"Comma separated sizes of {list(synthetic.SIZES)}")
+    parser.add_argument("--cases", default='*', help="Comma separated glob patterns of query class names")
+    parser.add_argument("--threads", default=str(os.cpu_count() or 1),
+                        help="Comma separated numbers of DuckDB threads, all cores by default")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per query and engine")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-load", action='store_true', help="Use the databases loaded by a previous run")
+    parser.add_argument("--parquet-dir", default=None,
+                        help="Directory of the Parquet copies, temporary if not given. Existing copies are reused "
+                             "with --no-load")
+    parser.add_argument("--output", default=None, help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    patterns = args.cases.split(',')
+    names = [n for n in QUERIES if any(fnmatch.fnmatch(n, p) or n.startswith(p) for p in patterns)]
+    threads = [int(t) for t in args.threads.split(',')]
+
+    results = []
+    with ExitStack() as stack:
+        parquet_dir = args.parquet_dir
+        if parquet_dir is None:
+            parquet_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix='deddiag_parquet_'))
+        workdir = stack.enter_context(tempfile.TemporaryDirectory(prefix='deddiag_case_'))
+        options = synthetic.db_options()
+        for size in args.sizes.split(','):
+            options['db_name'] = f"deddiag_bench_{size}"
+            path = os.path.join(parquet_dir, options['db_name'])
+            if not args.no_load:
+                data = synthetic.generate(*synthetic.SIZES[size], seed=args.seed)
+                con = synthetic.connect(db_name=options['db_name'], create=True,
+                                        **{k: options[k] for k in ('host', 'port', 'user', 'password')})
+                synthetic.load_postgres(data, con, replace=True)
+                con.close()
+            if not args.no_load or not os.path.exists(path):
+                shutil.rmtree(path, ignore_errors=True)
+                t0 = time.perf_counter()
+                rows = _loader().convert_parquet(_connection(options), path)
+                print(f"Converted {size}: {sum(rows.values())} measurements of {len(rows)} items to Parquet "
+                      f"in {time.perf_counter() - t0:.1f}s")
+
+            pg = _context(options, workdir)
+            duckdb = {t: _context({'duckdb': path, 'threads': t}, workdir) for t in threads}
+            header = ''.join(f"{f'duckdb/{t}':>12}" for t in threads)
+            print(f"{'size':<8}{'query':<40}{'rows':>10}{'postgres':>12}{header}{'speedup':>9}  equal  (p50 ms)")
+            for name in names:
+                if name == 'MeasurementsDaily':
+                    # Summaries of the database are a table filled by refresh_rollups, of DuckDB a view
+                    _loader().refresh_rollups(pg.con)
+                expected = QUERIES[name](pg).request(pg.con)
+                record = {'size': size, 'query': name, 'rows': len(expected),
+                          'postgres_ms': _median_ms(lambda: QUERIES[name](pg).request(pg.con), args.repeat),
+                          'equal': True}
+                for t, ctx in duckdb.items():
+                    record['equal'] &= _equal(expected, QUERIES[name](ctx).request(ctx.con))
+                    record[f'duckdb_{t}_ms'] = _median_ms(lambda: QUERIES[name](ctx).request(ctx.con), args.repeat)
+                if name == 'MeasurementsDaily':
+                    _loader().drop_rollups(pg.con)
+                fastest = min(record[f'duckdb_{t}_ms'] for t in threads)
+                record['speedup'] = record['postgres_ms'] / fastest
+                results.append(record)
+                timings = ''.join(f"{record[f'duckdb_{t}_ms']:>12.1f}" for t in threads)
+                print(f"{size:<8}{name:<40}{record['rows']:>10}{record['postgres_ms']:>12.1f}{timings}"
+                      f"{record['speedup']:>8.1f}x  {'yes' if record['equal'] else 'NO'}")
+            for ctx in duckdb.values():
+                ctx.con.close()
+
+    if args.output is not None:
+        import deddiag_loader
+        import duckdb
+        meta = {'date': pd.Timestamp.now('UTC').isoformat(), 'deddiag_loader': deddiag_loader.__version__,
+                'duckdb': duckdb.__version__, 'cpus': os.cpu_count(), 'repeat': args.repeat, 'seed': args.seed}
+        with open(args.output, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=1)
+    if not all(r['equal'] for r in results):
+        raise SystemExit("Results of DuckDB differ from PostgreSQL")
+
+
+if __name__ == '__main__':
+    main()
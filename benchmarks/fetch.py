@@ -0,0 +1,48 @@
+"""
+Compare fetch engines of Connection
+
+Usage:
+    python benchmarks/fetch.py --item-id 10 --start-date 2017-01-01 --stop-date 2017-02-01
+
+The database options are read from the DEDDIAG_DB_* environment variables, as for the CLI.
+"""
+import argparse
+import os
+import time
+
+from deddiag_loader import Connection, Measurements, MeasurementsExpanded, MeasurementsExpandedWithLabels
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--item-id", type=int, required=True)
+    parser.add_argument("--label-id", type=int, default=None)
+    parser.add_argument("--start-date", required=True)
+    parser.add_argument("--stop-date", required=True)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    con = Connection(host=os.environ.get('DEDDIAG_DB_HOST', 'localhost'),
+                     port=os.environ.get('DEDDIAG_DB_PORT', '5432'),
+                     db_name=os.environ.get('DEDDIAG_DB_NAME', 'postgres'),
+                     user=os.environ.get('DEDDIAG_DB_USER', 'postgres'),
+                     password=os.environ.get('DEDDIAG_DB_PW', ''))
+    queries = [
+        Measurements(args.item_id, args.start_date, args.stop_date),
+        MeasurementsExpanded(args.item_id, args.start_date, args.stop_date),
+        MeasurementsExpandedWithLabels(args.item_id, args.label_id, args.start_date, args.stop_date),
+    ]
+    print(f"{'query':<32}{'engine':<8}{'rows':>12}{'best [s]':>12}{'rows/s':>14}")
+    for query in queries:
+        for engine in query.ENGINES:
+            timings = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                df = query.request(con, engine=engine)
+                timings.append(time.perf_counter() - t0)
+            best = min(timings)
+            print(f"{type(query).__name__:<32}{engine:<8}{len(df):>12}{best:>12.3f}{len(df) / best:>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
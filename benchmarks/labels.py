@@ -0,0 +1,57 @@
+"""
+Compare label assignment by the SQL subquery of MeasurementsExpandedWithLabels with the client side interval join
+
+Usage:
+    python benchmarks/labels.py --item-id 10 --label-id 1 --start-date 2017-01-01 --days 30
+
+The database options are read from the DEDDIAG_DB_* environment variables, as for the CLI.
+"""
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from deddiag_loader import Connection, MeasurementsExpandedWithLabels, MeasurementsExpandedWithLabelsClient
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--item-id", type=int, required=True)
+    parser.add_argument("--label-id", type=int, nargs='*', default=None)
+    parser.add_argument("--start-date", required=True)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    con = Connection(host=os.environ.get('DEDDIAG_DB_HOST', 'localhost'),
+                     port=os.environ.get('DEDDIAG_DB_PORT', '5432'),
+                     db_name=os.environ.get('DEDDIAG_DB_NAME', 'postgres'),
+                     user=os.environ.get('DEDDIAG_DB_USER', 'postgres'),
+                     password=os.environ.get('DEDDIAG_DB_PW', ''))
+    start = pd.Timestamp(args.start_date)
+    stop = start + pd.Timedelta(days=args.days)
+    queries = [
+        ("sql", MeasurementsExpandedWithLabels(args.item_id, args.label_id, str(start), str(stop)), {}),
+        ("client", MeasurementsExpandedWithLabelsClient(args.item_id, args.label_id, str(start), str(stop)), {}),
+        ("client copy", MeasurementsExpandedWithLabelsClient(args.item_id, args.label_id, str(start), str(stop)),
+         {'engine': 'copy'}),
+    ]
+    results = {}
+    print(f"{'variant':<16}{'rows':>12}{'labeled':>12}{'best [s]':>12}{'rows/s':>14}")
+    for name, query, kwargs in queries:
+        timings = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            df = query.request(con, **kwargs)
+            timings.append(time.perf_counter() - t0)
+        results[name] = df
+        best = min(timings)
+        print(f"{name:<16}{len(df):>12}{int(df['labels'].sum()):>12}{best:>12.3f}{len(df) / best:>14.0f}")
+    for name, df in results.items():
+        if not df['labels'].equals(results['sql']['labels']):
+            print(f"WARNING: labels of {name} differ from sql")
+
+
+if __name__ == '__main__':
+    main()
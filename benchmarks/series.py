@@ -0,0 +1,48 @@
+"""
+Compare memory of query results as DataFrame and as MeasurementSeries
+
+Usage:
+    python benchmarks/series.py --item-id 10 --start-date 2017-01-01 --stop-date 2017-02-01
+
+The database options are read from the DEDDIAG_DB_* environment variables, as for the CLI.
+"""
+import argparse
+import os
+import time
+
+from deddiag_loader import Connection, Measurements, MeasurementsExpandedClient, MeasurementSeries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--item-id", type=int, required=True)
+    parser.add_argument("--start-date", required=True)
+    parser.add_argument("--stop-date", required=True)
+    args = parser.parse_args()
+
+    con = Connection(host=os.environ.get('DEDDIAG_DB_HOST', 'localhost'),
+                     port=os.environ.get('DEDDIAG_DB_PORT', '5432'),
+                     db_name=os.environ.get('DEDDIAG_DB_NAME', 'postgres'),
+                     user=os.environ.get('DEDDIAG_DB_USER', 'postgres'),
+                     password=os.environ.get('DEDDIAG_DB_PW', ''))
+    queries = [
+        Measurements(args.item_id, args.start_date, args.stop_date),
+        MeasurementsExpandedClient(args.item_id, args.start_date, args.stop_date),
+    ]
+    print(f"{'query':<28}{'format':<16}{'rows':>12}{'bytes/row':>12}{'to_frame [s]':>14}")
+    for query in queries:
+        df = query.request(con)
+        rows = max(len(df), 1)
+        print(f"{type(query).__name__:<28}{'DataFrame':<16}{len(df):>12}"
+              f"{df.memory_usage(deep=True).sum() / rows:>12.2f}{'':>14}")
+        for rle in (False, True):
+            series = MeasurementSeries.from_frame(df, rle)
+            t0 = time.perf_counter()
+            series.to_frame()
+            elapsed = time.perf_counter() - t0
+            name = 'Series (rle)' if rle else 'Series'
+            print(f"{type(query).__name__:<28}{name:<16}{len(series):>12}{series.nbytes / rows:>12.2f}{elapsed:>14.4f}")
+
+
+if __name__ == '__main__':
+    main()
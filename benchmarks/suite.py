@@ -0,0 +1,411 @@
+"""
+Benchmark suite on synthetic DEDDIAG databases
+
+Every query class, cache backend and CLI command is run on a synthetic dataset of each size, see synthetic.py.
+Each case runs in a fresh process after one untimed warm-up run, so peak RSS is measured per case.
+CLI cases run `python -m deddiag_loader` and include the interpreter start.
+
+Usage:
+    python benchmarks/suite.py --sizes small,medium --output baseline.json
+    python benchmarks/suite.py --sizes small,medium --baseline baseline.json --output results.json
+    python benchmarks/suite.py --sizes small --cases query/Measurements --repeat 20
+    python benchmarks/suite.py --temp-cluster --pg-bin /usr/lib/postgresql/16/bin
+    python benchmarks/suite.py --backend local --local-dir bench_data
+    python benchmarks/suite.py --backend duckdb --local-dir bench_parquet
+
+The database options are read from the DEDDIAG_DB_* environment variables, as for the CLI.
+Each size is loaded into the database deddiag_bench_<size>, which is created or replaced, unless --no-load is given.
+With --backend local the files of each size are written to <local-dir>/deddiag_bench_<size> and queried with
+LocalConnection instead, without a database. With --backend duckdb each size is loaded into the database as well,
+converted to Parquet files in <local-dir>/deddiag_bench_<size> and queried with DuckDBConnection,
+see engines.py for a side by side comparison.
+With --baseline, cases whose median latency or peak RSS grew by more than --threshold are reported as regressions
+and the exit code is 1.
+"""
+import argparse
+import fnmatch
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+import synthetic
+
+_DAY = pd.Timedelta(days=1)
+
+# pandas warns about psycopg2 connections on every read_sql_query
+warnings.filterwarnings('ignore', 'pandas only supports SQLAlchemy', UserWarning)
+
+
+class Context(NamedTuple):
+    con: "Connection"
+    item_id: int            # Item with the most annotations
+    label_ids: List[int]
+    start: pd.Timestamp     # First measurement of item_id
+    stop: pd.Timestamp      # Last measurement of item_id
+    workdir: str            # Empty directory, removed after the case
+
+
+def _context(options: dict, workdir: str) -> Context:
+    from deddiag_loader import DuckDBConnection, LocalConnection, AnnotationsBatch, MeasurementsRangeBatch
+    if options.get('local'):
+        con = LocalConnection(options['local'])
+    elif options.get('duckdb'):
+        con = DuckDBConnection(options['duckdb'], threads=options.get('threads'))
+    else:
+        con = _connection(options)
+    ranges = MeasurementsRangeBatch().request(con).set_index('item_id')
+    annotations = AnnotationsBatch().request(con)
+    if len(annotations):
+        item_id = int(annotations.groupby('item_id').size().idxmax())
+        label_ids = sorted(annotations.loc[annotations.item_id == item_id, 'label_id'].unique().tolist())
+    else:
+        item_id, label_ids = int(ranges.index[0]), [1]
+    return Context(con, item_id, label_ids, ranges.loc[item_id, 'min_date'], ranges.loc[item_id, 'max_date'], workdir)
+
+
+def _connection(options: dict) -> "Connection":
+    from deddiag_loader import Connection
+    return Connection(options['host'], options['port'], options['db_name'], options['user'], options['password'])
+
+
+def _day(ctx: Context):
+    """Second day of the item, a full day of measurements"""
+    return (ctx.start + _DAY).isoformat(), (ctx.start + 2 * _DAY).isoformat()
+
+
+# Query of each case, created per run from the context
+QUERIES: Dict[str, Callable[[Context], "Query"]] = {
+    'Houses': lambda c: _loader().Houses(),
+    'Items': lambda c: _loader().Items(),
+    'AnnotationLabels': lambda c: _loader().AnnotationLabels(),
+    'Annotations': lambda c: _loader().Annotations(c.item_id, c.label_ids),
+    'Measurements': lambda c: _loader().Measurements(c.item_id, c.start.isoformat(), c.stop.isoformat()),
+    'MeasurementsSince': lambda c: _loader().MeasurementsSince(c.item_id),
+    'MeasurementsExpanded': lambda c: _loader().MeasurementsExpanded(c.item_id, *_day(c)),
+    'MeasurementsExpandedClient': lambda c: _loader().MeasurementsExpandedClient(c.item_id, *_day(c)),
+    'MeasurementsExpandedWithLabels':
+        lambda c: _loader().MeasurementsExpandedWithLabels(c.item_id, c.label_ids, *_day(c)),
+    'MeasurementsExpandedWithLabelsClient':
+        lambda c: _loader().MeasurementsExpandedWithLabelsClient(c.item_id, c.label_ids, *_day(c)),
+    'MeasurementsResampled': lambda c: _loader().MeasurementsResampled(c.item_id, '15min'),
+    'MeasurementsResampledClient': lambda c: _loader().MeasurementsResampledClient(c.item_id, '15min'),
+    'MeasurementsRange': lambda c: _loader().MeasurementsRange(c.item_id),
+    'MeasurementsMissing': lambda c: _loader().MeasurementsMissing(c.item_id),
+    'MeasurementsMissingTotal': lambda c: _loader().MeasurementsMissingTotal(c.item_id),
+    'AnnotationsBatch': lambda c: _loader().AnnotationsBatch(),
+    'MeasurementsRangeBatch': lambda c: _loader().MeasurementsRangeBatch(),
+    'MeasurementsMissingBatch': lambda c: _loader().MeasurementsMissingBatch(),
+    'MeasurementsMissingTotalBatch': lambda c: _loader().MeasurementsMissingTotalBatch(),
+    'MeasurementsDaily': lambda c: _loader().MeasurementsDaily(),
+}
+# Queries with fixed width result columns, supported by binary COPY
+COPY_QUERIES = ('Measurements', 'MeasurementsSince', 'MeasurementsExpanded', 'MeasurementsExpandedClient',
+                'MeasurementsExpandedWithLabels', 'MeasurementsResampled', 'MeasurementsResampledClient')
+
+
+def _loader():
+    import deddiag_loader
+    return deddiag_loader
+
+
+def _query_case(name: str, engine: str, ctx: Context) -> Callable[[], int]:
+    if name == 'MeasurementsDaily' and isinstance(ctx.con, _loader().Connection):
+        _loader().refresh_rollups(ctx.con)
+
+    def run():
+        return len(QUERIES[name](ctx).request(ctx.con, engine=engine))
+    return run
+
+
+def _iter_case(ctx: Context) -> Callable[[], int]:
+    def run():
+        query = QUERIES['Measurements'](ctx)
+        return sum(len(df) for df in query.request_iter(ctx.con, chunk_rows=10000))
+    return run
+
+
+def _cache_case(backend: str, mode: str, ctx: Context) -> Callable[[], int]:
+    from deddiag_loader import QueryCache
+    df = QUERIES['Measurements'](ctx).request(ctx.con)
+    cache = QueryCache(os.path.join(ctx.workdir, 'cache'), backend)
+    cache.save('measurements', df)
+
+    def run():
+        if mode == 'read':
+            return len(cache.read('measurements'))
+        cache.save('measurements', df)
+        return len(df)
+    return run
+
+
+def _series_case(ctx: Context) -> Callable[[], int]:
+    def run():
+        return len(QUERIES['MeasurementsExpandedClient'](ctx).request_series(ctx.con, rle=True))
+    return run
+
+
+def _gaps_case(ctx: Context) -> Callable[[], int]:
+    from deddiag_loader import analyze_gaps
+    chunks = list(QUERIES['Measurements'](ctx).request_iter(ctx.con, chunk_rows=10000))
+
+    def run():
+        return analyze_gaps(chunks).rows
+    return run
+
+
+def _rolled_case(ctx: Context) -> Callable[[], int]:
+    from deddiag_loader.utils import rolled
+    values = QUERIES['MeasurementsExpandedClient'](ctx).request(ctx.con)['value'].to_numpy()
+
+    def run():
+        windows = rolled(values, 3600, 60)
+        return int(windows.mean(axis=1).shape[0])
+    return run
+
+
+def _window_case(ctx: Context) -> Callable[[], int]:
+    from deddiag_loader import WindowDataset
+
+    def run():
+        query = QUERIES['MeasurementsExpandedWithLabelsClient'](ctx)
+        return sum(len(y) for _, y in WindowDataset(ctx.con, query, window=3600, step=60, batch_size=128))
+    return run
+
+
+def _cases() -> Dict[str, Callable[[Context], Callable[[], int]]]:
+    cases = {}
+    for name in QUERIES:
+        for engine in ('psql', 'copy') if name in COPY_QUERIES else ('psql',):
+            cases[f"query/{name}/{engine}"] = partial(_query_case, name, engine)
+    cases['stream/Measurements.request_iter'] = _iter_case
+    for backend in ('pickle', 'parquet', 'arrow'):
+        for mode in ('write', 'read'):
+            cases[f"cache/{backend}/{mode}"] = partial(_cache_case, backend, mode)
+    cases['client/MeasurementSeries'] = _series_case
+    cases['client/GapAnalysis'] = _gaps_case
+    cases['client/rolled'] = _rolled_case
+    cases['client/WindowDataset'] = _window_case
+    return cases
+
+
+CASES = _cases()
+
+# Arguments of the CLI commands, {item_id}, {start} and {stop} are filled from the context
+CLI_CASES = {
+    'cli/stats': ['stats', '--include-annotations', '--include-missing'],
+    'cli/save': ['save', '--item-id={item_id}', '--start-date={start}', '--stop-date={stop}', '{workdir}/item'],
+    'cli/export': ['export', '--jobs=4', '{workdir}/export'],
+    'cli/rollup': ['rollup'],
+}
+
+
+def run_case(name: str, options: dict, repeat: int) -> dict:
+    """Run a case repeat times after a warm-up run, in the calling process"""
+    workdir = tempfile.mkdtemp(prefix='deddiag_case_')
+    try:
+        ctx = _context(options, workdir)
+        run = CASES[name](ctx)
+        rows = run()
+        seconds = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            rows = run()
+            seconds.append(time.perf_counter() - t0)
+        if name.startswith('query/MeasurementsDaily') and not options.get('local') and not options.get('duckdb'):
+            _loader().drop_rollups(ctx.con)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return _record(name, rows, seconds, _max_rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def run_cli_case(name: str, options: dict, repeat: int) -> dict:
+    """Run a CLI command in a subprocess repeat times after a warm-up run"""
+    workdir = tempfile.mkdtemp(prefix='deddiag_case_')
+    env = dict(os.environ, DEDDIAG_DB_HOST=options['host'], DEDDIAG_DB_PORT=str(options['port']),
+               DEDDIAG_DB_NAME=options['db_name'], DEDDIAG_DB_USER=options['user'],
+               DEDDIAG_DB_PW=options['password'])
+    try:
+        ctx = _context(options, workdir)
+        day = _day(ctx)
+        args = [a.format(item_id=ctx.item_id, start=day[0][:10], stop=day[1][:10], workdir=workdir)
+                for a in CLI_CASES[name]]
+        if options.get('local'):
+            args.insert(1, f"--local={options['local']}")
+        elif options.get('duckdb'):
+            args.insert(1, f"--duckdb={options['duckdb']}")
+        seconds, peak = [], 0.
+        for i in range(repeat + 1):
+            shutil.rmtree(os.path.join(workdir, 'export'), ignore_errors=True)
+            t0 = time.perf_counter()
+            rss = _run_process([sys.executable, '-m', 'deddiag_loader', *args], env)
+            if i:
+                seconds.append(time.perf_counter() - t0)
+                peak = max(peak, rss)
+        if name == 'cli/rollup' and not options.get('local') and not options.get('duckdb'):
+            _loader().drop_rollups(ctx.con)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return _record(name, 0, seconds, peak)
+
+
+def _run_process(args: List[str], env: dict) -> float:
+    """Run args to completion, peak RSS of the process in MB"""
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(args, env=env, stdout=subprocess.DEVNULL, stderr=stderr)
+        # wait4 returns the resource usage of this child only, unlike RUSAGE_CHILDREN
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if proc.returncode:
+            stderr.seek(0)
+            raise RuntimeError(f"{' '.join(args)} failed:\n{stderr.read().decode()}")
+    return _max_rss_mb(usage.ru_maxrss)
+
+
+def _max_rss_mb(max_rss: int) -> float:
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return max_rss / 2 ** 20 if sys.platform == 'darwin' else max_rss / 2 ** 10
+
+
+def _record(name: str, rows: int, seconds: List[float], peak_rss_mb: float) -> dict:
+    s = np.asarray(seconds)
+    p50, p90, p99 = np.percentile(s, [50, 90, 99]) * 1000
+    return {
+        'case': name,
+        'rows': int(rows),
+        'repeat': len(s),
+        'mean_ms': float(s.mean() * 1000),
+        'p50_ms': float(p50),
+        'p90_ms': float(p90),
+        'p99_ms': float(p99),
+        'rows_per_s': float(rows / np.median(s)) if rows else None,
+        'peak_rss_mb': float(peak_rss_mb),
+    }
+
+
+def compare(results: List[dict], baseline: List[dict], threshold: float) -> pd.DataFrame:
+    """
+    Median latency and peak RSS relative to the baseline, per backend, size and case
+    Changes smaller than 1 ms or 1 MB are not regressions, as they are within the noise of a single run.
+    """
+    current = pd.DataFrame(results).set_index(['backend', 'size', 'case'])
+    base = pd.DataFrame(baseline).set_index(['backend', 'size', 'case'])
+    df = current[['p50_ms', 'peak_rss_mb']].join(base[['p50_ms', 'peak_rss_mb']], rsuffix='_baseline', how='inner')
+    df['p50_ratio'] = df['p50_ms'] / df['p50_ms_baseline']
+    df['rss_ratio'] = df['peak_rss_mb'] / df['peak_rss_mb_baseline']
+    slower = (df['p50_ratio'] > 1 + threshold) & (df['p50_ms'] - df['p50_ms_baseline'] > 1)
+    larger = (df['rss_ratio'] > 1 + threshold) & (df['peak_rss_mb'] - df['peak_rss_mb_baseline'] > 1)
+    df['regression'] = slower | larger
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default='small', help=f"Comma separated sizes of {list(synthetic.SIZES)}")
+    parser.add_argument("--cases", default='*', help="Comma separated glob patterns of case names")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-load", action='store_true', help="Use the databases loaded by a previous run")
+    parser.add_argument("--temp-cluster", action='store_true', help="Run on a throwaway cluster")
+    parser.add_argument("--pg-bin", default=None, help="Directory of initdb and pg_ctl for --temp-cluster")
+    parser.add_argument("--backend", choices=['postgres', 'local', 'duckdb'], default='postgres')
+    parser.add_argument("--local-dir", default=None,
+                        help="Directory of the local or Parquet files, temporary if not given")
+    parser.add_argument("--output", default=None, help="Write results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="Compare with the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative growth reported as regression")
+    parser.add_argument("--list", action='store_true', help="List the cases and exit")
+    args = parser.parse_args()
+
+    names = [*CASES, *CLI_CASES]
+    patterns = args.cases.split(',')
+    names = [n for n in names if any(fnmatch.fnmatch(n, p) or n.startswith(p) for p in patterns)]
+    if args.backend in ('local', 'duckdb'):
+        # The engine does not apply to local files and there are no rollups to build
+        names = [n for n in names if not n.endswith('/copy') and n != 'cli/rollup']
+    if args.list:
+        print("\n".join(names))
+        return
+
+    results = []
+    with ExitStack() as stack:
+        options = synthetic.db_options()
+        if args.temp_cluster:
+            options = stack.enter_context(synthetic.temp_cluster(args.pg_bin))
+        local_dir = args.local_dir
+        if args.backend in ('local', 'duckdb') and local_dir is None:
+            if args.no_load:
+                parser.error(f"--no-load with --backend {args.backend} requires --local-dir")
+            local_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix='deddiag_bench_'))
+        for size in args.sizes.split(','):
+            options['db_name'] = f"deddiag_bench_{size}"
+            if args.backend in ('local', 'duckdb'):
+                options[args.backend] = os.path.join(local_dir, options['db_name'])
+            if not args.no_load:
+                t0 = time.perf_counter()
+                data = synthetic.generate(*synthetic.SIZES[size], seed=args.seed)
+                if args.backend == 'local':
+                    shutil.rmtree(options['local'], ignore_errors=True)
+                    synthetic.save_files(data, options['local'])
+                else:
+                    con = synthetic.connect(db_name=options['db_name'], create=True,
+                                            **{k: options[k] for k in ('host', 'port', 'user', 'password')})
+                    synthetic.load_postgres(data, con, replace=True)
+                    con.close()
+                    if args.backend == 'duckdb':
+                        shutil.rmtree(options['duckdb'], ignore_errors=True)
+                        _loader().convert_parquet(_connection(options), options['duckdb'])
+                print(f"Loaded {size}: {len(data['items'])} items, {len(data['measurements'])} measurements, "
+                      f"{len(data['annotations'])} annotations in {time.perf_counter() - t0:.1f}s")
+            print(f"{'size':<8}{'case':<56}{'rows':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}"
+                  f"{'rows/s':>12}{'RSS MB':>9}")
+            for name in names:
+                if name in CLI_CASES:
+                    record = run_cli_case(name, options, args.repeat)
+                else:
+                    # A fresh process per case, so ru_maxrss is the peak of this case
+                    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                        record = pool.submit(run_case, name, options, args.repeat).result()
+                record['size'] = size
+                record['backend'] = args.backend
+                results.append(record)
+                rate = f"{record['rows_per_s']:.0f}" if record['rows_per_s'] else '-'
+                print(f"{size:<8}{name:<56}{record['rows']:>10}{record['p50_ms']:>10.1f}{record['p90_ms']:>10.1f}"
+                      f"{record['p99_ms']:>10.1f}{rate:>12}{record['peak_rss_mb']:>9.0f}")
+
+    if args.output is not None:
+        import deddiag_loader
+        meta = {'date': pd.Timestamp.now('UTC').isoformat(), 'python': platform.python_version(),
+                'platform': platform.platform(), 'deddiag_loader': deddiag_loader.__version__,
+                'pandas': pd.__version__, 'repeat': args.repeat, 'seed': args.seed}
+        with open(args.output, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=1)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        df = compare(results, baseline, args.threshold)
+        with pd.option_context('display.width', 200, 'display.max_rows', None):
+            print(df.round(2).to_string())
+        regressions = df[df['regression']]
+        if len(regressions):
+            print(f"{len(regressions)} regressions of more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
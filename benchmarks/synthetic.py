@@ -0,0 +1,328 @@
+"""
+Generate a synthetic DEDDIAG-shaped dataset and load it into PostgreSQL or files
+
+Items follow the load profile of their category: fridges cycle every hour, dishwashers and washing machines run
+once or twice a day, televisions in the evening. Measurements are change points with sub-second timestamps,
+sampled every few seconds while an appliance is active and every few minutes while idle. Some items have gaps
+of several hours, appliance runs of annotated categories are annotated.
+
+Usage:
+    python benchmarks/synthetic.py --size small --db-name deddiag_bench
+    python benchmarks/synthetic.py --size small --output synthetic_small
+
+The database options are read from the DEDDIAG_DB_* environment variables, as for the CLI.
+The database given by --db-name is created if it does not exist.
+"""
+import argparse
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+START = pd.Timestamp("2017-01-01", tz="UTC")
+_SECOND_US = 1000000
+_DAY_US = 86400 * _SECOND_US
+
+
+class Profile(NamedTuple):
+    standby: float          # W while idle
+    active: float           # Mean W while active
+    runs_per_day: float     # Mean number of runs, runs of 'cycle' profiles are evenly spaced
+    run_minutes: float      # Mean duration of a run
+    label: Optional[str]    # Annotation label of runs, not annotated if None
+    cycle: bool = False
+
+
+PROFILES = {
+    'Fridge': Profile(0.5, 85., 24, 20, None, cycle=True),
+    'Freezer': Profile(0.5, 110., 18, 30, None, cycle=True),
+    'Dishwasher': Profile(0.8, 1900., 1, 120, 'Dishwasher Run'),
+    'Washing Machine': Profile(1.2, 700., 0.8, 100, 'Washing Machine Run'),
+    'Dryer': Profile(0.9, 2300., 0.5, 90, 'Dryer Run'),
+    'Coffee Machine': Profile(1.5, 1200., 4, 3, 'Coffee Machine Brewing'),
+    'Television': Profile(0.4, 110., 1.5, 150, None),
+}
+
+# houses, items per house, days
+SIZES = {
+    'tiny': (1, 2, 1),
+    'small': (2, 3, 3),
+    'medium': (4, 4, 14),
+    'large': (15, 4, 30),
+}
+
+SCHEMA = """
+CREATE TABLE houses (id integer PRIMARY KEY, persons integer);
+CREATE TABLE items (id integer PRIMARY KEY, house integer, name text, category text);
+CREATE TABLE annotation_labels (id integer PRIMARY KEY, name text);
+CREATE TABLE annotations (id serial PRIMARY KEY, item_id integer, label_id integer,
+                          start_date timestamptz, stop_date timestamptz);
+CREATE TABLE measurements (item_id integer, time timestamptz, value real);
+
+CREATE FUNCTION round_timestamp(ts timestamptz) RETURNS timestamptz LANGUAGE sql IMMUTABLE AS $$
+  SELECT date_trunc('second', ts + interval '500 milliseconds')
+$$;
+
+CREATE FUNCTION get_measurements(p_item_id integer, p_start timestamptz, p_stop timestamptz)
+RETURNS TABLE(item_id integer, "time" timestamptz, value real) LANGUAGE sql STABLE AS $$
+  SELECT p_item_id, s.t,
+    (SELECT m.value FROM measurements m WHERE m.item_id = p_item_id AND m.time <= s.t ORDER BY m.time DESC LIMIT 1)
+  FROM generate_series(round_timestamp(p_start), round_timestamp(p_stop), interval '1 second') s(t)
+$$;
+"""
+TABLES = ('measurements_daily', 'measurements', 'annotations', 'annotation_labels', 'items', 'houses')
+FUNCTIONS = ('get_measurements(integer, timestamptz, timestamptz)', 'round_timestamp(timestamptz)')
+
+
+def generate(houses: int, items_per_house: int, days: int, seed: int = 0) -> Dict[str, pd.DataFrame]:
+    """
+    Synthetic dataset
+    :param houses: Number of houses
+    :param items_per_house: Number of items per house
+    :param days: Days of measurements from START
+    :param seed: Random seed
+    :return: DataFrame per table, measurements sorted by item_id and time
+    """
+    rng = np.random.default_rng(seed)
+    categories = list(PROFILES)
+    labels = sorted({p.label for p in PROFILES.values() if p.label is not None})
+    label_ids = {name: i + 1 for i, name in enumerate(labels)}
+
+    items = []
+    for house in range(1, houses + 1):
+        for j in range(items_per_house):
+            category = categories[((house - 1) * items_per_house + j) % len(categories)]
+            name = category if rng.random() < 0.5 else f"{category.split()[0]} {house}{j}"
+            items.append((len(items) + 1, house, name, category))
+
+    measurements, annotations = [], []
+    for item_id, _, _, category in items:
+        times, values, runs = _item_measurements(rng, PROFILES[category], days)
+        measurements.append(pd.DataFrame({'item_id': np.full(len(times), item_id, dtype=np.int32),
+                                          'time': times, 'value': values}))
+        label = PROFILES[category].label
+        if label is not None:
+            annotations += [(item_id, label_ids[label], a, b) for a, b in runs]
+
+    m = pd.concat(measurements, ignore_index=True)
+    m['time'] = pd.Series(m['time'].to_numpy().view('datetime64[us]')).dt.tz_localize('UTC')
+    a = pd.DataFrame(annotations, columns=['item_id', 'label_id', 'start_date', 'stop_date'])
+    for column in ('start_date', 'stop_date'):
+        a[column] = pd.Series(a[column].to_numpy(dtype=np.int64).view('datetime64[us]')).dt.tz_localize('UTC')
+    a.insert(0, 'id', np.arange(1, len(a) + 1))
+    return {
+        'houses': pd.DataFrame({'id': np.arange(1, houses + 1), 'persons': rng.integers(1, 5, houses)}),
+        'items': pd.DataFrame(items, columns=['id', 'house', 'name', 'category']),
+        'annotation_labels': pd.DataFrame({'id': list(label_ids.values()), 'name': list(label_ids)}),
+        'annotations': a,
+        'measurements': m,
+    }
+
+
+def _item_measurements(rng: np.random.Generator, profile: Profile, days: int):
+    """Change point times (microseconds since epoch), float32 values and run intervals of an item"""
+    start, stop = START.value // 1000, START.value // 1000 + days * _DAY_US
+    n_runs = int(round(profile.runs_per_day * days)) if profile.cycle else rng.poisson(profile.runs_per_day * days)
+    if profile.cycle:
+        period = _DAY_US / profile.runs_per_day
+        run_starts = start + (np.arange(n_runs) * period + rng.uniform(0, period / 4, n_runs)).astype(np.int64)
+    else:
+        # Runs during the day, between 6:00 and 23:00
+        day = rng.integers(0, days, n_runs)
+        run_starts = start + day * _DAY_US + rng.integers(6 * 3600, 23 * 3600, n_runs) * _SECOND_US
+    durations = (rng.gamma(4., profile.run_minutes / 4., n_runs) * 60 * _SECOND_US).astype(np.int64)
+    run_starts = np.sort(run_starts)
+    run_stops = np.minimum(run_starts + np.maximum(durations, 30 * _SECOND_US), stop - 1)
+    # Runs do not overlap
+    run_stops[:-1] = np.minimum(run_stops[:-1], run_starts[1:] - _SECOND_US)
+    keep = run_stops > run_starts
+    run_starts, run_stops = run_starts[keep], run_stops[keep]
+
+    # Idle rows every 5 minutes outside of runs
+    idle = np.arange(start, stop, 300 * _SECOND_US)
+    run = np.searchsorted(run_starts, idle, side='right') - 1
+    if len(run_starts):
+        idle = idle[(run < 0) | (idle >= run_stops[np.maximum(run, 0)])]
+    parts_t = [idle]
+    parts_v = [np.round(profile.standby + rng.normal(0., 0.05, len(idle)), 1)]
+    for a, b in zip(run_starts, run_stops):
+        t = np.arange(a, b, int(rng.integers(2, 8)) * _SECOND_US)
+        # Heating phases at full power, the rest at a fraction of it
+        level = np.where(np.sin(np.linspace(0, rng.uniform(3, 12), len(t))) > 0.3, 1., 0.15)
+        parts_t.append(t)
+        parts_v.append(profile.active * level * rng.normal(1., 0.03, len(t)))
+        parts_t.append(np.array([b]))
+        parts_v.append(np.array([profile.standby]))
+    times = np.concatenate(parts_t) + rng.integers(0, _SECOND_US, sum(len(t) for t in parts_t))
+    values = np.concatenate(parts_v).astype(np.float32)
+    order = np.argsort(times, kind='stable')
+    times, values = times[order], values[order]
+
+    # A few gaps of several hours, e.g. a lost connection of the smart plug
+    for _ in range(rng.poisson(days / 7)):
+        a = rng.integers(start, stop)
+        b = a + int(rng.uniform(1.5, 10) * 3600 * _SECOND_US)
+        keep = (times < a) | (times >= b)
+        times, values = times[keep], values[keep]
+    return times, values, list(zip(run_starts, run_stops))
+
+
+def connect(host: str, port: str, db_name: str, user: str, password: str, create: bool = False):
+    """psycopg2 connection to db_name, created first if create is set and it does not exist"""
+    import psycopg2
+    if create:
+        c = psycopg2.connect(host=host, port=port, dbname='postgres', user=user, password=password)
+        c.autocommit = True
+        with c.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (db_name,))
+            if cur.fetchone() is None:
+                cur.execute(f'CREATE DATABASE "{db_name}"')
+        c.close()
+    return psycopg2.connect(host=host, port=port, dbname=db_name, user=user, password=password)
+
+
+def load_postgres(data: Dict[str, pd.DataFrame], con, replace: bool = False):
+    """
+    Create the DEDDIAG tables and functions and copy data into them
+    :param data: Result of generate()
+    :param con: psycopg2 connection
+    :param replace: Drop existing DEDDIAG tables first, raise if they exist otherwise
+    """
+    with con.cursor() as cur:
+        cur.execute("SELECT to_regclass('measurements') IS NOT NULL")
+        if cur.fetchone()[0]:
+            if not replace:
+                raise RuntimeError("The database already contains DEDDIAG tables, pass replace to drop them")
+            for table in TABLES:
+                cur.execute(f"DROP TABLE IF EXISTS {table}")
+            for function in FUNCTIONS:
+                cur.execute(f"DROP FUNCTION IF EXISTS {function}")
+        cur.execute(SCHEMA)
+        for table in ('houses', 'items', 'annotation_labels', 'annotations'):
+            _copy(cur, table, data[table])
+        # Times are copied as microseconds since epoch, which is exact unlike formatted or float seconds
+        m = data['measurements']
+        cur.execute("CREATE TEMPORARY TABLE staging (item_id integer, t bigint, value real)")
+        _copy(cur, 'staging', pd.DataFrame({'item_id': m['item_id'], 't': _epoch_us(m['time']), 'value': m['value']}))
+        cur.execute("INSERT INTO measurements "
+                    "SELECT item_id, 'epoch'::timestamptz + t * interval '1 microsecond', value FROM staging "
+                    "ORDER BY item_id, t")
+        cur.execute("DROP TABLE staging")
+        cur.execute("CREATE INDEX measurements_item_id_time_idx ON measurements (item_id, time)")
+        cur.execute("CREATE INDEX annotations_item_id_idx ON annotations (item_id)")
+        cur.execute("SELECT setval('annotations_id_seq', greatest((SELECT max(id) FROM annotations), 1))")
+    con.commit()
+    con.autocommit = True
+    with con.cursor() as cur:
+        cur.execute("VACUUM ANALYZE")
+    con.autocommit = False
+
+
+def _copy(cur, table: str, df: pd.DataFrame):
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def _epoch_us(time: pd.Series) -> np.ndarray:
+    return time.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy(dtype='datetime64[us]').view(np.int64)
+
+
+def save_files(data: Dict[str, pd.DataFrame], directory: str):
+    """
+    File-based stand-in of the database, queried by deddiag_loader.LocalConnection: one CSV file per small table
+    and measurements as measurements/<item_id>/time.npy (int64 microseconds since epoch, sorted) and value.npy
+    (float32)
+    :param data: Result of generate()
+    :param directory: Output directory, created if it does not exist
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for table in ('houses', 'items', 'annotation_labels', 'annotations'):
+        data[table].to_csv(directory / f"{table}.csv", index=False)
+    m = data['measurements']
+    times = _epoch_us(m['time'])
+    values = m['value'].to_numpy(dtype=np.float32)
+    item_ids = m['item_id'].to_numpy()
+    bounds = np.flatnonzero(np.diff(item_ids)) + 1
+    for a, b in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(m)]])):
+        if a == b:
+            continue
+        item_dir = directory / "measurements" / str(int(item_ids[a]))
+        item_dir.mkdir(parents=True, exist_ok=True)
+        np.save(item_dir / "time.npy", times[a:b])
+        np.save(item_dir / "value.npy", values[a:b])
+
+
+@contextmanager
+def temp_cluster(pg_bin: Optional[str] = None) -> Iterator[dict]:
+    """
+    Throwaway PostgreSQL cluster listening on a unix socket in a temporary directory
+    :param pg_bin: Directory of initdb and pg_ctl, searched on PATH if None
+    :return: Connection options host, port and user
+    """
+    def binary(name: str) -> str:
+        path = os.path.join(pg_bin, name) if pg_bin else shutil.which(name)
+        if path is None or not os.path.exists(path):
+            raise RuntimeError(f"{name} not found, pass the PostgreSQL bin directory")
+        return path
+
+    initdb, pg_ctl = binary('initdb'), binary('pg_ctl')
+    directory = tempfile.mkdtemp(prefix='deddiag_bench_')
+    data = os.path.join(directory, 'data')
+    try:
+        subprocess.run([initdb, '-D', data, '-U', 'postgres', '--auth=trust', '-E', 'UTF8'],
+                       check=True, capture_output=True)
+        subprocess.run([pg_ctl, '-D', data, '-l', os.path.join(directory, 'log'), '-w',
+                        '-o', f"-k {directory} -c listen_addresses='' -c fsync=off", 'start'],
+                       check=True, capture_output=True)
+        try:
+            yield {'host': directory, 'port': '5432', 'user': 'postgres', 'password': ''}
+        finally:
+            subprocess.run([pg_ctl, '-D', data, '-m', 'fast', 'stop'], capture_output=True)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def db_options() -> dict:
+    return {'host': os.environ.get('DEDDIAG_DB_HOST', 'localhost'),
+            'port': os.environ.get('DEDDIAG_DB_PORT', '5432'),
+            'user': os.environ.get('DEDDIAG_DB_USER', 'postgres'),
+            'password': os.environ.get('DEDDIAG_DB_PW', '')}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", choices=list(SIZES), default='small')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db-name", default='deddiag_bench', help="Database to load, created if missing")
+    parser.add_argument("--replace", action='store_true', help="Drop existing DEDDIAG tables of the database")
+    parser.add_argument("--output", default=None, help="Write files to this directory instead of loading")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    data = generate(*SIZES[args.size], seed=args.seed)
+    print(f"Generated {len(data['items'])} items, {len(data['measurements'])} measurements and "
+          f"{len(data['annotations'])} annotations in {time.perf_counter() - t0:.1f}s")
+    t0 = time.perf_counter()
+    if args.output is not None:
+        save_files(data, args.output)
+        print(f"Saved to {args.output} in {time.perf_counter() - t0:.1f}s")
+        return
+    con = connect(db_name=args.db_name, create=True, **db_options())
+    load_postgres(data, con, args.replace)
+    con.close()
+    print(f"Loaded into {args.db_name} in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,40 @@
 from ._loader import \
+    Query, \
     Measurements, \
     Annotations, \
     Houses, \
     Items, \
     Measurements, \
     MeasurementsExpanded, \
+    MeasurementsExpandedClient, \
     MeasurementsExpandedWithLabels, \
+    MeasurementsExpandedWithLabelsClient, \
+    MeasurementsSince, \
+    MeasurementsResampled, \
+    MeasurementsResampledClient, \
     MeasurementsRange, \
     AnnotationLabels, \
     MeasurementsMissing, \
-    MeasurementsMissingTotal
-from ._db import Connection
+    MeasurementsMissingTotal, \
+    AnnotationsBatch, \
+    MeasurementsRangeBatch, \
+    MeasurementsMissingBatch, \
+    MeasurementsMissingTotalBatch, \
+    MeasurementsDaily
+from ._db import Connection, AsyncConnection
+from ._local import LocalConnection, convert_database, convert_dump
+from ._duckdb import DuckDBConnection, convert_parquet
+from ._cache import QueryCache
+from ._memo import memo, QueryMemo
+from ._profile import profiler, QueryProfiler, Span
+from ._segments import SegmentCache
+from ._sync import MeasurementsSync
+from ._rollup import create_rollups, drop_rollups, refresh_rollups
+from ._gaps import GapAnalysis, analyze_gaps
+from ._series import MeasurementSeries
+from ._batch import request_many, request_many_iter
+from ._dataset import WindowDataset
+from ._export import save_memmap, MemmapExport, Partition, partitions, export_partitions
 from . import utils
 
 __version__ = '0.1.7'
@@ -0,0 +1,120 @@
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple, Type, Union
+
+import pandas as pd
+
+from . import _binary
+from ._cache import QueryCache
+from ._db import Connection
+from ._loader import Query
+
+
+class _DecodingConnection:
+    """Connection proxy decoding binary COPY output in a process pool"""
+
+    def __init__(self, con: Connection, executor: Executor):
+        self._con = con
+        self._executor = executor
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+    def from_copy(self, query: str) -> pd.DataFrame:
+        buf, names, type_oids = self._con.copy_binary(query)
+        return self._executor.submit(_binary.decode, bytes(buf), names, type_oids).result()
+
+
+def request_many_iter(con: Connection, queries: Sequence[Query], workers: int = 5, ordered: bool = False,
+                      cache_dir: Optional[Union[Path, str, QueryCache]] = None, engine: str = 'psql',
+                      cache_backend: str = 'pickle', retries: int = 2, timeout: Optional[float] = None,
+                      decode_processes: int = 0) -> Iterator[Tuple[int, pd.DataFrame]]:
+    """
+    Request queries concurrently, yielding results as they complete
+
+    Queries run in a pool of worker threads sharing the connection pool of con.
+    Queries failing with an OperationalError, e.g. a lost connection, are retried with exponential backoff.
+    :param con: Connection
+    :param queries: Queries to request
+    :param workers: Number of worker threads
+    :param ordered: Yield results in the order of queries instead of the order of completion
+    :param cache_dir: Query cache directory or QueryCache, see Query.request
+    :param engine: Fetch engine, see Query.request
+    :param cache_backend: Storage format of the query cache, see Query.request
+    :param retries: Number of retries per query
+    :param timeout: Server side timeout per query in seconds, or interrupt of DuckDB, raises TimeoutError when
+                    exceeded
+    :param decode_processes: Decode binary COPY output in a pool of this many processes, requires engine 'copy'
+    :return: Iterator of (index in queries, result)
+    """
+    if workers < 1:
+        raise ValueError("workers must be >= 1")
+    if retries < 0:
+        raise ValueError("retries must be >= 0")
+    if decode_processes and engine != 'copy':
+        raise ValueError("decode_processes requires engine 'copy'")
+    if isinstance(cache_dir, (str, Path)):
+        cache_dir = QueryCache(cache_dir, cache_backend)
+
+    process_pool = ProcessPoolExecutor(decode_processes) if decode_processes else None
+    request_con = con if process_pool is None else _DecodingConnection(con, process_pool)
+
+    def run(query: Query) -> pd.DataFrame:
+        return _request(request_con, con, query, cache_dir, engine, retries, timeout)
+
+    try:
+        with ThreadPoolExecutor(workers) as pool:
+            futures = [pool.submit(run, query) for query in queries]
+            try:
+                if ordered:
+                    for i, future in enumerate(futures):
+                        yield i, future.result()
+                else:
+                    index = {future: i for i, future in enumerate(futures)}
+                    for future in as_completed(futures):
+                        yield index[future], future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+    finally:
+        if process_pool is not None:
+            process_pool.shutdown()
+
+
+def request_many(con: Connection, queries: Sequence[Query], workers: int = 5, **kwargs) -> List[pd.DataFrame]:
+    """
+    Request queries concurrently
+
+    Examples
+    --------
+    >>> results = request_many(con, [Measurements(item_id, start, stop) for item_id in item_ids], workers=5)
+
+    :param con: Connection
+    :param queries: Queries to request
+    :param workers: Number of worker threads
+    :param kwargs: See request_many_iter
+    :return: Results in the order of queries
+    """
+    return [df for _, df in request_many_iter(con, queries, workers, ordered=True, **kwargs)]
+
+
+def _request(request_con, con: Connection, query: Query, cache: Optional[QueryCache], engine: str,
+             retries: int, timeout: Optional[float]) -> pd.DataFrame:
+    from psycopg2 import OperationalError
+
+    canceled: Tuple[Type[BaseException], ...] = getattr(con, 'canceled_errors', ())
+    for attempt in range(retries + 1):
+        try:
+            with con.statement_timeout(timeout):
+                return query.request(request_con, cache_dir=cache, engine=engine)
+        except canceled as e:
+            raise TimeoutError(f"{type(query).__name__} exceeded timeout of {timeout}s") from e
+        except OperationalError as e:
+            if attempt == retries:
+                raise
+            delay = 0.5 * 2 ** attempt
+            logging.warning(f"{type(query).__name__} failed ({e}), retrying in {delay}s")
+            time.sleep(delay)
+    raise AssertionError("unreachable")
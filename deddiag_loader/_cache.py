@@ -1,35 +1,431 @@
+import json
 import logging
+import os
+import pickle
+import socket
+import time
+from contextlib import contextmanager
 from hashlib import sha256
 from pathlib import Path
-from typing import Union
+from typing import Dict, Iterable, Iterator, List, Optional, Type, Union
+from uuid import uuid4
 
 import pandas as pd
 
+TimeLike = Union[str, pd.Timestamp, None]
+
+
+class CacheBackend:
+    """
+    Storage format of QueryCache entries
+
+    Backends write DataFrame chunks to a single file and read them back, optionally reading only the
+    given columns and rows with start <= time <= stop.
+    """
+    FILE_EXT: str = ''
+
+    def read_iter(self, path: Path, columns: Optional[List[str]] = None,
+                  start: TimeLike = None, stop: TimeLike = None) -> Iterator[pd.DataFrame]:
+        raise NotImplementedError
+
+    def write_iter(self, path: Path, chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        raise NotImplementedError
+
+    def read(self, path: Path, columns: Optional[List[str]] = None,
+             start: TimeLike = None, stop: TimeLike = None) -> pd.DataFrame:
+        chunks = list(self.read_iter(path, columns, start, stop))
+        if len(chunks) == 1:
+            return chunks[0]
+        return pd.concat(chunks, ignore_index=True)
+
+    def write(self, path: Path, df: pd.DataFrame):
+        for _ in self.write_iter(path, [df]):
+            pass
+
+
+class PickleBackend(CacheBackend):
+    """Stream of pickled DataFrames, columns and time are filtered after loading"""
+    FILE_EXT = 'pkl'
+
+    def read_iter(self, path: Path, columns: Optional[List[str]] = None,
+                  start: TimeLike = None, stop: TimeLike = None) -> Iterator[pd.DataFrame]:
+        empty = None
+        yielded = False
+        with path.open('rb') as f:
+            while True:
+                try:
+                    df = pickle.load(f)
+                except EOFError:
+                    break
+                if start is not None:
+                    df = df[df['time'] >= _as_time(start, df['time'])]
+                if stop is not None:
+                    df = df[df['time'] <= _as_time(stop, df['time'])]
+                if columns is not None:
+                    df = df[columns]
+                if len(df):
+                    yielded = True
+                    yield df
+                elif empty is None:
+                    empty = df
+        if not yielded and empty is not None:
+            yield empty
+
+    def write_iter(self, path: Path, chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        with path.open('wb') as f:
+            for chunk in chunks:
+                pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+                yield chunk
+
+
+class _ArrowBackend(CacheBackend):
+    """Common functionality of the pyarrow based backends"""
+    _FORMAT = ''
+    _TO_PANDAS: Dict[str, bool] = {}
+
+    def read_iter(self, path: Path, columns: Optional[List[str]] = None,
+                  start: TimeLike = None, stop: TimeLike = None) -> Iterator[pd.DataFrame]:
+        dataset, expr = self._scan(path, start, stop)
+        empty = True
+        for batch in dataset.to_batches(columns=columns, filter=expr):
+            if batch.num_rows:
+                empty = False
+                yield batch.to_pandas(**self._TO_PANDAS)
+        if empty:
+            yield dataset.schema.empty_table().select(columns or dataset.schema.names).to_pandas(**self._TO_PANDAS)
+
+    def read(self, path: Path, columns: Optional[List[str]] = None,
+             start: TimeLike = None, stop: TimeLike = None) -> pd.DataFrame:
+        dataset, expr = self._scan(path, start, stop)
+        return dataset.to_table(columns=columns, filter=expr).to_pandas(**self._TO_PANDAS)
+
+    def _scan(self, path: Path, start: TimeLike, stop: TimeLike):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        from pyarrow import fs
+
+        dataset = ds.dataset(str(path), format=self._FORMAT, filesystem=fs.LocalFileSystem(use_mmap=True))
+        expr = None
+        if start is not None or stop is not None:
+            time_type = dataset.schema.field('time').type
+            if start is not None:
+                expr = ds.field('time') >= pa.scalar(_as_time(start, tz=time_type.tz), type=time_type)
+            if stop is not None:
+                le = ds.field('time') <= pa.scalar(_as_time(stop, tz=time_type.tz), type=time_type)
+                expr = le if expr is None else expr & le
+        return dataset, expr
+
+    def write_iter(self, path: Path, chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        import pyarrow as pa
+
+        writer = None
+        schema = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+                if writer is None:
+                    schema = table.schema
+                    writer = self._writer(path, schema)
+                writer.write_table(table)
+                yield chunk
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def _writer(self, path: Path, schema):
+        raise NotImplementedError
+
+
+class ParquetBackend(_ArrowBackend):
+    """Compressed Parquet file, every chunk is written as a row group"""
+    FILE_EXT = 'parquet'
+    _FORMAT = 'parquet'
+
+    def __init__(self, compression: str = 'zstd'):
+        self.compression = compression
+
+    def _writer(self, path: Path, schema):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(str(path), schema, compression=self.compression)
+
+
+class ArrowBackend(_ArrowBackend):
+    """
+    Uncompressed Arrow IPC (Feather v2) file
+
+    Files are memory-mapped when read, numeric columns are converted without copying the data.
+    """
+    FILE_EXT = 'arrow'
+    _FORMAT = 'ipc'
+    _TO_PANDAS = {'split_blocks': True}
+
+    def _writer(self, path: Path, schema):
+        import pyarrow as pa
+        return pa.ipc.new_file(str(path), schema)
+
+
+BACKENDS: Dict[str, Type[CacheBackend]] = {
+    'pickle': PickleBackend,
+    'parquet': ParquetBackend,
+    'arrow': ArrowBackend,
+}
+
+
+def _as_time(t: Union[str, pd.Timestamp], like: Optional[pd.Series] = None, tz: Optional[str] = None) -> pd.Timestamp:
+    """Convert t to a Timestamp comparable to the time column like or of time zone tz"""
+    if like is not None:
+        tz = getattr(like.dtype, 'tz', None)
+    t = pd.Timestamp(t)
+    if tz is not None:
+        return t.tz_localize(tz) if t.tzinfo is None else t.tz_convert(tz)
+    return t if t.tzinfo is None else t.tz_convert(None)
+
+
+@contextmanager
+def _lock_file(path: Path, timeout: Optional[float] = None, stale: float = 3600, poll: float = 0.5):
+    """
+    Lock across processes by creating path with O_EXCL, which is safe on NFS
+    :param path: Lock file
+    :param timeout: Seconds to wait for the lock, wait forever if None
+    :param stale: Seconds after which a lock is considered abandoned and broken
+    :param poll: Seconds between attempts to acquire the lock
+    :raises TimeoutError: if the lock could not be acquired within timeout
+    """
+    if not _acquire(path, timeout, stale, poll):
+        raise TimeoutError(f"Could not acquire {path}")
+    try:
+        yield
+    finally:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _acquire(path: Path, timeout: Optional[float], stale: float, poll: float) -> bool:
+    waited = 0.
+    while True:
+        try:
+            fd = os.open(str(path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - path.stat().st_mtime > stale:
+                    logging.warning(f"Breaking stale cache lock {path}")
+                    path.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            if timeout is not None and waited >= timeout:
+                return False
+            time.sleep(poll)
+            waited += poll
+            continue
+        with os.fdopen(fd, 'w') as f:
+            f.write(f"{socket.gethostname()} {os.getpid()}")
+        return True
+
 
 class QueryCache:
 
-    _FILE_EXT = 'pkl'
+    # Seconds between attempts to acquire a locked entry
+    _LOCK_POLL = 0.5
+
+    def __init__(self, cache_dir: Union[Path, str], backend: Union[str, CacheBackend] = 'pickle',
+                 max_bytes: Optional[int] = None, policy: str = 'lru', lock_stale: float = 3600):
+        """
+        Cache of query results, stored as one file per query
 
-    def __init__(self, cache_dir: Union[Path, str]):
+        Every entry has a JSON sidecar holding the query text, size, last access time and hit count.
+        Entries are written to a temporary file and renamed atomically. A lock file per entry, created with
+        O_EXCL which is safe on NFS, prevents several processes from computing the same entry at once.
+        If max_bytes is given, least recently (lru) or least frequently (lfu) used entries are evicted
+        after every write until the cache fits the budget.
+        :param cache_dir: Cache directory
+        :param backend: Storage format, one of BACKENDS ('pickle', 'parquet', 'arrow') or a CacheBackend instance.
+                        'parquet' and 'arrow' require pyarrow.
+        :param max_bytes: Maximum size of all entries in cache_dir, unbounded if None
+        :param policy: Eviction policy, 'lru' or 'lfu'
+        :param lock_stale: Seconds after which a lock is considered abandoned and broken
+        """
         self.cache_dir = Path(cache_dir)
         if self.cache_dir.exists() and self.cache_dir.is_file():
             raise NotADirectoryError(self.cache_dir)
+        if isinstance(backend, str):
+            if backend not in BACKENDS:
+                raise ValueError(f"Unknown cache backend {backend}, expected one of {list(BACKENDS)}")
+            backend = BACKENDS[backend]()
+        if policy not in ('lru', 'lfu'):
+            raise ValueError(f"Unknown eviction policy {policy}, expected 'lru' or 'lfu'")
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.lock_stale = lock_stale
 
     def _hash(self, s: str):
         return sha256(s.encode()).hexdigest()
 
     def file_path(self, s: str):
-        return self.cache_dir / f"{self._hash(s)}.{self._FILE_EXT}"
+        return self.cache_dir / f"{self._hash(s)}.{self.backend.FILE_EXT}"
 
-    def read(self, query: str):
+    def _meta_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _lock_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.lock"
+
+    def read(self, query: str, columns: Optional[List[str]] = None,
+             start: TimeLike = None, stop: TimeLike = None) -> pd.DataFrame:
+        """
+        Read cached query
+        :param query: SQL query
+        :param columns: Only read given columns
+        :param start: Only read rows with time >= start
+        :param stop: Only read rows with time <= stop
+        :raises FileNotFoundError: if query is not cached
+        """
+        path = self._existing_path(query)
+        return self.backend.read(path, columns, start, stop)
+
+    def read_iter(self, query: str, columns: Optional[List[str]] = None,
+                  start: TimeLike = None, stop: TimeLike = None) -> Iterator[pd.DataFrame]:
+        """
+        Read cached query chunk by chunk
+        :param query: SQL query
+        :param columns: Only read given columns
+        :param start: Only read rows with time >= start
+        :param stop: Only read rows with time <= stop
+        :raises FileNotFoundError: if query is not cached
+        """
+        path = self._existing_path(query)
+        return self.backend.read_iter(path, columns, start, stop)
+
+    def _existing_path(self, query: str) -> Path:
         path = self.file_path(query)
         if not path.exists():
             raise FileNotFoundError
-        logging.info(f"Reading query from cache: {self.file_path(query)}")
-        return pd.read_pickle(self.file_path(query))
+        logging.info(f"Reading query from cache: {path}")
+        self._touch(path.stem, query)
+        return path
 
     def save(self, query: str, df: pd.DataFrame):
+        for _ in self.save_iter(query, [df]):
+            pass
+
+    def save_iter(self, query: str, chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """
+        Cache chunks as they pass through
+        Chunks are written to a temporary file which only replaces the cache entry once all chunks
+        have been consumed, so an interrupted stream never leaves a partial entry behind.
+        :param query: SQL query
+        :param chunks: DataFrame chunks, e.g. from Connection.iter_psql
+        """
         path = self.file_path(query)
         path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{uuid4().hex}.tmp")
         logging.info(f"Caching {query} to {path}")
-        df.to_pickle(self.file_path(query))
+        try:
+            yield from self.backend.write_iter(tmp_path, chunks)
+        except BaseException:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
+        if not tmp_path.exists():
+            return
+        tmp_path.replace(path)
+        now = time.time()
+        self._write_meta(path.stem, {'query': query, 'size': path.stat().st_size,
+                                     'created': now, 'last_access': now, 'hits': 0})
+        if self.max_bytes is not None:
+            self.evict(keep=path.stem)
+
+    @contextmanager
+    def lock(self, query: str, timeout: Optional[float] = None):
+        """
+        Lock cache entry of query across processes, e.g. while computing it
+        :param query: SQL query
+        :param timeout: Seconds to wait for the lock, wait forever if None
+        :raises TimeoutError: if the lock could not be acquired within timeout
+        """
+        self.cache_dir.mkdir(exist_ok=True)
+        with _lock_file(self._lock_path(self._hash(query)), timeout, self.lock_stale, self._LOCK_POLL):
+            yield
+
+    def entries(self) -> pd.DataFrame:
+        """
+        Metadata of all entries in the cache directory
+
+        Entries without metadata, e.g. written by an older version, use the file modification time.
+        :return: DataFrame with columns key, file, query, size, created, last_access, hits
+        """
+        exts = {backend.FILE_EXT for backend in BACKENDS.values()} | {self.backend.FILE_EXT}
+        rows = []
+        if self.cache_dir.exists():
+            for path in self.cache_dir.iterdir():
+                key, _, ext = path.name.partition('.')
+                if ext not in exts or len(key) != 64:
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                meta = self._read_meta(key) or {'query': None, 'created': stat.st_mtime,
+                                                'last_access': stat.st_mtime, 'hits': 0}
+                meta.update({'key': key, 'file': path.name, 'size': stat.st_size})
+                rows.append(meta)
+        return pd.DataFrame(rows, columns=['key', 'file', 'query', 'size', 'created', 'last_access', 'hits'])
+
+    def evict(self, keep: Optional[str] = None):
+        """
+        Delete entries according to the eviction policy until all entries fit into max_bytes
+        Entries currently locked by another process are skipped.
+        :param keep: Key of an entry which is never evicted, e.g. the one just written
+        """
+        if self.max_bytes is None:
+            return
+        entries = self.entries()
+        total = entries['size'].sum()
+        if total <= self.max_bytes:
+            return
+        order = ['last_access'] if self.policy == 'lru' else ['hits', 'last_access']
+        for entry in entries.sort_values(order).itertuples():
+            if total <= self.max_bytes:
+                break
+            if entry.key == keep:
+                continue
+            lock_path = self._lock_path(entry.key)
+            if not _acquire(lock_path, 0, self.lock_stale, self._LOCK_POLL):
+                continue
+            try:
+                logging.info(f"Evicting {entry.file} from cache")
+                for path in (self.cache_dir / entry.file, self._meta_path(entry.key)):
+                    try:
+                        path.unlink()
+                    except FileNotFoundError:
+                        pass
+                total -= entry.size
+            finally:
+                lock_path.unlink()
+
+    def _touch(self, key: str, query: str):
+        """Update last access time and hit count of entry"""
+        meta = self._read_meta(key) or {'query': query, 'created': time.time(), 'hits': 0}
+        meta['last_access'] = time.time()
+        meta['hits'] = meta.get('hits', 0) + 1
+        try:
+            self._write_meta(key, meta)
+        except OSError as e:
+            logging.warning(f"Could not update cache metadata of {key}: {e}")
+
+    def _read_meta(self, key: str) -> Optional[dict]:
+        try:
+            with self._meta_path(key).open() as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_meta(self, key: str, meta: dict):
+        path = self._meta_path(key)
+        tmp_path = path.with_name(f"{path.name}.{uuid4().hex}.tmp")
+        with tmp_path.open('w') as f:
+            json.dump(meta, f)
+        tmp_path.replace(path)
@@ -1,4 +1,6 @@
 import logging
+import sys
+import time
 from pathlib import Path
 
 import click
@@ -6,8 +8,39 @@ import os
 
 
 @click.group()
-def cli():
-    pass
+@click.option("--profile", is_flag=True, help="Print time spent per query class and step to stderr on exit")
+@click.pass_context
+def cli(ctx, profile):
+    if profile:
+        from ._profile import profiler
+        profiler.enable()
+        ctx.call_on_close(lambda: click.echo(profiler.stats().to_string(index=False), err=True))
+
+
+class _Progress:
+    """Progress line with ETA on stderr, only shown on a terminal"""
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._enabled = sys.stderr.isatty()
+
+    def __call__(self, done: int, total: int, query):
+        if not self._enabled:
+            return
+        elapsed = time.perf_counter() - self._start
+        eta = elapsed / done * (total - done)
+        click.echo(f"\r{done}/{total} queries, {elapsed:.0f}s elapsed, ETA {eta:.0f}s ({type(query).__name__})"
+                   .ljust(79), nl=done == total, err=True)
+
+
+def _connect(host, port, db, user, password, local=None, duckdb=None, **kwargs):
+    """LocalConnection or DuckDBConnection of the copy if given, otherwise Connection to the database"""
+    from . import Connection, DuckDBConnection, LocalConnection
+    if local is not None:
+        return LocalConnection(local)
+    if duckdb is not None:
+        return DuckDBConnection(duckdb)
+    return Connection(host, port, db, user, password, **kwargs)
 
 
 @cli.command()
@@ -16,19 +49,125 @@ def cli():
 @click.option("--port", required=True, default=lambda: os.environ.get('DEDDIAG_DB_PORT', '5432'))
 @click.option("--user", required=True, default=lambda: os.environ.get('DEDDIAG_DB_USER', 'postgres'))
 @click.option("--password", hide_input=True, default=lambda: os.environ.get('DEDDIAG_DB_PW'), show_default='')
-@click.option("--item-id", required=True)
-@click.option("--label-id", default=None)
+@click.option("--item-id", required=True, type=int)
+@click.option("--label-id", default=None, type=int, multiple=True)
 @click.option("--start-date", type=click.DateTime(), default=None)
 @click.option("--stop-date", type=click.DateTime(), default=None)
+@click.option("--label-mode", type=click.Choice(["mask", "multi_hot", "label_id"]), default="mask",
+              help="Label columns, see MeasurementsExpandedWithLabelsClient")
+@click.option("--chunk-rows", type=int, default=86400, help="Rows requested and written at once")
+@click.option("--local", type=click.Path(exists=True, file_okay=False), default=None,
+              help="Query a local copy written by the convert command instead of the database")
+@click.option("--duckdb", type=click.Path(exists=True, file_okay=False), default=None,
+              help="Run the queries with DuckDB on a Parquet copy written by convert --parquet")
 @click.argument("file_name", required=True)
-def save(host, db, user, port, password, item_id, label_id, start_date, stop_date, file_name):
-    """Export data to numpy array"""
-    from . import Connection, MeasurementsExpandedWithLabels
-    import numpy as np
+def save(host, db, user, port, password, item_id, label_id, start_date, stop_date, label_mode, chunk_rows, local,
+         duckdb, file_name):
+    """Export data to memory mapped numpy arrays, one .npy file per column and index.json"""
+    from . import MeasurementsExpandedWithLabelsClient, MeasurementsRange
+    from ._export import save_memmap
+
+    con = _connect(host, port, db, user, password, local, duckdb)
+    if start_date is None or stop_date is None:
+        m_range = MeasurementsRange(item_id).request(con).iloc[0]
+        start_date = m_range.min_date if start_date is None else start_date
+        stop_date = m_range.max_date if stop_date is None else stop_date
+    query = MeasurementsExpandedWithLabelsClient(item_id, list(label_id) or None, start_date, stop_date, label_mode)
+    directory = "{}_measurement_with_labels".format(file_name)
+    index = save_memmap(con, query, directory, chunk_rows)
+    logging.info(f"Saved {index['rows']} rows of item {item_id} to {directory}")
+
+
+@cli.command()
+@click.option("--host", required=True, default=lambda: os.environ.get('DEDDIAG_DB_HOST', 'localhost'))
+@click.option("--db", required=True, default=lambda: os.environ.get('DEDDIAG_DB_NAME', 'postgres'))
+@click.option("--port", required=True, default=lambda: os.environ.get('DEDDIAG_DB_PORT', '5432'))
+@click.option("--user", required=True, default=lambda: os.environ.get('DEDDIAG_DB_USER', 'postgres'))
+@click.option("--password", hide_input=True, default=lambda: os.environ.get('DEDDIAG_DB_PW'), show_default='')
+@click.option("--item-id", type=int, multiple=True, help="Only export these items")
+@click.option("--house-id", type=int, multiple=True, help="Only export items of these houses")
+@click.option("--category", multiple=True, help="Only export items of these categories")
+@click.option("--label-id", type=int, multiple=True, help="Label ids, all labels if not given")
+@click.option("--start-date", type=click.DateTime(), default=None)
+@click.option("--stop-date", type=click.DateTime(), default=None)
+@click.option("--label-mode", type=click.Choice(["mask", "multi_hot", "label_id"]), default="mask",
+              help="Label columns, see MeasurementsExpandedWithLabelsClient")
+@click.option("--jobs", type=int, default=4, help="Number of partitions exported in parallel")
+@click.option("--chunk-rows", type=int, default=86400, help="Rows requested and written at once")
+@click.option("--local", type=click.Path(exists=True, file_okay=False), default=None,
+              help="Query a local copy written by the convert command instead of the database")
+@click.option("--duckdb", type=click.Path(exists=True, file_okay=False), default=None,
+              help="Run the queries with DuckDB on a Parquet copy written by convert --parquet")
+@click.argument("directory", required=True)
+def export(host, db, user, port, password, item_id, house_id, category, label_id, start_date, stop_date, label_mode,
+           jobs, chunk_rows, local, duckdb, directory):
+    """Export items to DIRECTORY/house=<id>/item=<id>/<month>, resuming a previous export"""
+    from ._export import export_partitions, partitions
+
+    con = _connect(host, port, db, user, password, local, duckdb, pool_size=jobs)
+    parts = partitions(con, list(item_id), list(house_id), list(category), start_date, stop_date)
+    click.echo(f"Exporting {len(parts)} partitions of {len({p.item_id for p in parts})} items")
+    rows = 0
+    for stats in export_partitions(con, directory, parts, list(label_id) or None, label_mode, jobs, chunk_rows):
+        rows += stats['rows']
+        click.echo("{path}: {rows} rows in {seconds:.1f}s, {rate:.0f} rows/s, {mb:.1f} MB/s".format(
+            rate=stats['rows'] / stats['seconds'], mb=stats['bytes'] / stats['seconds'] / 1e6, **stats))
+    click.echo(f"Exported {rows} rows to {directory}")
+
+
+@cli.command()
+@click.option("--host", required=True, default=lambda: os.environ.get('DEDDIAG_DB_HOST', 'localhost'))
+@click.option("--db", required=True, default=lambda: os.environ.get('DEDDIAG_DB_NAME', 'postgres'))
+@click.option("--port", required=True, default=lambda: os.environ.get('DEDDIAG_DB_PORT', '5432'))
+@click.option("--user", required=True, default=lambda: os.environ.get('DEDDIAG_DB_USER', 'postgres'))
+@click.option("--password", hide_input=True, default=lambda: os.environ.get('DEDDIAG_DB_PW'), show_default='')
+@click.option("--item-id", type=int, multiple=True, help="Only refresh these items")
+@click.option("--since", type=click.DateTime(), default=None,
+              help="Recompute days from this day, default continues from the last summarized day")
+@click.option("--drop", is_flag=True, help="Drop the rollups instead")
+def rollup(host, db, user, port, password, item_id, since, drop):
+    """Build or refresh daily summaries used by range and missing data queries"""
+    from . import Connection
+    from ._rollup import drop_rollups, refresh_rollups
 
     con = Connection(host, port, db, user, password)
-    measurements = MeasurementsExpandedWithLabels(item_id, label_id, start_date, stop_date).request(con)
-    np.save("{}_measurement_with_labels.npy".format(file_name), np.array(measurements))
+    if drop:
+        drop_rollups(con)
+        click.echo("Dropped rollups")
+        return
+    days = refresh_rollups(con, list(item_id) or None, since)
+    click.echo(f"Refreshed {days} daily summaries")
+
+
+@cli.command()
+@click.option("--host", required=True, default=lambda: os.environ.get('DEDDIAG_DB_HOST', 'localhost'))
+@click.option("--db", required=True, default=lambda: os.environ.get('DEDDIAG_DB_NAME', 'postgres'))
+@click.option("--port", required=True, default=lambda: os.environ.get('DEDDIAG_DB_PORT', '5432'))
+@click.option("--user", required=True, default=lambda: os.environ.get('DEDDIAG_DB_USER', 'postgres'))
+@click.option("--password", hide_input=True, default=lambda: os.environ.get('DEDDIAG_DB_PW'), show_default='')
+@click.option("--dump", type=click.Path(exists=True, file_okay=False), default=None,
+              help="Convert the extracted TSV files of the published dataset instead of the database")
+@click.option("--item-id", type=int, multiple=True, help="Only convert measurements of these items")
+@click.option("--parquet", is_flag=True, help="Write Parquet files queried with --duckdb instead")
+@click.argument("directory", required=True)
+def convert(host, db, user, port, password, dump, item_id, parquet, directory):
+    """Convert the dataset to a local copy in DIRECTORY, queried with --local or --duckdb without a database"""
+    import tempfile
+    from ._duckdb import convert_parquet
+    from ._local import LocalConnection, convert_database, convert_dump
+
+    if parquet and dump is not None:
+        # The dump is read into a temporary local copy first
+        with tempfile.TemporaryDirectory(prefix='deddiag_convert_') as tmp:
+            convert_dump(dump, tmp)
+            rows = convert_parquet(LocalConnection(tmp), directory, list(item_id) or None)
+    elif parquet:
+        rows = convert_parquet(_connect(host, port, db, user, password), directory, list(item_id) or None)
+    elif dump is not None:
+        rows = convert_dump(dump, directory)
+    else:
+        rows = convert_database(_connect(host, port, db, user, password), directory, list(item_id) or None)
+    click.echo(f"Converted {sum(rows.values())} measurements of {len(rows)} items to {directory}")
 
 
 @cli.command()
@@ -43,54 +182,30 @@ def save(host, db, user, port, password, item_id, label_id, start_date, stop_dat
 @click.option("--include-missing", is_flag=True,
               help="Include missing data column. WARNING: Query may take some time")
 @click.option("--query-cache", type=str, help="Query cache where required queries are cached to speed up")
-def stats(host, db, user, port, password, print_format, include_annotations, include_missing, query_cache):
+@click.option("--cache-backend", type=click.Choice(["pickle", "parquet", "arrow"]), default="pickle",
+              help="Storage format of the query cache, parquet and arrow require pyarrow")
+@click.option("--query-cache-max-bytes", type=int, default=None,
+              help="Maximum size of the query cache, least recently used queries are evicted")
+@click.option("--jobs", type=int, default=5, help="Number of queries run concurrently")
+@click.option("--local", type=click.Path(exists=True, file_okay=False), default=None,
+              help="Query a local copy written by the convert command instead of the database")
+@click.option("--duckdb", type=click.Path(exists=True, file_okay=False), default=None,
+              help="Run the queries with DuckDB on a Parquet copy written by convert --parquet")
+def stats(host, db, user, port, password, print_format, include_annotations, include_missing, query_cache,
+          cache_backend, query_cache_max_bytes, jobs, local, duckdb):
     """Print dataset stats"""
-    from . import Connection, Houses, Items, MeasurementsRange, Annotations, MeasurementsMissingTotal
+    from ._cache import QueryCache
+    from ._rollup import rollups_available
+    from ._stats import dataset_stats
     from ._formatter import StringFormatter, LatexFormatter
-    import pandas as pd
-    con = Connection(host, port, db, user, password)
-    items = Items().request(con, cache_dir=query_cache)
-    columns = ["House", "Item", "Category", "Type", "First date", "Last date", "Duration"]
-    if include_annotations:
-        columns += ["Annotations"]
-    if include_missing:
-        logging.warning("Including missing measurements stats, this will take some time!")
-        columns += ["Missing > 1h5sec", "Missing > 1day"]
-
-    data = []
-    total_missing = []
-    for _, house in Houses().request(con, cache_dir=query_cache).iterrows():
-        house_id = f"House {house.id:2}"
-        for _, item in items.loc[items.house == house.id].sort_values('id').iterrows():
-            m_range = MeasurementsRange(item['id']).request(con, cache_dir=query_cache)
-
-            category = item['category']
-            name_type = item['name'] if item['name'].lower() != item['category'].lower() else ""
-            line = [
-                house_id,
-                item['id'],
-                category,
-                name_type,
-                str(m_range.min_date.item()),
-                str(m_range.max_date.item()),
-                f"{(m_range.max_date.item() - m_range.min_date.item()).days} days"
-            ]
-            if include_annotations:
-                annotations = Annotations(item_id=item['id']).request(con, cache_dir=query_cache)
-                line += [str(len(annotations))]
-            if include_missing:
-                missing = MeasurementsMissingTotal(item_id=item['id']).request(con, cache_dir=query_cache)
-                line += [
-                    "{:.2f}%".format(missing.perc_missing_hour.item() * 100),
-                    "{:.2f}%".format(missing.perc_missing_day.item() * 100)
-                ]
-                total_missing.append((m_range.max_date.item() - m_range.min_date.item(), missing.perc_missing_hour.item(), missing.perc_missing_day.item()))
-
-            data.append(line)
-
-    total_missing_values = sum(v[0].total_seconds()*v[1] for v in total_missing) / sum(v[0].total_seconds() for v in total_missing), sum(v[0].total_seconds()*v[2] for v in total_missing) / sum(v[0].total_seconds() for v in total_missing)
-    df = pd.DataFrame(data, columns=columns).set_index(["House", "Item"])
-    df.to_latex()
+    con = _connect(host, port, db, user, password, local, duckdb, pool_size=jobs)
+    cache_dir = None
+    if query_cache is not None:
+        cache_dir = QueryCache(query_cache, cache_backend, max_bytes=query_cache_max_bytes)
+    if include_missing and local is None and duckdb is None and not rollups_available(con):
+        logging.warning("Including missing measurements stats, this will take some time! "
+                        "Run rollup first to speed up.")
+    df = dataset_stats(con, include_annotations, include_missing, jobs, cache_dir, _Progress())
     formatter = None
     formatter_kwargs = {}
     if print_format == "str":
@@ -0,0 +1,108 @@
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+from ._cache import QueryCache
+from ._loader import Query
+from .utils import rolled
+
+if TYPE_CHECKING:
+    from ._db import Connection
+
+LABEL_REDUCTIONS = ('any', 'majority', 'center')
+
+
+class WindowDataset:
+    """
+    Fixed size windows of measurements and labels, streamed with bounded memory
+
+    Rows of query are requested in chunks, so memory is bounded by chunk_rows independent of the time range.
+    Windows are strided views (see utils.rolled) into a buffer holding the current chunk and the tail of the
+    previous one, so windows spanning chunk boundaries are emitted as well and no window is copied.
+
+    Examples
+    --------
+    >>> query = MeasurementsExpandedWithLabelsClient(10, 1, "2017-01-01", "2018-01-01")
+    >>> dataset = WindowDataset(con, query, window=3600, step=60, batch_size=128)
+    >>> for epoch in range(10):
+    >>>     for x, y in dataset:  # x: (128, 3600) float32, y: (128,) bool
+    >>>         model.train_on_batch(x, y)
+    """
+
+    def __init__(self, con: "Connection", query: Query, window: int, step: int = 1,
+                 label_reduction: str = 'any', normalize: Union[None, str, Tuple[float, float]] = None,
+                 batch_size: int = 256, chunk_rows: int = 100000,
+                 cache_dir: Optional[Union[Path, str, QueryCache]] = None):
+        """
+        :param con: Connection
+        :param query: Query with value and labels columns, e.g. MeasurementsExpandedWithLabelsClient
+        :param window: Window size in rows
+        :param step: Rows between the starts of consecutive windows
+        :param label_reduction: Label of a window: 'any' labeled row, 'majority' of rows labeled or label of the
+                                'center' row
+        :param normalize: None, (mean, std) applied to all values, keeping windows views,
+                          or 'window' to standardize each window separately, which copies the batch
+        :param batch_size: Maximum number of windows per batch
+        :param chunk_rows: Rows requested per chunk
+        :param cache_dir: Query cache directory or QueryCache, see Query.request_iter
+        """
+        if window < 1 or step < 1 or batch_size < 1:
+            raise ValueError("window, step and batch_size must be >= 1")
+        if label_reduction not in LABEL_REDUCTIONS:
+            raise ValueError(f"Unknown label reduction {label_reduction}, expected one of {LABEL_REDUCTIONS}")
+        if isinstance(normalize, str) and normalize != 'window':
+            raise ValueError(f"Unknown normalization {normalize}, expected 'window' or (mean, std)")
+        self.con = con
+        self.query = query
+        self.window = window
+        self.step = step
+        self.label_reduction = label_reduction
+        self.normalize = normalize
+        self.batch_size = batch_size
+        self.chunk_rows = chunk_rows
+        self.cache_dir = cache_dir
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Batches of windows (batch, window) and their labels (batch,)"""
+        values = np.empty(0, dtype=np.float32)
+        labels = np.empty(0, dtype=bool)
+        # Rows of following chunks before the start of the next window, if step is larger than the buffer
+        skip = 0
+        for df in self.query.request_iter(self.con, self.chunk_rows, self.cache_dir):
+            chunk = df['value'].to_numpy(dtype=np.float32)
+            if isinstance(self.normalize, tuple):
+                mean, std = self.normalize
+                chunk = (chunk - mean) / std
+            values = np.concatenate([values, chunk])
+            labels = np.concatenate([labels, df['labels'].to_numpy(dtype=bool)])
+            if skip:
+                dropped = min(skip, len(values))
+                values, labels = values[dropped:], labels[dropped:]
+                skip -= dropped
+            if len(values) < self.window:
+                continue
+            yield from self._batches(values, labels)
+            # Keep rows from the start of the first window not emitted yet
+            first = ((len(values) - self.window) // self.step + 1) * self.step
+            skip = max(first - len(values), 0)
+            values, labels = values[first:], labels[first:]
+
+    def _batches(self, values: np.ndarray, labels: np.ndarray) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        x = rolled(values, self.window, self.step)
+        y = self._reduce(labels)
+        for i in range(0, len(x), self.batch_size):
+            batch = x[i:i + self.batch_size]
+            if self.normalize == 'window':
+                std = batch.std(axis=1, keepdims=True)
+                batch = (batch - batch.mean(axis=1, keepdims=True)) / np.where(std > 0, std, 1)
+            yield batch, y[i:i + self.batch_size]
+
+    def _reduce(self, labels: np.ndarray) -> np.ndarray:
+        if self.label_reduction == 'center':
+            count = (len(labels) - self.window) // self.step + 1
+            return labels[self.window // 2::self.step][:count]
+        windows = rolled(labels, self.window, self.step)
+        if self.label_reduction == 'any':
+            return windows.any(axis=1)
+        return np.count_nonzero(windows, axis=1) * 2 > self.window
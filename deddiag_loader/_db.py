@@ -1,9 +1,20 @@
+import threading
+import time
 from contextlib import contextmanager
-from typing import Union
+from io import BytesIO
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type, Union
+from uuid import uuid4
 
 import pandas as pd
 import sqlalchemy.pool as pool
 
+from . import _binary
+from ._profile import profiler
+from ._sql import positional
+
+# Prepared statements kept per pooled connection, all are deallocated when exceeded
+MAX_PREPARED = 256
+
 
 class Connection(object):
     """Connection Manager"""
@@ -11,7 +22,9 @@ class Connection(object):
                  port: Union[int, str] = 5432,
                  db_name: str = "postgres",
                  user: str = "postgres",
-                 password: str = ""):
+                 password: str = "",
+                 use_rollups: bool = True,
+                 pool_size: int = 5):
         """
         Database connection object
 
@@ -28,13 +41,25 @@ class Connection(object):
         :param db_name: Database Name
         :param user: Username
         :param password: Password
+        :param use_rollups: Answer range and missing data queries from the daily rollups if they exist,
+                            see refresh_rollups
+        :param pool_size: Number of pooled connections, up to 10 more are opened while all are in use
         """
         self._password = password
         self._host = host
         self._port = port
         self._user = user
         self._db_name = db_name
-        self.__connection_pool = pool.QueuePool(self._get_conn, pool_size=5)
+        self.__connection_pool = pool.QueuePool(self._get_conn, pool_size=pool_size)
+        self._local = threading.local()
+        self.use_rollups = use_rollups
+        # Whether the rollup table exists, None until checked
+        self._rollups: Optional[bool] = None
+
+    @property
+    def dsn(self) -> str:
+        """Identifies the database, without password"""
+        return f"{self._user}@{self._host}:{self._port}/{self._db_name}"
 
     def _get_conn(self):
         import psycopg2
@@ -47,12 +72,289 @@ class Connection(object):
 
     def from_psql(self, query: str):
         with self.connection() as con:
-            return pd.read_sql_query(query, con)
+            return _read_sql(query, con)
+
+    def from_prepared(self, template: str, params: Dict[str, Any]) -> pd.DataFrame:
+        """
+        Fetch result of a query template with bind parameters
+
+        The template is prepared once per pooled connection and executed with params, so repeated queries
+        of the same template are parsed and planned only once per connection. Values are escaped by psycopg2.
+        :param template: SQL with named placeholders, e.g. "SELECT * FROM items WHERE id = %(item_id)s"
+        :param params: Value of each placeholder
+        """
+        with self.connection() as con:
+            name, names = self._prepare(con, template)
+            execute = f"EXECUTE {name}({', '.join(['%s'] * len(names))})" if names else f"EXECUTE {name}"
+            return _read_sql(execute, con, [params[n] for n in names] or None)
+
+    @staticmethod
+    def _prepare(con, template: str) -> Tuple[str, Tuple[str, ...]]:
+        """Name and parameter names of the statement prepared for template on the pooled connection con"""
+        # info lives as long as the DBAPI connection, as do its prepared statements
+        statements = con.info.setdefault('deddiag_prepared', {})
+        if template in statements:
+            return statements[template]
+        sql, names = positional(template.strip().rstrip(';'))
+        with con.cursor() as cur:
+            if len(statements) >= MAX_PREPARED:
+                cur.execute("DEALLOCATE ALL")
+                statements.clear()
+            name = f"deddiag_{uuid4().hex}"
+            # Prepared statements are not transactional, they outlive the rollback on return to the pool
+            with profiler.span('prepare'):
+                cur.execute(f"PREPARE {name} AS {sql}")
+        statements[template] = (name, names)
+        return name, names
+
+    def from_copy(self, query: str) -> pd.DataFrame:
+        """
+        Fetch query result using binary COPY
+
+        COPY (query) TO STDOUT WITH (FORMAT binary) is decoded directly into numpy arrays, avoiding the
+        Python object per value created by from_psql. Only fixed width column types (bool, integer, float,
+        timestamp) are supported, as returned by the measurement queries.
+        :param query: SQL query
+        """
+        buf, names, type_oids = self.copy_binary(query)
+        with profiler.span('decode') as span:
+            df = _binary.decode(buf, names, type_oids)
+            span.rows = len(df)
+            span.bytes = len(buf)
+        return df
+
+    def copy_binary(self, query: str) -> Tuple[memoryview, List[str], List[int]]:
+        """
+        Raw binary COPY output of query, to be decoded by from_copy
+        :param query: SQL query
+        :return: Binary COPY output, column names, column type oids
+        """
+        query = query.strip().rstrip(';')
+        with self.connection() as con:
+            with con.cursor() as cur:
+                with profiler.span('execute'):
+                    cur.execute(f"SELECT * FROM ({query}) q LIMIT 0")
+                names = [c[0] for c in cur.description]
+                type_oids = [c[1] for c in cur.description]
+                if not _binary.supported(type_oids):
+                    raise TypeError(f"Query result is not supported by binary COPY, column types: {type_oids}")
+                buf = BytesIO()
+                with profiler.span('fetch') as span:
+                    cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", buf)
+                    span.bytes = buf.tell()
+        return buf.getbuffer(), names, type_oids
+
+    def iter_psql(self, query: str, chunk_rows: int = 100000) -> Iterator[pd.DataFrame]:
+        """
+        Stream query result in chunks using a server-side (named) cursor
+
+        Only chunk_rows rows are held on the client at a time, independent of the total result size.
+        A single empty DataFrame is yielded if the query returns no rows.
+        :param query: SQL query
+        :param chunk_rows: Maximum number of rows per yielded DataFrame
+        """
+        if chunk_rows < 1:
+            raise ValueError("chunk_rows must be >= 1")
+        # DECLARE ... CURSOR FOR does not accept a terminating semicolon
+        query = query.strip().rstrip(';')
+        with self.connection() as con:
+            with con.cursor(name=f"deddiag_{uuid4().hex}") as cur:
+                cur.itersize = chunk_rows
+                with profiler.span('execute'):
+                    cur.execute(query)
+                first = True
+                while True:
+                    with profiler.span('fetch') as span:
+                        rows = cur.fetchmany(chunk_rows)
+                        span.rows = len(rows)
+                    if not rows and not first:
+                        break
+                    columns = [c[0] for c in cur.description]
+                    with profiler.span('decode') as span:
+                        df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+                        span.rows = len(df)
+                    yield df
+                    if len(rows) < chunk_rows:
+                        break
+                    first = False
+
+    @contextmanager
+    def statement_timeout(self, seconds: Optional[float]):
+        """
+        Cancel queries of the current thread running longer than seconds
+        Queries exceeding the timeout raise psycopg2.extensions.QueryCanceledError.
+        :param seconds: Timeout, no timeout if None
+        """
+        previous = getattr(self._local, 'statement_timeout', None)
+        self._local.statement_timeout = seconds
+        try:
+            yield
+        finally:
+            self._local.statement_timeout = previous
+
+    @property
+    def canceled_errors(self) -> Tuple[Type[BaseException], ...]:
+        """Exceptions raised by queries exceeding the statement_timeout"""
+        from psycopg2.extensions import QueryCanceledError
+        return (QueryCanceledError,)
 
     @contextmanager
     def connection(self):
-        con = self.__connection_pool.connect()
+        with profiler.span('checkout'):
+            con = self.__connection_pool.connect()
         try:
+            timeout = getattr(self._local, 'statement_timeout', None)
+            if timeout is not None:
+                # Reverted by the rollback when the connection is returned to the pool
+                with con.cursor() as cur:
+                    cur.execute("SET statement_timeout = %s", (max(int(timeout * 1000), 1),))
             yield con
+        except Exception:
+            # Do not return broken connections to the pool
+            if getattr(con, 'closed', 0):
+                con.invalidate()
+            raise
         finally:
             con.close()
+
+
+class AsyncConnection(object):
+    """Asynchronous Connection Manager based on asyncpg"""
+    def __init__(self, host: str = "localhost",
+                 port: Union[int, str] = 5432,
+                 db_name: str = "postgres",
+                 user: str = "postgres",
+                 password: str = "",
+                 max_concurrency: int = 5):
+        """
+        Asynchronous database connection object
+
+        Queries share a pool of at most max_concurrency connections, further queries wait for a free connection.
+        The pool is created on first use and must be closed from the same event loop.
+
+        Examples
+        --------
+        >>> async with AsyncConnection(password="password") as con:
+        >>>     results = await asyncio.gather(*(Measurements(i, start, stop).request_async(con) for i in item_ids))
+
+        :param host: Hostname
+        :param port: Port
+        :param db_name: Database Name
+        :param user: Username
+        :param password: Password
+        :param max_concurrency: Maximum number of concurrently executed queries
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be >= 1")
+        self._password = password
+        self._host = host
+        self._port = port
+        self._user = user
+        self._db_name = db_name
+        self.max_concurrency = max_concurrency
+        self._pool = None
+
+    @property
+    def dsn(self) -> str:
+        """Identifies the database, without password"""
+        return f"{self._user}@{self._host}:{self._port}/{self._db_name}"
+
+    async def _get_pool(self):
+        if self._pool is None:
+            import asyncpg
+            self._pool = await asyncpg.create_pool(host=self._host,
+                                                   port=int(self._port),
+                                                   database=self._db_name,
+                                                   user=self._user,
+                                                   password=self._password,
+                                                   min_size=1,
+                                                   max_size=self.max_concurrency)
+        return self._pool
+
+    async def from_psql(self, query: str) -> pd.DataFrame:
+        """
+        Fetch query result
+        Rows are converted as by pandas.read_sql_query, so results equal Connection.from_psql
+        :param query: SQL query
+        """
+        pool = await self._get_pool()
+        with profiler.span('checkout'):
+            con = await pool.acquire()
+        try:
+            with profiler.span('prepare'):
+                stmt = await con.prepare(query)
+            columns = [a.name for a in stmt.get_attributes()]
+            with profiler.span('fetch') as span:
+                rows = await stmt.fetch()
+                span.rows = len(rows)
+        finally:
+            await pool.release(con)
+        with profiler.span('decode') as span:
+            df = pd.DataFrame.from_records([tuple(r) for r in rows], columns=columns, coerce_float=True)
+            span.rows = len(df)
+        return df
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def __aenter__(self) -> "AsyncConnection":
+        await self._get_pool()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+def _read_sql(query: str, con, params: Optional[list] = None) -> pd.DataFrame:
+    """pandas.read_sql_query, timing execute, fetch and decode if the profiler is enabled"""
+    if not profiler.enabled:
+        return pd.read_sql_query(query, con, params=params)
+    timed = _TimedConnection(con)
+    start = time.perf_counter()
+    df = pd.read_sql_query(query, timed, params=params)
+    seconds = time.perf_counter() - start
+    profiler.record('execute', timed.execute_seconds)
+    profiler.record('fetch', timed.fetch_seconds, rows=len(df))
+    profiler.record('decode', seconds - timed.execute_seconds - timed.fetch_seconds, rows=len(df),
+                    nbytes=df.memory_usage(index=False).sum())
+    return df
+
+
+class _TimedConnection:
+    """DBAPI connection proxy summing the time spent in execute and fetchall of its cursors"""
+
+    def __init__(self, con):
+        self._con = con
+        self.execute_seconds = 0.
+        self.fetch_seconds = 0.
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+    def cursor(self, *args, **kwargs):
+        return _TimedCursor(self, self._con.cursor(*args, **kwargs))
+
+
+class _TimedCursor:
+    def __init__(self, con: _TimedConnection, cur):
+        self._con = con
+        self._cur = cur
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def execute(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cur.execute(*args, **kwargs)
+        finally:
+            self._con.execute_seconds += time.perf_counter() - start
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return self._cur.fetchall()
+        finally:
+            self._con.fetch_seconds += time.perf_counter() - start
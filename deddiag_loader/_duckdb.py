@@ -0,0 +1,342 @@
+"""In-process DuckDB engine running the SQL of the query classes on Parquet files of the dataset"""
+import datetime
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Tuple, Type, Union
+
+import numpy as np
+import pandas as pd
+
+from ._profile import profiler
+from ._rollup import TABLE as DAILY_TABLE
+from ._sql import literal, positional
+
+if TYPE_CHECKING:
+    from ._db import Connection
+
+TABLES = ('houses', 'items', 'annotation_labels', 'annotations')
+# Types of the columns of the database tables, kept in the Parquet files even if a table has no rows
+_TYPES = {'id': 'INTEGER', 'persons': 'INTEGER', 'house': 'INTEGER', 'name': 'VARCHAR', 'category': 'VARCHAR',
+          'item_id': 'INTEGER', 'label_id': 'INTEGER', 'start_date': 'TIMESTAMP', 'stop_date': 'TIMESTAMP',
+          'time': 'TIMESTAMP', 'value': 'REAL'}
+
+# Equivalents of the functions defined on the database. get_measurements() carries the last measurement at or
+# before each second forward with an ASOF join instead of a subquery per second.
+_MACROS = """
+CREATE MACRO round_timestamp(ts) AS date_trunc('second', ts::TIMESTAMP + INTERVAL 500 MILLISECOND);
+CREATE MACRO get_measurements(p_item_id, p_start, p_stop) AS TABLE
+  SELECT p_item_id::INTEGER AS item_id, s.time, m.value
+  FROM generate_series(round_timestamp(p_start), round_timestamp(p_stop), INTERVAL 1 SECOND) AS s(time)
+  ASOF LEFT JOIN (SELECT time, value FROM measurements WHERE item_id = p_item_id) m ON s.time >= m.time
+  ORDER BY s.time;
+"""
+
+# Daily summaries computed from the measurements when queried, equal to the rollup table filled by refresh_rollups()
+_DAILY = f"""
+CREATE VIEW {DAILY_TABLE} AS
+WITH v_lag AS (
+    SELECT item_id, time, value,
+           date_diff('microsecond', lag(time) OVER w, time) / 1e6 AS gap,
+           date_diff('microsecond', time, lead(time) OVER w) / 1e6 AS duration
+    FROM measurements
+    WINDOW w AS (PARTITION BY item_id ORDER BY time)
+)
+SELECT item_id,
+       time::DATE AS day,
+       min(time) AS first_time,
+       max(time) AS last_time,
+       count(*) AS count,
+       max(gap) AS max_gap_seconds,
+       COALESCE(sum(gap) FILTER (WHERE gap > 3605), 0) AS gap_hour_seconds,
+       COALESCE(sum(gap) FILTER (WHERE gap > 86400), 0) AS gap_day_seconds,
+       COALESCE(sum(value * duration), 0) / 3600 AS energy_wh
+FROM v_lag
+GROUP BY 1, 2
+"""
+
+_EMPTY_MEASUREMENTS = "SELECT NULL::INTEGER AS item_id, NULL::TIMESTAMP AS time, NULL::REAL AS value WHERE false"
+# ISO times with a UTC offset, e.g. 2017-01-01T10:00:00+02:00
+_OFFSET_TIME = re.compile(r"\s*\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?\s*(Z|[+-]\d{2}(:?\d{2})?)\s*",
+                          re.IGNORECASE)
+
+
+class DuckDBConnection:
+    """
+    In-process DuckDB engine, used in place of Connection to run the same SQL queries on Parquet files
+
+    The directory holds one Parquet file per table and the measurements partitioned by item in
+    measurements/item_id=<item_id>/*.parquet, sorted by time. DuckDB only reads the partitions and row groups
+    of the requested items and times and runs window functions, e.g. of MeasurementsMissingTotalBatch,
+    vectorized on all cores. round_timestamp() and get_measurements() are defined as macros and the daily
+    summaries of MeasurementsDaily as a view computing them from the measurements.
+    Times are stored as UTC timestamps without time zone: arithmetic on timestamptz follows the calendar of
+    the session time zone in DuckDB and is many times slower. Bound times with a UTC offset are converted to UTC
+    and times of results are returned in UTC, as by Connection. Convert the dataset once with convert_parquet.
+
+    Examples
+    --------
+    >>> con = DuckDBConnection("deddiag_parquet")
+    >>> MeasurementsMissingTotalBatch().request(con)
+    """
+    # Queries are never answered from rollups, the scans are fast enough without them
+    use_rollups = False
+
+    def __init__(self, directory: Union[Path, str], threads: Optional[int] = None,
+                 memory_limit: Optional[str] = None):
+        """
+        :param directory: Directory written by convert_parquet
+        :param threads: Number of DuckDB worker threads, all cores if None
+        :param memory_limit: DuckDB memory limit, e.g. '4GB', 80% of the memory if None
+        """
+        import duckdb
+
+        self.directory = Path(directory)
+        if not (self.directory / "items.parquet").exists():
+            raise FileNotFoundError(f"{self.directory} is not a Parquet copy of the dataset, items.parquet is missing")
+        config: Dict[str, Any] = {}
+        if threads is not None:
+            config['threads'] = threads
+        if memory_limit is not None:
+            config['memory_limit'] = memory_limit
+        self._db = duckdb.connect(":memory:", config=config)
+        self._local = threading.local()
+        self._db.execute("SET GLOBAL TimeZone = 'UTC'")
+        # generate_series() is estimated as a single row, which would turn the ASOF join of get_measurements()
+        # into a nested loop over all seconds and measurements
+        self._db.execute("SET GLOBAL asof_loop_join_threshold = 0")
+        for table in TABLES:
+            self._db.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet({self._path(f'{table}.parquet')})")
+        if any((self.directory / "measurements").glob("item_id=*/*.parquet")):
+            measurements = "SELECT item_id, time, value " \
+                           f"FROM read_parquet({self._path('measurements/item_id=*/*.parquet')}, " \
+                           "hive_partitioning = true, hive_types = {'item_id': INTEGER})"
+        else:
+            measurements = _EMPTY_MEASUREMENTS
+        self._db.execute(f"CREATE VIEW measurements AS {measurements}")
+        self._db.execute(_MACROS)
+        self._db.execute(_DAILY)
+
+    def _path(self, name: str) -> str:
+        return literal((self.directory / name).resolve().as_posix())
+
+    @property
+    def dsn(self) -> str:
+        """Identifies the Parquet copy"""
+        return f"duckdb:{self.directory.resolve()}"
+
+    def from_psql(self, query: str) -> pd.DataFrame:
+        """
+        Fetch query result
+        :param query: SQL query, in the dialect of DuckDB
+        """
+        return self._fetch(query)
+
+    def from_prepared(self, template: str, params: Dict[str, Any]) -> pd.DataFrame:
+        """
+        Fetch result of a query template with bind parameters, see Connection.from_prepared
+        :param template: SQL with named placeholders, e.g. "SELECT * FROM items WHERE id = %(item_id)s"
+        :param params: Value of each placeholder
+        """
+        sql, names = positional(template.strip().rstrip(';'))
+        return self._fetch(sql, [_bind(params[n]) for n in names])
+
+    def from_copy(self, query: str) -> pd.DataFrame:
+        """Fetch query result, results of DuckDB are columnar already so there is no separate binary transfer"""
+        return self._fetch(query)
+
+    def iter_prepared(self, template: str, params: Dict[str, Any],
+                      chunk_rows: int = 100000) -> Iterator[pd.DataFrame]:
+        """
+        Stream result of a query template with bind parameters in chunks, see Connection.iter_psql
+        :param template: SQL with named placeholders
+        :param params: Value of each placeholder
+        :param chunk_rows: Maximum number of rows per yielded DataFrame
+        """
+        sql, names = positional(template.strip().rstrip(';'))
+        return self._iter(sql, [_bind(params[n]) for n in names], chunk_rows)
+
+    def iter_psql(self, query: str, chunk_rows: int = 100000) -> Iterator[pd.DataFrame]:
+        """
+        Stream query result in chunks, see Connection.iter_psql
+        :param query: SQL query, in the dialect of DuckDB
+        :param chunk_rows: Maximum number of rows per yielded DataFrame
+        """
+        return self._iter(query, None, chunk_rows)
+
+    def _fetch(self, query: str, params: Optional[List[Any]] = None) -> pd.DataFrame:
+        with self.connection() as cur:
+            with profiler.span('execute'):
+                cur.execute(query.strip().rstrip(';'), params)
+            with profiler.span('fetch') as span:
+                df = cur.df()
+                span.rows = len(df)
+            dates = _dates(cur)
+        with profiler.span('decode') as span:
+            df = _to_frame(df, dates)
+            span.rows = len(df)
+        return df
+
+    def _iter(self, query: str, params: Optional[List[Any]], chunk_rows: int) -> Iterator[pd.DataFrame]:
+        if chunk_rows < 1:
+            raise ValueError("chunk_rows must be >= 1")
+        with self.connection() as cur:
+            with profiler.span('execute'):
+                cur.execute(query.strip().rstrip(';'), params)
+            dates = _dates(cur)
+            # Chunks are fetched in whole vectors of 2048 rows and split to at most chunk_rows
+            vectors = max(chunk_rows // 2048, 1)
+            first = True
+            while True:
+                with profiler.span('fetch') as span:
+                    df = cur.fetch_df_chunk(vectors)
+                    span.rows = len(df)
+                if not len(df) and not first:
+                    break
+                with profiler.span('decode') as span:
+                    df = _to_frame(df, dates)
+                    span.rows = len(df)
+                for i in range(0, max(len(df), 1), chunk_rows):
+                    yield df.iloc[i:i + chunk_rows].reset_index(drop=True)
+                first = False
+
+    @contextmanager
+    def statement_timeout(self, seconds: Optional[float]):
+        """
+        Interrupt queries of the current thread running longer than seconds
+        Queries exceeding the timeout raise duckdb.InterruptException.
+        :param seconds: Timeout, no timeout if None
+        """
+        previous = getattr(self._local, 'statement_timeout', None)
+        self._local.statement_timeout = seconds
+        try:
+            yield
+        finally:
+            self._local.statement_timeout = previous
+
+    @property
+    def canceled_errors(self) -> Tuple[Type[BaseException], ...]:
+        """Exceptions raised by queries exceeding the statement_timeout"""
+        import duckdb
+        return (duckdb.InterruptException,)
+
+    @contextmanager
+    def connection(self):
+        """Cursor of the database, each has its own connection so threads may query concurrently"""
+        with profiler.span('checkout'):
+            cur = self._db.cursor()
+        timeout = getattr(self._local, 'statement_timeout', None)
+        timer = None
+        if timeout is not None:
+            timer = threading.Timer(timeout, cur.interrupt)
+            timer.daemon = True
+            timer.start()
+        try:
+            yield cur
+        finally:
+            if timer is not None:
+                timer.cancel()
+            cur.close()
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self) -> "DuckDBConnection":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _bind(value: Any) -> Any:
+    """Value bound to a parameter, times with a UTC offset converted to UTC without time zone"""
+    if isinstance(value, str) and _OFFSET_TIME.fullmatch(value):
+        value = pd.Timestamp(value)
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        return pd.Timestamp(value).tz_convert('UTC').tz_localize(None).isoformat(sep=' ')
+    return value
+
+
+def _dates(cur) -> List[str]:
+    """Names of the DATE columns of the result of cur"""
+    return [d[0] for d in cur.description if str(d[1]) == 'DATE']
+
+
+def _to_frame(df: pd.DataFrame, dates: Iterable[str] = ()) -> pd.DataFrame:
+    """
+    Columns with the dtypes of pandas.read_sql_query on PostgreSQL: int64, float64, UTC timestamps and dates as
+    datetime.date objects
+    """
+    dates = set(dates)
+    for column in dates:
+        df[column] = df[column].dt.date
+    for column, dtype in df.dtypes.items():
+        if column in dates:
+            continue
+        if isinstance(dtype, pd.DatetimeTZDtype):
+            df[column] = df[column].dt.tz_convert('UTC')
+        elif dtype.kind == 'M':
+            df[column] = df[column].dt.tz_localize('UTC')
+        elif isinstance(dtype, pd.api.extensions.ExtensionDtype) and dtype.kind in 'iu':
+            # Integer columns with NULLs are read as float by pandas.read_sql_query
+            df[column] = df[column].astype('float64') if df[column].hasnans else df[column].astype('int64')
+        elif dtype.kind in 'iu':
+            df[column] = df[column].astype(np.int64)
+        elif dtype == np.float32:
+            df[column] = df[column].astype(np.float64)
+    return df
+
+
+def convert_parquet(con: "Connection", directory: Union[Path, str], item_ids: Optional[Iterable[int]] = None,
+                    chunk_rows: int = 1000000) -> Dict[int, int]:
+    """
+    Copy the dataset to Parquet files queried by DuckDBConnection
+    :param con: Connection, or LocalConnection to convert a local copy
+    :param directory: Output directory, created if it does not exist
+    :param item_ids: Only copy measurements of these items, all items if None
+    :param chunk_rows: Rows of measurements held in memory at once, each chunk is written to its own file
+    :return: Number of measurements per item
+    """
+    import duckdb
+    from ._loader import Houses, Items, AnnotationLabels, AnnotationsBatch, Measurements
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    db = duckdb.connect(":memory:")
+    try:
+        items: List[int] = []
+        for name, query in (('houses', Houses()), ('items', Items()), ('annotation_labels', AnnotationLabels()),
+                            ('annotations', AnnotationsBatch())):
+            df = query.request(con)
+            _write(db, df, directory / f"{name}.parquet")
+            if name == 'items':
+                items = df['id'].tolist()
+        rows: Dict[int, int] = {}
+        for item_id in (items if item_ids is None else item_ids):
+            item_id = int(item_id)
+            item_dir = directory / "measurements" / f"item_id={item_id}"
+            for path in item_dir.glob("*.parquet"):
+                path.unlink()
+            for i, chunk in enumerate(Measurements(item_id).request_iter(con, chunk_rows)):
+                if not len(chunk):
+                    continue
+                item_dir.mkdir(parents=True, exist_ok=True)
+                # The item is stored in the partition path
+                _write(db, chunk[['time', 'value']], item_dir / f"part-{i:05d}.parquet")
+                rows[item_id] = rows.get(item_id, 0) + len(chunk)
+    finally:
+        db.close()
+    return rows
+
+
+def _write(db, df: pd.DataFrame, path: Path):
+    """df written to a Parquet file with the column types of the database, times in UTC without time zone"""
+    df = df.assign(**{c: df[c].dt.tz_convert('UTC').dt.tz_localize(None)
+                      for c, dtype in df.dtypes.items() if isinstance(dtype, pd.DatetimeTZDtype)})
+    columns = ', '.join(f'"{c}"::{_TYPES[c]} AS "{c}"' if c in _TYPES else f'"{c}"' for c in df.columns)
+    db.register('_frame', df)
+    try:
+        db.execute(f"COPY (SELECT {columns} FROM _frame) TO {literal(path.as_posix())} (FORMAT parquet)")
+    finally:
+        db.unregister('_frame')
@@ -0,0 +1,113 @@
+"""Client side expansion of change point measurements to one value per second"""
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+_SECOND_US = 1000000
+
+
+def round_timestamp(t: Union[str, pd.Timestamp]) -> pd.Timestamp:
+    """
+    Round to the nearest second as round_timestamp() on the database, naive timestamps are interpreted as UTC
+    :param t: Timestamp
+    """
+    t = pd.Timestamp(t)
+    t = t.tz_localize('UTC') if t.tzinfo is None else t.tz_convert('UTC')
+    return (t + pd.Timedelta(milliseconds=500)).floor('s')
+
+
+def to_epoch_us(time: pd.Series) -> np.ndarray:
+    """Microseconds since epoch of a datetime column, naive times are interpreted as UTC"""
+    if getattr(time.dtype, 'tz', None) is not None:
+        time = time.dt.tz_convert('UTC').dt.tz_localize(None)
+    return time.to_numpy(dtype='datetime64[us]').view(np.int64)
+
+
+class ExpandedView:
+    """
+    Lazy view of change point measurements as one value per second
+
+    Like get_measurements() on the database, the value at each second is the last value measured at or before
+    that second, NaN if there is none. Values are only computed for the accessed seconds.
+
+    Examples
+    --------
+    >>> view = MeasurementsExpandedClient(10, "2017-01-01", "2017-02-01").request_view(con)
+    >>> len(view)       # Seconds from 2017-01-01 until 2017-02-01
+    >>> view[3600]      # Value at 2017-01-01T01:00:00
+    >>> view[:86400]    # Values of the first day
+    """
+
+    def __init__(self, item_id: int, times: np.ndarray, values: np.ndarray, start: int, length: int):
+        """
+        :param item_id: item_id
+        :param times: Sorted times of the change points in microseconds since epoch
+        :param values: Values of the change points
+        :param start: First second of the view in microseconds since epoch
+        :param length: Number of seconds
+        """
+        self.item_id = item_id
+        self.start = start
+        self.length = max(length, 0)
+        values = np.asarray(values)
+        dtype = np.result_type(values.dtype, np.float32)
+        # Leading NaN is the value before the first change point
+        self._values = np.concatenate([np.full(1, np.nan, dtype=dtype), values.astype(dtype)])
+        # Index of the first second at which each change point is in effect: ceil((t - start) / 1s)
+        self._positions = -((start - np.asarray(times, dtype=np.int64)) // _SECOND_US)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            a, b, step = key.indices(self.length)
+            if step != 1:
+                return self.values(a, b)[::step] if a < b else self.values(0, 0)
+            return self.values(a, b)
+        pos = np.asarray(key)
+        pos = np.where(pos < 0, pos + self.length, pos)
+        if np.any((pos < 0) | (pos >= self.length)):
+            raise IndexError(f"index {key} out of range for {self.length} seconds")
+        out = self._values[np.searchsorted(self._positions, pos, side='right')]
+        return out.item() if out.ndim == 0 else out
+
+    @property
+    def time(self) -> np.ndarray:
+        """Seconds of the view as datetime64[us] in UTC"""
+        return self.times(0, self.length)
+
+    def times(self, a: int, b: int) -> np.ndarray:
+        """Seconds a until b (exclusive) as datetime64[us] in UTC"""
+        return (self.start + np.arange(a, b, dtype=np.int64) * _SECOND_US).view('datetime64[us]')
+
+    def values(self, a: int = 0, b: Optional[int] = None) -> np.ndarray:
+        """
+        Values of seconds a until b (exclusive), forward filled with np.repeat
+        :param a: First second
+        :param b: End second, len(self) if None
+        """
+        b = self.length if b is None else min(b, self.length)
+        if b <= a:
+            return np.empty(0, dtype=self._values.dtype)
+        pos = self._positions
+        j0 = np.searchsorted(pos, a, side='right')
+        j1 = np.searchsorted(pos, b - 1, side='right')
+        starts = np.concatenate([[a], pos[j0:j1]])
+        counts = np.diff(np.append(starts, b))
+        return np.repeat(self._values[j0:j1 + 1], counts)
+
+    def to_frame(self, a: int = 0, b: Optional[int] = None) -> pd.DataFrame:
+        """
+        Seconds a until b (exclusive) as DataFrame with the columns of MeasurementsExpanded
+        :param a: First second
+        :param b: End second, len(self) if None
+        """
+        b = self.length if b is None else min(b, self.length)
+        a = min(a, b)
+        return pd.DataFrame({
+            'item_id': np.full(b - a, self.item_id, dtype=np.int64),
+            'time': pd.Series(self.times(a, b)).dt.tz_localize('UTC'),
+            'value': self.values(a, b),
+        })
@@ -0,0 +1,278 @@
+"""Export of measurements with labels to memory mapped .npy files, one per column"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, NamedTuple, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from ._expand import round_timestamp, to_epoch_us
+from ._labels import NO_LABEL
+from ._loader import Items, MeasurementsExpandedWithLabelsClient, MeasurementsRangeBatch
+
+if TYPE_CHECKING:
+    from ._db import Connection
+
+INDEX_FILE = 'index.json'
+MANIFEST_FILE = 'manifest.json'
+
+# Stored value of the label_id column at times without annotation, as label ids are stored unsigned
+NO_LABEL_STORED = 0
+
+_DAY_S = 86400
+
+
+def save_memmap(con: "Connection", query: MeasurementsExpandedWithLabelsClient, directory: Union[Path, str],
+                chunk_rows: int = 86400) -> dict:
+    """
+    Stream query result into preallocated .npy files, one per column, and write the index
+
+    Files are written with np.lib.format.open_memmap, so peak memory is bounded by chunk_rows:
+     - time.npy: int64 seconds since epoch (UTC)
+     - value.npy: float32
+     - labels.npy / label_<id>.npy: bool, label_id.npy: uint16 with NO_LABEL_STORED at times without annotation
+    index.json holds item, label ids, date range and the row offsets of each day (UTC).
+    :param con: Connection
+    :param query: MeasurementsExpandedWithLabelsClient
+    :param directory: Output directory
+    :param chunk_rows: Rows requested and written per chunk
+    :return: Index
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rows = len(query.measurements)
+    start = query.measurements._start
+    arrays: Dict[str, np.memmap] = {}
+    offset = 0
+    for df in query.request_iter(con, chunk_rows):
+        if not arrays:
+            arrays['time'] = np.lib.format.open_memmap(directory / 'time.npy', 'w+', np.int64, (rows,))
+            arrays['value'] = np.lib.format.open_memmap(directory / 'value.npy', 'w+', np.float32, (rows,))
+            for column in df.columns.drop(['item_id', 'time', 'value']):
+                dtype = np.uint16 if column == 'label_id' else np.bool_
+                arrays[column] = np.lib.format.open_memmap(directory / f"{column}.npy", 'w+', dtype, (rows,))
+        end = offset + len(df)
+        arrays['time'][offset:end] = to_epoch_us(df['time']) // 10 ** 6
+        arrays['value'][offset:end] = df['value'].to_numpy(dtype=np.float32)
+        for column, array in arrays.items():
+            if column == 'label_id':
+                label = df[column].to_numpy()
+                array[offset:end] = np.where(label == NO_LABEL, NO_LABEL_STORED, label)
+            elif column not in ('time', 'value'):
+                array[offset:end] = df[column].to_numpy(dtype=bool)
+        offset = end
+    for array in arrays.values():
+        array.flush()
+    if offset != rows:
+        raise RuntimeError(f"Expected {rows} rows, got {offset}")
+
+    index = {
+        'item_id': int(query.measurements._item_id),
+        'label_ids': query.label_ids,
+        'mode': query.mode,
+        'start_date': start.isoformat(),
+        'stop_date': query.measurements._stop.isoformat(),
+        'rows': rows,
+        'columns': {name: {'file': f"{name}.npy", 'dtype': str(array.dtype)} for name, array in arrays.items()},
+        'days': _day_offsets(start, rows),
+    }
+    tmp_path = directory / f"{INDEX_FILE}.tmp"
+    with tmp_path.open('w') as f:
+        json.dump(index, f, indent=1)
+    tmp_path.replace(directory / INDEX_FILE)
+    return index
+
+
+def _day_offsets(start: pd.Timestamp, rows: int) -> Dict[str, list]:
+    """Row range [offset, end) of each UTC day, rows are consecutive seconds from start"""
+    days = {}
+    first = int(start.value // 10 ** 9)
+    day = first - first % _DAY_S
+    while day < first + rows:
+        a = max(day - first, 0)
+        b = min(day + _DAY_S - first, rows)
+        days[pd.Timestamp(day, unit='s').date().isoformat()] = [a, b]
+        day += _DAY_S
+    return days
+
+
+class MemmapExport:
+    """
+    Read only access to an export written by save_memmap, columns are memory mapped
+
+    Examples
+    --------
+    >>> export = MemmapExport("item_10")
+    >>> export['value']               # Memory mapped float32 values
+    >>> day = export.day("2017-01-01")  # Columns of a single day, sliced without reading other days
+    >>> day['value'], day['labels']
+    """
+
+    def __init__(self, directory: Union[Path, str]):
+        """
+        :param directory: Directory written by save_memmap
+        """
+        self.directory = Path(directory)
+        with (self.directory / INDEX_FILE).open() as f:
+            self.index = json.load(f)
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    @property
+    def columns(self):
+        return list(self.index['columns'])
+
+    def __len__(self) -> int:
+        return self.index['rows']
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        if column not in self._arrays:
+            file = self.index['columns'][column]['file']
+            self._arrays[column] = np.load(self.directory / file, mmap_mode='r')
+        return self._arrays[column]
+
+    def day(self, date: Union[str, pd.Timestamp]) -> Dict[str, np.ndarray]:
+        """
+        Columns of a UTC day as memory mapped slices
+        :param date: Day
+        """
+        key = pd.Timestamp(date).date().isoformat()
+        if key not in self.index['days']:
+            raise KeyError(f"{key} is not in the export from {self.index['start_date']} to {self.index['stop_date']}")
+        a, b = self.index['days'][key]
+        return {column: self[column][a:b] for column in self.columns}
+
+
+class Partition(NamedTuple):
+    house_id: int
+    item_id: int
+    start: pd.Timestamp
+    stop: pd.Timestamp
+
+    @property
+    def path(self) -> str:
+        """Directory of the partition relative to the export directory"""
+        return f"house={self.house_id}/item={self.item_id}/{self.start.strftime('%Y-%m')}"
+
+
+def partitions(con: "Connection", item_ids: Optional[List[int]] = None, house_ids: Optional[List[int]] = None,
+               categories: Optional[List[str]] = None, start_date: Optional[str] = None,
+               stop_date: Optional[str] = None) -> List[Partition]:
+    """
+    Monthly partitions of the selected items, limited to their measurement range and the date range
+    Naive dates are interpreted as UTC.
+    :param con: Connection
+    :param item_ids: Only these items
+    :param house_ids: Only items of these houses
+    :param categories: Only items of these categories, case insensitive
+    :param start_date: First second
+    :param stop_date: Last second
+    """
+    items = Items().request(con)
+    if item_ids:
+        items = items[items['id'].isin(item_ids)]
+    if house_ids:
+        items = items[items['house'].isin(house_ids)]
+    if categories:
+        items = items[items['category'].str.lower().isin([c.lower() for c in categories])]
+    if items.empty:
+        return []
+    ranges = MeasurementsRangeBatch(items['id'].tolist()).request(con).set_index('item_id')
+    start_date = None if start_date is None else round_timestamp(start_date)
+    stop_date = None if stop_date is None else round_timestamp(stop_date)
+
+    result = []
+    for _, item in items.sort_values(['house', 'id']).iterrows():
+        if item['id'] not in ranges.index:
+            logging.warning(f"Skipping item {item['id']} without measurements")
+            continue
+        start = round_timestamp(ranges.loc[item['id'], 'min_date'])
+        stop = round_timestamp(ranges.loc[item['id'], 'max_date'])
+        start = start if start_date is None else max(start, start_date)
+        stop = stop if stop_date is None else min(stop, stop_date)
+        month = start.tz_localize(None).to_period('M').to_timestamp().tz_localize('UTC')
+        while month <= stop:
+            next_month = month + pd.offsets.MonthBegin(1)
+            result.append(Partition(int(item['house']), int(item['id']), max(month, start),
+                                    min(next_month - pd.Timedelta(seconds=1), stop)))
+            month = next_month
+    return result
+
+
+def _range(part: Partition) -> Dict[str, str]:
+    """Time range of a partition as recorded in the manifest"""
+    return {'start': part.start.isoformat(), 'stop': part.stop.isoformat()}
+
+
+def export_partitions(con: "Connection", directory: Union[Path, str], parts: List[Partition],
+                      label_ids: Optional[List[int]] = None, mode: str = 'mask', workers: int = 4,
+                      chunk_rows: int = 86400) -> Iterator[dict]:
+    """
+    Export partitions with save_memmap in parallel, skipping partitions completed by a previous run
+
+    Completed partitions are recorded in manifest.json of directory with their time range. Partitions are written
+    to a temporary directory first, so an interrupted export only leaves incomplete partitions that are exported
+    again. Partitions recorded with another time range, e.g. a month exported up to an earlier stop date, are
+    exported again as well.
+    :param con: Connection, its pool is shared by the workers
+    :param directory: Export directory
+    :param parts: Partitions, see partitions()
+    :param label_ids: Label ids, all labels if None
+    :param mode: Label mode, see MeasurementsExpandedWithLabelsClient
+    :param workers: Number of worker threads
+    :param chunk_rows: Rows requested and written per chunk
+    :return: Iterator of stats of the exported partitions (path, rows, bytes, seconds)
+    """
+    if workers < 1:
+        raise ValueError("workers must be >= 1")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    params = {'label_ids': None if label_ids is None else sorted(label_ids), 'mode': mode}
+    manifest_path = directory / MANIFEST_FILE
+    manifest: Dict[str, Any] = {'params': params, 'partitions': {}}
+    if manifest_path.exists():
+        with manifest_path.open() as f:
+            manifest = json.load(f)
+        if manifest['params'] != params:
+            raise ValueError(f"{directory} was exported with {manifest['params']}, not {params}")
+    lock = threading.Lock()
+
+    def run(part: Partition) -> dict:
+        query = MeasurementsExpandedWithLabelsClient(part.item_id, label_ids, part.start, part.stop, mode)
+        path = directory / part.path
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        begin = time.perf_counter()
+        index = save_memmap(con, query, tmp_path, chunk_rows)
+        if path.exists():
+            for file in path.iterdir():
+                file.unlink()
+            path.rmdir()
+        tmp_path.replace(path)
+        stats = {'rows': index['rows'], 'bytes': sum(f.stat().st_size for f in path.iterdir()),
+                 'seconds': time.perf_counter() - begin}
+        with lock:
+            manifest['partitions'][part.path] = {**stats, **_range(part)}
+            tmp_manifest = directory / f"{MANIFEST_FILE}.tmp"
+            with tmp_manifest.open('w') as f:
+                json.dump(manifest, f, indent=1)
+            tmp_manifest.replace(manifest_path)
+        return {'path': part.path, **stats}
+
+    done = manifest['partitions']
+    todo = [p for p in parts if p.path not in done or _range(p).items() - done[p.path].items()]
+    if len(todo) < len(parts):
+        logging.info(f"Skipping {len(parts) - len(todo)} partitions completed before")
+    failed = []
+    with ThreadPoolExecutor(workers) as pool:
+        futures = {pool.submit(run, part): part for part in todo}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception:
+                logging.exception(f"Exporting {futures[future].path} failed")
+                failed.append(futures[future].path)
+    if failed:
+        raise RuntimeError(f"Exporting {len(failed)} partitions failed, run again to resume: {failed}")
@@ -4,16 +4,16 @@ import pandas as pd
 
 class Formatter:
 
-    def format(self, df: pd.DataFrame) -> str:
+    def format(self, df: pd.DataFrame, **kwargs) -> str:
         raise NotImplementedError
 
-    def print(self, df):
+    def print(self, df, **kwargs):
         print(self.format(df, **kwargs))
 
 
 class StringFormatter(Formatter):
 
-    def format(self, df: pd.DataFrame) -> str:
+    def format(self, df: pd.DataFrame, **kwargs) -> str:
         result = []
         for house, g in df.groupby(level=0):
             result.append(f"------------------------------- {house}-------------------------------")
@@ -34,7 +34,7 @@ class LatexFormatter(Formatter):
         self._buf.append(other)
         return self
 
-    def format(self, df: pd.DataFrame, alignment: Optional[str] = None) -> str:
+    def format(self, df: pd.DataFrame, alignment: Optional[str] = None, **kwargs) -> str:
         self.reset()
         item_idx = df.index.levels[1]
         columns = [item_idx.name] + df.columns.tolist()
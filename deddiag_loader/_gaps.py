@@ -0,0 +1,231 @@
+"""Client side analysis of gaps between measurements, computed with np.diff on streamed time arrays"""
+from typing import Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from ._expand import to_epoch_us
+
+_SECOND_US = 1000000
+_DAY_US = 86400 * _SECOND_US
+
+# Thresholds of MeasurementsMissingTotal
+DEFAULT_THRESHOLDS = ('1hour 5sec', '1 day')
+
+# Upper bin edges of the gap histogram in seconds, the last bin holds all larger gaps
+DEFAULT_BINS = (1, 2, 5, 10, 30, 60, 300, 600, 3605, 86400)
+
+TimesLike = Union[pd.DataFrame, pd.Series, np.ndarray]
+
+
+class GapAnalysis:
+    """
+    Gaps between consecutive measurements of an item, accumulated over chunks in a single pass
+
+    Chunks are passed to update() in time order, e.g. from Query.request_iter or a cache, and gaps spanning
+    chunk boundaries are counted. Analyses of consecutive time ranges can be combined with merge().
+    All thresholds are evaluated in the same pass, gaps are counted if they are larger than the threshold
+    as in MeasurementsMissing.
+
+    Examples
+    --------
+    >>> gaps = GapAnalysis(thresholds=['5min', '1hour 5sec', '1 day'])
+    >>> for chunk in Measurements(10, "2017-01-01", "2018-01-01").request_iter(con):
+    >>>     gaps.update(chunk)
+    >>> gaps.missing()      # Count, seconds and ratio of gaps per threshold
+    >>> gaps.coverage()     # Seconds per day not within gaps
+    >>> gaps.gaps()         # Start and stop of gaps larger than the smallest threshold
+    """
+
+    def __init__(self, thresholds: Sequence[Union[str, pd.Timedelta]] = DEFAULT_THRESHOLDS,
+                 bins: Union[Sequence[float], np.ndarray] = DEFAULT_BINS,
+                 interval_threshold: Union[str, pd.Timedelta, None] = None):
+        """
+        :param thresholds: Gap thresholds, e.g. '1hour 5sec'
+        :param bins: Upper bin edges of the gap histogram in seconds
+        :param interval_threshold: Keep start and stop of gaps larger than this, used by gaps() and coverage().
+                                   Defaults to the smallest threshold.
+        """
+        if not len(thresholds):
+            raise ValueError("At least one threshold is required")
+        self.thresholds = [pd.Timedelta(t) for t in thresholds]
+        self.bins = np.asarray(sorted(bins), dtype=np.float64)
+        self.interval_threshold = min(self.thresholds) if interval_threshold is None else pd.Timedelta(interval_threshold)
+        self._limits = np.array([t.value // 1000 for t in self.thresholds], dtype=np.int64)
+        self._interval_limit = self.interval_threshold.value // 1000
+        self.first: Optional[int] = None
+        self.last: Optional[int] = None
+        self.rows = 0
+        self.max_gap = 0
+        self._sums = np.zeros(len(self._limits), dtype=np.int64)
+        self._counts = np.zeros(len(self._limits), dtype=np.int64)
+        self._histogram = np.zeros(len(self.bins) + 1, dtype=np.int64)
+        self._starts: List[np.ndarray] = []
+        self._stops: List[np.ndarray] = []
+
+    def update(self, times: TimesLike) -> "GapAnalysis":
+        """
+        Add the next chunk of measurement times
+        :param times: Sorted times, DataFrame with time column, datetime Series or microseconds since epoch,
+                      all later than the times of previous chunks
+        """
+        times = _as_epoch_us(times)
+        if not len(times):
+            return self
+        if self.last is not None:
+            times = np.concatenate([[self.last], times])
+        diffs = np.diff(times)
+        if len(diffs) and diffs.min() < 0:
+            raise ValueError("times must be sorted and later than the times of previous chunks")
+        self._add_diffs(times, diffs)
+        if self.first is None:
+            self.first = int(times[0])
+            self.rows += len(times)
+        else:
+            self.rows += len(times) - 1
+        self.last = int(times[-1])
+        return self
+
+    def merge(self, other: "GapAnalysis") -> "GapAnalysis":
+        """
+        Combine with the analysis of a later time range into a new analysis
+        :param other: Analysis with the same thresholds, bins and interval_threshold of times after self.last
+        """
+        if self.thresholds != other.thresholds or not np.array_equal(self.bins, other.bins) \
+                or self.interval_threshold != other.interval_threshold:
+            raise ValueError("Only analyses with equal thresholds, bins and interval_threshold can be merged")
+        if self.last is not None and other.first is not None and other.first < self.last:
+            if self.first is not None and other.last is not None and self.first < other.last:
+                raise ValueError("Analyses of overlapping time ranges cannot be merged")
+            return other.merge(self)
+        result = GapAnalysis(self.thresholds, self.bins, self.interval_threshold)
+        for part in (self, other):
+            result._sums += part._sums
+            result._counts += part._counts
+            result._histogram += part._histogram
+            result._starts += part._starts
+            result._stops += part._stops
+            result.max_gap = max(result.max_gap, part.max_gap)
+            result.rows += part.rows
+        result.first = self.first if self.first is not None else other.first
+        result.last = other.last if other.last is not None else self.last
+        if self.last is not None and other.first is not None:
+            boundary = np.array([self.last, other.first], dtype=np.int64)
+            result._add_diffs(boundary, np.diff(boundary))
+        return result
+
+    def _add_diffs(self, times: np.ndarray, diffs: np.ndarray):
+        if not len(diffs):
+            return
+        self.max_gap = max(self.max_gap, int(diffs.max()))
+        # Sum of the gaps larger than each threshold, from the sorted gaps and their cumulative sum
+        ordered = np.sort(diffs)
+        cumulative = np.concatenate([[0], np.cumsum(ordered)])
+        larger = np.searchsorted(ordered, self._limits, side='right')
+        self._counts += len(ordered) - larger
+        self._sums += cumulative[-1] - cumulative[larger]
+        self._histogram += np.bincount(np.searchsorted(self.bins * _SECOND_US, diffs, side='left'),
+                                       minlength=len(self._histogram))
+        selected = np.flatnonzero(diffs > self._interval_limit)
+        if len(selected):
+            self._starts.append(times[selected])
+            self._stops.append(times[selected + 1])
+
+    @property
+    def total(self) -> pd.Timedelta:
+        """Time from the first until the last measurement"""
+        if self.first is None or self.last is None:
+            return pd.Timedelta(0)
+        return pd.Timedelta(microseconds=self.last - self.first)
+
+    def missing(self) -> pd.DataFrame:
+        """Number and seconds of gaps larger than each threshold and their ratio of the total time"""
+        total = (self.last - self.first) / _SECOND_US if self.first is not None and self.last is not None else 0
+        seconds = self._sums / _SECOND_US
+        return pd.DataFrame({
+            'threshold': self.thresholds,
+            'gaps': self._counts,
+            'seconds': seconds,
+            'ratio': seconds / total if total else np.full(len(seconds), np.nan),
+        })
+
+    def missing_total(self, item_id: int) -> pd.DataFrame:
+        """
+        Result in the format of MeasurementsMissingTotal, requires the thresholds '1hour 5sec' and '1 day'
+        :param item_id: item_id of the row
+        """
+        missing = self.missing().set_index('threshold')['ratio']
+        return pd.DataFrame({
+            'item_id': [item_id],
+            'time_total': [self.total],
+            'perc_missing_hour': [missing[pd.Timedelta('1hour 5sec')]],
+            'perc_missing_day': [missing[pd.Timedelta('1 day')]],
+        })
+
+    def histogram(self) -> pd.DataFrame:
+        """Number of gaps per bin, a gap is counted in the bin with lower < gap <= upper seconds"""
+        edges = np.concatenate([[0.], self.bins, [np.inf]])
+        return pd.DataFrame({'lower': edges[:-1], 'upper': edges[1:], 'count': self._histogram})
+
+    def gaps(self) -> pd.DataFrame:
+        """Start, stop and duration of the gaps larger than interval_threshold"""
+        starts, stops = self._intervals()
+        return pd.DataFrame({
+            'start': pd.Series(starts.view('datetime64[us]')).dt.tz_localize('UTC'),
+            'stop': pd.Series(stops.view('datetime64[us]')).dt.tz_localize('UTC'),
+            'duration': pd.Series((stops - starts).view('timedelta64[us]')),
+        })
+
+    def coverage(self) -> pd.DataFrame:
+        """
+        Seconds of each day (UTC) between the first and last measurement and not within a gap larger than
+        interval_threshold, and their ratio of the whole day
+        """
+        if self.first is None or self.last is None:
+            return pd.DataFrame({'day': pd.Series(dtype='datetime64[us, UTC]'),
+                                 'seconds': pd.Series(dtype=np.float64), 'coverage': pd.Series(dtype=np.float64)})
+        days = np.arange(self.first // _DAY_US, self.last // _DAY_US + 1, dtype=np.int64) * _DAY_US
+        edges = np.clip(np.append(days, days[-1] + _DAY_US), self.first, self.last)
+        starts, stops = self._intervals()
+        # Length of all gaps before each edge
+        cumulative = np.concatenate([[0], np.cumsum(stops - starts)])
+        idx = np.searchsorted(starts, edges, side='right')
+        before = cumulative[idx]
+        if len(starts):
+            before = before - np.where(idx > 0, np.maximum(stops[np.maximum(idx - 1, 0)] - edges, 0), 0)
+        seconds = (np.diff(edges) - np.diff(before)) / _SECOND_US
+        return pd.DataFrame({
+            'day': pd.Series(days.view('datetime64[us]')).dt.tz_localize('UTC'),
+            'seconds': seconds,
+            'coverage': seconds / 86400,
+        })
+
+    def _intervals(self):
+        if not self._starts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        starts, stops = np.concatenate(self._starts), np.concatenate(self._stops)
+        order = np.argsort(starts, kind='stable')
+        return starts[order], stops[order]
+
+
+def analyze_gaps(chunks: Iterable[TimesLike], **kwargs) -> GapAnalysis:
+    """
+    Analyze gaps of sorted chunks of measurement times in a single pass
+    :param chunks: Chunks in time order, e.g. Query.request_iter
+    :param kwargs: See GapAnalysis
+    """
+    analysis = GapAnalysis(**kwargs)
+    for chunk in chunks:
+        analysis.update(chunk)
+    return analysis
+
+
+def _as_epoch_us(times: TimesLike) -> np.ndarray:
+    if isinstance(times, pd.DataFrame):
+        times = times['time']
+    if isinstance(times, pd.Series):
+        return to_epoch_us(times)
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        return times.astype('datetime64[us]').view(np.int64)
+    return times.astype(np.int64, copy=False)
@@ -0,0 +1,72 @@
+"""Assignment of annotation labels to measurements by vectorized interval join"""
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from ._expand import to_epoch_us
+
+LABEL_MODES = ('mask', 'multi_hot', 'label_id')
+
+# Value of the label_id column at times without annotation
+NO_LABEL = -1
+
+
+def interval_mask(times: np.ndarray, starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    """
+    Mask of times covered by at least one of the closed intervals [starts, stops]
+
+    The number of intervals covering t is #(starts <= t) - #(stops < t), computed with np.searchsorted
+    on the sorted interval bounds in O((len(times) + len(starts)) * log(len(starts))).
+    :param times: Times
+    :param starts: Interval starts
+    :param stops: Interval stops
+    """
+    if len(starts) == 0:
+        return np.zeros(len(times), dtype=bool)
+    started = np.searchsorted(np.sort(starts), times, side='right')
+    stopped = np.searchsorted(np.sort(stops), times, side='left')
+    return started > stopped
+
+
+def assign_labels(measurements: pd.DataFrame, annotations: pd.DataFrame, mode: str = 'mask',
+                  label_ids: Optional[List[int]] = None) -> pd.DataFrame:
+    """
+    Add annotation labels to measurements
+
+    Modes:
+     - mask: bool column labels, True if any annotation covers the time, as MeasurementsExpandedWithLabels
+     - multi_hot: bool column label_<id> per label id
+     - label_id: int column label_id with the annotated label, NO_LABEL if there is none.
+       If annotations of several labels overlap, the smallest label id is used.
+    :param measurements: Measurements with time column
+    :param annotations: Annotations with label_id, start_date and stop_date columns
+    :param mode: One of LABEL_MODES
+    :param label_ids: Label ids of the multi_hot columns, all labels of annotations if None
+    :return: Copy of measurements with the label columns
+    """
+    if mode not in LABEL_MODES:
+        raise ValueError(f"Unknown label mode {mode}, expected one of {LABEL_MODES}")
+    times = to_epoch_us(measurements['time'])
+    starts = to_epoch_us(annotations['start_date'])
+    stops = to_epoch_us(annotations['stop_date'])
+    result = measurements.copy()
+    if mode == 'mask':
+        result['labels'] = interval_mask(times, starts, stops)
+        return result
+
+    annotation_labels = annotations['label_id'].to_numpy()
+    if label_ids is None:
+        label_ids = sorted(set(annotation_labels.tolist()))
+    if mode == 'multi_hot':
+        for label_id in label_ids:
+            selected = annotation_labels == label_id
+            result[f"label_{label_id}"] = interval_mask(times, starts[selected], stops[selected])
+        return result
+
+    label = np.full(len(times), NO_LABEL, dtype=np.int64)
+    for label_id in sorted(label_ids, reverse=True):
+        selected = annotation_labels == label_id
+        label[interval_mask(times, starts[selected], stops[selected])] = label_id
+    result['label_id'] = label
+    return result
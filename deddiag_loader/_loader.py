@@ -1,8 +1,26 @@
+import asyncio
+import contextvars
+import time
 from pathlib import Path
-from typing import Optional, Union, List, Iterable
+from typing import TYPE_CHECKING, Dict, Optional, Union, List, Iterable, Iterator, Tuple
+import numpy as np
 import pandas as pd
 
 from ._cache import QueryCache
+from ._duckdb import DuckDBConnection
+from ._expand import ExpandedView, round_timestamp, to_epoch_us
+from ._gaps import analyze_gaps
+from ._labels import LABEL_MODES, assign_labels
+from ._local import LocalConnection
+from ._memo import memo
+from ._profile import profiler
+from ._rollup import daily_summaries, rollups_available
+from ._series import MeasurementSeries
+from ._sql import cache_key, positional, render
+from ._resample import AGGREGATION_SQL, check_aggs, interval_seconds, resample, to_frame as resample_frame
+
+if TYPE_CHECKING:
+    from ._db import AsyncConnection, Connection
 
 
 class Query:
@@ -10,53 +28,252 @@ class Query:
     Base Query functionality
 
     This may be used by inheriting from Query and overriding _QUERY.
-    parameters are passed by overriding __init__ and assigning values to the self_params dict.
+    parameters are passed by overriding __init__ and assigning values to the self._params dict.
+    Values are bound to %(name)s placeholders: they are escaped, and with the 'psql' engine the query is
+    prepared once per pooled connection and reused. {name} fields are replaced by the SQL fragments of the
+    self._sql dict, e.g. optional conditions, and must never contain values.
+    Queries run on a LocalConnection if they implement _local(). On a DuckDBConnection the same SQL runs
+    in-process, so templates must be valid in both PostgreSQL and DuckDB.
 
     Example:
         class SampleQuery(Query):
-            _QUERY = "SELECT * FROM table"
+            _QUERY = "SELECT * FROM table WHERE id = %(id)s"
     """
     _QUERY: Optional[str] = None
+    # Equivalent query on the daily rollups, used instead of _QUERY if the rollups exist
+    _ROLLUP_QUERY: Optional[str] = None
+    # SQL fragments inserted into {name} fields, set by __init__
+    _sql: Dict[str, str] = {}
+
+    ENGINES = ('psql', 'copy')
 
     def __init__(self):
         self._params = {}
 
-    def request(self, con: "Connection", cache_dir: Optional[Union[Path, str]] = None) -> pd.DataFrame:
-        q = self._format_sql()
-        if cache_dir is not None:
+    def request(self, con: "Connection", cache_dir: Optional[Union[Path, str, QueryCache]] = None,
+                engine: str = 'psql', cache_backend: str = 'pickle') -> pd.DataFrame:
+        """
+        Request query result
+        :param con: Connection
+        :param cache_dir: Query cache directory or QueryCache
+        :param engine: Fetch engine, 'psql' (pandas.read_sql_query) or 'copy' (binary COPY, fixed width columns only)
+        :param cache_backend: Storage format of the query cache, 'pickle', 'parquet' or 'arrow'.
+                              Ignored if cache_dir is a QueryCache.
+        """
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine {engine}, expected one of {self.ENGINES}")
+        if not profiler.enabled:
+            return self._request_memo(con, cache_dir, engine, cache_backend)
+        with profiler.query(type(self)), profiler.span('request') as span:
+            df = self._request_memo(con, cache_dir, engine, cache_backend)
+            span.rows = len(df)
+        return df
+
+    def _request_memo(self, con: "Connection", cache_dir: Optional[Union[Path, str, QueryCache]], engine: str,
+                      cache_backend: str) -> pd.DataFrame:
+        template = self._template(con)
+        key = cache_key(template, self._params, engine)
+        memo_key = (con.dsn, key)
+        df = memo.get(type(self), memo_key)
+        if df is None:
+            df = self._request(con, template, key, engine, self._query_cache(cache_dir, cache_backend))
+            memo.put(type(self), memo_key, df)
+        else:
+            profiler.record('memo_hit', 0., len(df))
+        return df
+
+    def request_series(self, con: "Connection", cache_dir: Optional[Union[Path, str, QueryCache]] = None,
+                       engine: str = 'psql', cache_backend: str = 'pickle', rle: bool = False) -> MeasurementSeries:
+        """
+        Request measurements of a single item as compact MeasurementSeries
+        See request() for parameters.
+        :param rle: Run-length encode the values
+        """
+        return MeasurementSeries.from_frame(self.request(con, cache_dir, engine, cache_backend), rle,
+                                            item_id=self._params.get('item_id'))
+
+    async def request_async(self, con: "AsyncConnection",
+                            cache_dir: Optional[Union[Path, str, QueryCache]] = None,
+                            cache_backend: str = 'pickle') -> pd.DataFrame:
+        """
+        Request query result without blocking the event loop
+        Results equal request(), cache files are read and written in the default executor.
+        :param con: AsyncConnection
+        :param cache_dir: Query cache directory or QueryCache
+        :param cache_backend: Storage format of the query cache, 'pickle', 'parquet' or 'arrow'.
+                              Ignored if cache_dir is a QueryCache.
+        """
+        with profiler.query(type(self)), profiler.span('request') as span:
+            template = self._template()
+            key = cache_key(template, self._params)
+            memo_key = (con.dsn, key)
+            df = memo.get(type(self), memo_key)
+            if df is not None:
+                profiler.record('memo_hit', 0., len(df))
+                return df
+            cache = self._query_cache(cache_dir, cache_backend)
+            loop = asyncio.get_event_loop()
+            if cache is not None:
+                # The executor does not run in the context of the task, which holds the query class of the spans
+                df = await loop.run_in_executor(None, contextvars.copy_context().run, self._read_cached, cache, key)
+            if df is None:
+                df = await con.from_psql(render(template, self._params))
+                if cache is not None:
+                    await loop.run_in_executor(None, contextvars.copy_context().run, self._save_cached,
+                                               cache, key, df)
+            memo.put(type(self), memo_key, df)
+            span.rows = len(df)
+        return df
+
+    def _request(self, con: "Connection", template: str, key: str, engine: str,
+                 cache: Optional[QueryCache]) -> pd.DataFrame:
+        if cache is None:
+            return self._fetch(con, template, engine)
+        df = self._read_cached(cache, key)
+        if df is not None:
+            return df
+        with cache.lock(key):
+            # Another process may have cached the query while waiting for the lock
+            df = self._read_cached(cache, key, miss=None)
+            if df is not None:
+                return df
+            df = self._fetch(con, template, engine)
+            self._save_cached(cache, key, df)
+        return df
+
+    @staticmethod
+    def _read_cached(cache: QueryCache, key: str, miss: Optional[str] = 'cache_miss') -> Optional[pd.DataFrame]:
+        """Cached result or None, recorded as cache_read or miss span"""
+        start = time.perf_counter()
+        try:
+            df = cache.read(key)
+        except FileNotFoundError:
+            if miss is not None:
+                profiler.record(miss, time.perf_counter() - start)
+            return None
+        profiler.record('cache_read', time.perf_counter() - start, len(df))
+        return df
+
+    @staticmethod
+    def _save_cached(cache: QueryCache, key: str, df: pd.DataFrame):
+        with profiler.span('cache_write') as span:
+            cache.save(key, df)
+            span.rows = len(df)
+
+    def request_iter(self, con: "Connection", chunk_rows: int = 100000,
+                     cache_dir: Optional[Union[Path, str, QueryCache]] = None,
+                     cache_backend: str = 'pickle') -> Iterator[pd.DataFrame]:
+        """
+        Request query result as DataFrame chunks of at most chunk_rows rows
+
+        Rows are streamed from a server-side cursor, so memory usage is bounded by chunk_rows
+        and not by the size of the result. Chunks are cached as they arrive if cache_dir is given.
+        :param con: Connection
+        :param chunk_rows: Maximum number of rows per chunk
+        :param cache_dir: Query cache directory or QueryCache
+        :param cache_backend: Storage format of the query cache, 'pickle', 'parquet' or 'arrow'.
+                              Ignored if cache_dir is a QueryCache.
+        """
+        template = self._template(con)
+        key = cache_key(template, self._params)
+        cache = self._query_cache(cache_dir, cache_backend)
+        if cache is None:
+            yield from self._iter(con, template, chunk_rows)
+            return
+        try:
+            chunks = cache.read_iter(key)
+        except FileNotFoundError:
+            pass
+        else:
+            yield from self._rechunk(chunks, chunk_rows)
+            return
+        with cache.lock(key):
             try:
-                return QueryCache(cache_dir).read(q)
+                chunks = cache.read_iter(key)
             except FileNotFoundError:
-                pass
-        df = con.from_psql(q)
-        if cache_dir is not None:
-            QueryCache(cache_dir).save(q, df)
-        return df
+                chunks = cache.save_iter(key, self._iter(con, template, chunk_rows))
+            yield from self._rechunk(chunks, chunk_rows)
+
+    def _iter(self, con: "Connection", template: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        if isinstance(con, LocalConnection):
+            return self._rechunk([self._local(con)], chunk_rows)
+        if isinstance(con, DuckDBConnection):
+            return con.iter_prepared(template, self._params, chunk_rows)
+        # Server-side cursors cannot be declared for EXECUTE, so values are rendered as escaped literals
+        return con.iter_psql(render(template, self._params), chunk_rows)
+
+    def _fetch(self, con: "Connection", template: str, engine: str) -> pd.DataFrame:
+        if isinstance(con, LocalConnection):
+            # Measurements are read from memory mapped files, the engine does not apply
+            return self._local(con)
+        if isinstance(con, DuckDBConnection):
+            # Values are always bound, render() writes literals in the syntax of PostgreSQL
+            return con.from_prepared(template, self._params)
+        if engine == 'copy':
+            # COPY does not accept EXECUTE, so values are rendered as escaped literals
+            return con.from_copy(render(template, self._params))
+        if positional(template)[1]:
+            return con.from_prepared(template, self._params)
+        return con.from_psql(render(template, self._params))
+
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        """Result computed from the files of a LocalConnection, equal to the result of the query"""
+        raise NotImplementedError(f"{type(self).__name__} is not supported by LocalConnection")
 
-    def _format_sql(self) -> str:
+    @staticmethod
+    def _query_cache(cache_dir: Optional[Union[Path, str, QueryCache]], cache_backend: str) -> Optional[QueryCache]:
+        if cache_dir is None or isinstance(cache_dir, QueryCache):
+            return cache_dir
+        return QueryCache(cache_dir, cache_backend)
+
+    @staticmethod
+    def _rechunk(chunks: Iterable[pd.DataFrame], chunk_rows: int) -> Iterator[pd.DataFrame]:
+        for df in chunks:
+            for i in range(0, max(len(df), 1), chunk_rows):
+                yield df.iloc[i:i + chunk_rows]
+
+    def _template(self, con: Optional["Connection"] = None) -> str:
+        """Query with placeholders, the SQL fragments of self._sql inserted"""
         if self._QUERY is None:
             raise NotImplementedError("No Query defined")
-        return self._QUERY.format(**self._params)
+        query = self._QUERY
+        if self._ROLLUP_QUERY is not None and con is not None and rollups_available(con):
+            query = self._ROLLUP_QUERY
+        # Queries formatting values into {name} fields of _QUERY are still supported, without bind parameters
+        return query.format(**{**self._params, **self._sql})
+
+    def _format_sql(self, con: Optional["Connection"] = None) -> str:
+        """Query with values rendered as escaped literals"""
+        return render(self._template(con), self._params)
 
 
 class Houses(Query):
     """Query all houses and persons information"""
     _QUERY = "SELECT * FROM houses"
 
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        return con.table('houses')
+
 
 class Items(Query):
     """Query all items"""
     _QUERY = "SELECT * FROM items"
 
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        return con.table('items')
+
 
 class AnnotationLabels(Query):
     """Query all annotation labels"""
     _QUERY = "SELECT * FROM annotation_labels"
 
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        return con.table('annotation_labels')
+
 
 class Annotations(Query):
     """Query annotation"""
-    _QUERY = "SELECT * FROM annotations WHERE item_id={item_id} " \
+    _QUERY = "SELECT * FROM annotations WHERE item_id = %(item_id)s " \
              "and start_date >= {start_date} " \
              "and stop_date <= {stop_date} " \
              "{label_ids}" \
@@ -73,23 +290,26 @@ class Annotations(Query):
         :param start_date: Start of first annotation in ISO format yyy-MM-dd'T'HH:mm:ss
         :param stop_date: End of last annotation in ISO format yyy-MM-dd'T'HH:mm:ss
         """
-        start_date = f"'{start_date}'" if start_date is not None else "to_timestamp(0)"
-        stop_date = f"'{stop_date}'" if stop_date is not None else "to_timestamp('inf')"
-
-        if label_ids is not None and not isinstance(label_ids, Iterable):
-            label_ids = [label_ids]
-
         self._params = {
             'item_id': item_id,
             'start_date': start_date,
             'stop_date': stop_date,
-            'label_ids': f"and label_id in ({','.join(map(str, label_ids))})" if label_ids is not None else ""
+            'label_ids': _id_list(label_ids)
+        }
+        self._sql = {
+            'start_date': _bound_sql(start_date, 'start_date', "to_timestamp(0)"),
+            'stop_date': _bound_sql(stop_date, 'stop_date', "'infinity'"),
+            'label_ids': _ids_filter(label_ids, "and", "label_id", "label_ids") + " "
         }
 
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        p = self._params
+        return con.annotations([p['item_id']], p['label_ids'], p['start_date'], p['stop_date'])
+
 
 class MeasurementsExpanded(Query):
     """Get second based measurements"""
-    _QUERY = "SELECT * FROM get_measurements('{item_id}','{start_date}','{stop_date}')"
+    _QUERY = "SELECT * FROM get_measurements(%(item_id)s, %(start_date)s, %(stop_date)s)"
 
     def __init__(self,
                  item_id: int,
@@ -107,14 +327,131 @@ class MeasurementsExpanded(Query):
             'stop_date': stop_date
         }
 
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        p = self._params
+        if p['start_date'] is None or p['stop_date'] is None:
+            # get_measurements() returns no rows for NULL bounds
+            return con.measurements(p['item_id'], 0, 0)
+        query = MeasurementsExpandedClient(p['item_id'], p['start_date'], p['stop_date'])
+        return query._view(query._local(con)).to_frame()
+
+
+class MeasurementsExpandedClient(Query):
+    """Get second based measurements, expanded on the client"""
+    _QUERY = """
+    (SELECT * FROM measurements
+     WHERE item_id = %(item_id)s and time <= %(start_date)s
+     ORDER BY time DESC
+     LIMIT 1)
+    UNION ALL
+    (SELECT * FROM measurements
+     WHERE item_id = %(item_id)s and time > %(start_date)s and time <= %(stop_date)s
+     ORDER BY time)
+    """
+
+    def __init__(self,
+                 item_id: int,
+                 start_date: str,
+                 stop_date: str):
+        """
+        Get measurement at every second for given item_id, equal to MeasurementsExpanded
+
+        Only the change points stored in the measurements table are queried and cached, the values at every
+        second are forward filled on the client. Naive dates are interpreted as UTC.
+        :param item_id: item_id
+        :param start_date: First measurement
+        :param stop_date: Last measurement
+        """
+        self._item_id = item_id
+        self._start = round_timestamp(start_date)
+        self._stop = round_timestamp(stop_date)
+        self._params = {
+            'item_id': item_id,
+            'start_date': self._start.isoformat(),
+            'stop_date': self._stop.isoformat()
+        }
+
+    def __len__(self) -> int:
+        """Number of seconds"""
+        return int((self._stop - self._start).total_seconds()) + 1
+
+    def request(self, con: "Connection", cache_dir: Optional[Union[Path, str, QueryCache]] = None,
+                engine: str = 'psql', cache_backend: str = 'pickle') -> pd.DataFrame:
+        return self.request_view(con, cache_dir, engine, cache_backend).to_frame()
+
+    def request_view(self, con: "Connection", cache_dir: Optional[Union[Path, str, QueryCache]] = None,
+                     engine: str = 'psql', cache_backend: str = 'pickle') -> ExpandedView:
+        """
+        Request measurements as lazy view, values are only computed for the accessed seconds
+        See request() for parameters.
+        """
+        return self._view(super().request(con, cache_dir, engine, cache_backend))
+
+    def request_series(self, con: "Connection", cache_dir: Optional[Union[Path, str, QueryCache]] = None,
+                       engine: str = 'psql', cache_backend: str = 'pickle', rle: bool = False) -> MeasurementSeries:
+        """
+        Request measurements as compact MeasurementSeries, with rle the values are never expanded
+        See request() for parameters.
+        """
+        return MeasurementSeries.from_view(self.request_view(con, cache_dir, engine, cache_backend), rle)
+
+    async def request_async(self, con: "AsyncConnection",
+                            cache_dir: Optional[Union[Path, str, QueryCache]] = None,
+                            cache_backend: str = 'pickle') -> pd.DataFrame:
+        return self._view(await super().request_async(con, cache_dir, cache_backend)).to_frame()
+
+    def request_iter(self, con: "Connection", chunk_rows: int = 100000,
+                     cache_dir: Optional[Union[Path, str, QueryCache]] = None,
+                     cache_backend: str = 'pickle') -> Iterator[pd.DataFrame]:
+        """
+        Request measurements as DataFrame chunks of at most chunk_rows seconds
+        Change points are streamed and expanded chunk by chunk, see Query.request_iter.
+        """
+        start = int(self._start.value // 1000)
+        length = len(self)
+        times = np.empty(0, dtype=np.int64)
+        values = np.empty(0, dtype=np.float64)
+        emitted = 0
+        for df in super().request_iter(con, chunk_rows, cache_dir, cache_backend):
+            times = np.concatenate([times, to_epoch_us(df['time'])])
+            values = np.concatenate([values, df['value'].to_numpy(dtype=np.float64)])
+            if not len(times):
+                continue
+            view = ExpandedView(self._item_id, times, values, start, length)
+            # Seconds before the last change point are not affected by later change points
+            limit = min(max(int(view._positions[-1]), emitted), length)
+            for a in range(emitted, limit, chunk_rows):
+                yield view.to_frame(a, min(a + chunk_rows, limit))
+            emitted = limit
+            keep = max(np.searchsorted(view._positions, emitted, side='right') - 1, 0)
+            times, values = times[keep:], values[keep:]
+        view = ExpandedView(self._item_id, times, values, start, length)
+        for a in range(emitted, length, chunk_rows):
+            yield view.to_frame(a, min(a + chunk_rows, length))
+        if length == 0:
+            yield view.to_frame()
+
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        # The last change point at or before start and all until stop
+        a, b = con.search(self._item_id, self._start, self._stop, closed='right')
+        return con.measurements(self._item_id, max(a - 1, 0), b)
+
+    def _view(self, change_points: pd.DataFrame) -> ExpandedView:
+        times = to_epoch_us(change_points['time'])
+        values = change_points['value'].to_numpy()
+        if len(times) > 1 and np.any(times[1:] < times[:-1]):
+            order = np.argsort(times, kind='stable')
+            times, values = times[order], values[order]
+        return ExpandedView(self._item_id, times, values, int(self._start.value // 1000), len(self))
+
 
 class Measurements(Query):
     """Get second based measurements"""
     _QUERY = """
     SELECT * FROM measurements 
-    WHERE item_id = '{item_id}' and time between '{start_date}' and '{stop_date}'
+    WHERE item_id = %(item_id)s and time between {start_date} and {stop_date}
     ORDER by time
-    LIMIT {limit}
+    LIMIT %(limit)s
     """
 
     def __init__(self, item_id: int,
@@ -124,16 +461,52 @@ class Measurements(Query):
         """
         Get measurement at every second for given item_id
         :param item_id: item_id
-        :param start_date: First measurement
-        :param stop_date: Last measurement
+        :param start_date: First measurement, unbounded if None
+        :param stop_date: Last measurement, unbounded if None
+        :param limit: Maximum number of rows, all rows if None
         """
         self._params = {
             'item_id': item_id,
             'start_date': start_date,
             'stop_date': stop_date,
-            'limit': 'ALL' if limit is None else limit
+            'limit': limit
+        }
+        self._sql = {
+            'start_date': _bound_sql(start_date, 'start_date', "'-infinity'"),
+            'stop_date': _bound_sql(stop_date, 'stop_date', "'infinity'")
         }
 
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        p = self._params
+        a, b = con.search(p['item_id'], p['start_date'], p['stop_date'])
+        if p['limit'] is not None:
+            b = min(b, a + p['limit'])
+        return con.measurements(p['item_id'], a, b)
+
+
+class MeasurementsSince(Query):
+    """Get measurements after a given time"""
+    _QUERY = """
+    SELECT * FROM measurements
+    WHERE item_id = %(item_id)s and time > %(since)s
+    ORDER by time
+    """
+
+    def __init__(self, item_id: int, since: Optional[str] = None):
+        """
+        Get measurements of given item_id with time > since, used for incremental loading
+        :param item_id: item_id
+        :param since: Exclusive lower bound of time, all measurements if None
+        """
+        self._params = {
+            'item_id': item_id,
+            'since': '-infinity' if since is None else since
+        }
+
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        a, b = con.search(self._params['item_id'], self._params['since'], closed='right')
+        return con.measurements(self._params['item_id'], a, b)
+
 
 class MeasurementsExpandedWithLabels(Query):
     """Get second based measurements and available annotation labels at each time step"""
@@ -141,7 +514,7 @@ class MeasurementsExpandedWithLabels(Query):
              "(SELECT count(label_id) FROM annotations " \
              "WHERE item_id = q0.item_id {label_ids} " \
              "and (annotations.start_date <= q0.time and q0.time <= annotations.stop_date)) > 0 as labels " \
-             "FROM get_measurements('{item_id}','{start_date}','{stop_date}') q0"
+             "FROM get_measurements(%(item_id)s, %(start_date)s, %(stop_date)s) q0"
 
     def __init__(self,
                  item_id: int,
@@ -157,22 +530,296 @@ class MeasurementsExpandedWithLabels(Query):
         :param start_date: First measurement
         :param stop_date: Last measurement
         """
+        self._params = {
+            'item_id': item_id,
+            'label_ids': _id_list(label_ids),
+            'start_date': start_date,
+            'stop_date': stop_date
+        }
+        self._sql = {
+            'label_ids': _ids_filter(label_ids, "and", "label_id", "label_ids")
+        }
+
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        p = self._params
+        measurements = MeasurementsExpanded(p['item_id'], p['start_date'], p['stop_date'])._local(con)
+        return assign_labels(measurements, con.annotations([p['item_id']], p['label_ids']))
+
+
+class MeasurementsExpandedWithLabelsClient(Query):
+    """Get second based measurements and annotation labels at each time step, joined on the client"""
+
+    def __init__(self,
+                 item_id: int,
+                 label_ids: Optional[Union[List[int], int]],
+                 start_date: str,
+                 stop_date: str,
+                 mode: str = 'mask'
+                 ):
+        """
+        Get second based measurements and labels at each time step
+
+        Measurements are expanded by MeasurementsExpandedClient, annotations are queried by Annotations and
+        assigned with a vectorized interval join instead of a subquery per second.
+        With mode 'mask' the result equals MeasurementsExpandedWithLabels, see assign_labels for the other modes.
+        :param item_id: item_id
+        :param label_ids: List of label ids as integers or None
+        :param start_date: First measurement
+        :param stop_date: Last measurement
+        :param mode: 'mask', 'multi_hot' or 'label_id'
+        """
+        if mode not in LABEL_MODES:
+            raise ValueError(f"Unknown label mode {mode}, expected one of {LABEL_MODES}")
         if label_ids is not None and not isinstance(label_ids, Iterable):
             label_ids = [label_ids]
+        self.measurements = MeasurementsExpandedClient(item_id, start_date, stop_date)
+        self.annotations = Annotations(item_id, label_ids)
+        self.label_ids = label_ids
+        self.mode = mode
+        self._params = {}
+
+    def request(self, con: "Connection", cache_dir: Optional[Union[Path, str, QueryCache]] = None,
+                engine: str = 'psql', cache_backend: str = 'pickle') -> pd.DataFrame:
+        annotations = self.annotations.request(con, cache_dir, cache_backend=cache_backend)
+        measurements = self.measurements.request(con, cache_dir, engine, cache_backend)
+        return assign_labels(measurements, annotations, self.mode, self.label_ids)
+
+    async def request_async(self, con: "AsyncConnection",
+                            cache_dir: Optional[Union[Path, str, QueryCache]] = None,
+                            cache_backend: str = 'pickle') -> pd.DataFrame:
+        annotations, measurements = await asyncio.gather(
+            self.annotations.request_async(con, cache_dir, cache_backend),
+            self.measurements.request_async(con, cache_dir, cache_backend))
+        return assign_labels(measurements, annotations, self.mode, self.label_ids)
+
+    def request_iter(self, con: "Connection", chunk_rows: int = 100000,
+                     cache_dir: Optional[Union[Path, str, QueryCache]] = None,
+                     cache_backend: str = 'pickle') -> Iterator[pd.DataFrame]:
+        """
+        Request measurements with labels as DataFrame chunks of at most chunk_rows seconds
+        See Query.request_iter
+        """
+        annotations = self.annotations.request(con, cache_dir, cache_backend=cache_backend)
+        for df in self.measurements.request_iter(con, chunk_rows, cache_dir, cache_backend):
+            yield assign_labels(df, annotations, self.mode, self.label_ids)
+
+
+class MeasurementsResampled(Query):
+    """Get time weighted aggregates of measurements in fixed intervals, aggregated on the database"""
+    _QUERY = """
+    WITH
+     points AS (
+      (SELECT time, value FROM measurements
+       WHERE item_id = %(item_id)s and time <= {start_date}
+       ORDER BY time DESC
+       LIMIT 1)
+      UNION ALL
+      (SELECT time, value FROM measurements
+       WHERE item_id = %(item_id)s and time > {start_date} and time < {stop_date})),
+     segments AS (
+      SELECT extract(epoch FROM greatest(time, {start_date}))::float8 AS t0,
+             extract(epoch FROM coalesce(lead(time) OVER (ORDER BY time), {stop_date}))::float8 AS t1,
+             value
+      FROM points),
+     pieces AS (
+      SELECT k, value, least(t1, (k + 1) * {interval}) - greatest(t0, k * {interval}) AS dur
+      FROM segments,
+       generate_series(floor(t0 / {interval})::bigint, greatest(ceil(t1 / {interval})::bigint - 1,
+                                                                floor(t0 / {interval})::bigint)) AS g(k)
+      WHERE t1 >= t0)
+    SELECT %(item_id)s::integer AS item_id, to_timestamp(k * {interval}) AS time, {aggs}
+    FROM pieces
+    GROUP BY k
+    HAVING sum(dur) > 0
+    ORDER BY k
+    """
 
+    def __init__(self,
+                 item_id: int,
+                 interval: Union[str, pd.Timedelta],
+                 aggs: Iterable[str] = ('mean', 'max', 'energy'),
+                 start_date: Optional[str] = None,
+                 stop_date: Optional[str] = None):
+        """
+        Aggregate measurements of given item_id in intervals aligned to the epoch (UTC)
+
+        Measurements are a step function, each value holds until the next measurement. mean is weighted by
+        the duration of each value, min and max are taken over all values in effect within the interval and
+        energy is the integral in Wh. Only [start_date, stop_date) is aggregated, intervals without
+        measurements in effect are omitted.
+        :param item_id: item_id
+        :param interval: Interval length in whole seconds, e.g. '1min' or '15min'
+        :param aggs: Aggregations, any of 'mean', 'min', 'max' and 'energy'
+        :param start_date: Start of the first interval, first measurement if None
+        :param stop_date: End of the last interval (exclusive), last measurement if None
+        """
+        self._item_id = item_id
+        self._interval = interval_seconds(interval)
+        self._aggs = check_aggs(aggs)
+        self._start = None if start_date is None else pd.Timestamp(start_date)
+        self._stop = None if stop_date is None else pd.Timestamp(stop_date)
         self._params = {
             'item_id': item_id,
-            'label_ids': f"and label_id in ({','.join(map(str, label_ids))})" if label_ids is not None else "",
-            'start_date': start_date,
-            'stop_date': stop_date
+            'interval': self._interval,
+            'start_date': self._bound(self._start),
+            'stop_date': self._bound(self._stop),
         }
+        self._sql = {
+            'interval': "%(interval)s::integer",
+            'aggs': ', '.join(AGGREGATION_SQL[agg] for agg in self._aggs),
+            'start_date': self._bound_sql('start_date', 'min'),
+            'stop_date': self._bound_sql('stop_date', 'max'),
+        }
+
+    @staticmethod
+    def _bound(t: Optional[pd.Timestamp]) -> Optional[str]:
+        if t is None:
+            return None
+        if t.tzinfo is None:
+            t = t.tz_localize('UTC')
+        return t.isoformat()
+
+    def _bound_sql(self, name: str, func: str) -> str:
+        if self._params[name] is None:
+            return f"(SELECT {func}(time) FROM measurements WHERE item_id = %(item_id)s)"
+        return f"%({name})s::timestamptz"
+
+    def _range(self, bounds: Optional[pd.DataFrame]) -> Tuple[int, int]:
+        """Range [start, stop) in microseconds since epoch, missing dates from the bounds of the item"""
+        start, stop = self._start, self._stop
+        if bounds is not None:
+            start = bounds['min_date'].iloc[0] if start is None else start
+            stop = bounds['max_date'].iloc[0] if stop is None else stop
+        if start is None or stop is None or pd.isna(start) or pd.isna(stop):
+            return 0, 0
+        start_us, stop_us = (int((t.tz_localize('UTC') if t.tzinfo is None else t).value // 1000)
+                             for t in (pd.Timestamp(start), pd.Timestamp(stop)))
+        return start_us, stop_us
+
+    def _local_rows(self, con: LocalConnection) -> Tuple[int, int, int, int]:
+        """Range [start, stop) and rows [a, b) of the change points in effect within it"""
+        start, stop = self._range(con.bounds(self._item_id))
+        times = con.columns(self._item_id)[0]
+        a = max(int(np.searchsorted(times, start, side='right')) - 1, 0)
+        b = max(int(np.searchsorted(times, stop, side='left')), a)
+        return start, stop, a, b
+
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        start, stop, a, b = self._local_rows(con)
+        times, values = con.columns(self._item_id)
+        result = resample(np.asarray(times[a:b]), np.asarray(values[a:b], dtype=np.float64), start, stop,
+                          self._interval, self._aggs)
+        return resample_frame(self._item_id, result, self._aggs)
+
+
+class MeasurementsResampledClient(MeasurementsResampled):
+    """Get time weighted aggregates of measurements in fixed intervals, aggregated on the client"""
+    _QUERY = """
+    (SELECT * FROM measurements
+     WHERE item_id = %(item_id)s and time <= {start_date}
+     ORDER BY time DESC
+     LIMIT 1)
+    UNION ALL
+    (SELECT * FROM measurements
+     WHERE item_id = %(item_id)s and time > {start_date} and time < {stop_date}
+     ORDER BY time)
+    """
+    _BOUNDS_QUERY = "SELECT min(time) AS min_date, max(time) AS max_date FROM measurements WHERE item_id = %(item_id)s"
+
+    def __init__(self,
+                 item_id: int,
+                 interval: Union[str, pd.Timedelta],
+                 aggs: Iterable[str] = ('mean', 'max', 'energy'),
+                 start_date: Optional[str] = None,
+                 stop_date: Optional[str] = None):
+        """
+        Aggregate measurements of given item_id, equal to MeasurementsResampled
+
+        Only the change points within the range are queried and aggregated on the client, request_iter
+        streams them, so memory is bounded independent of the range.
+        See MeasurementsResampled for parameters.
+        """
+        super().__init__(item_id, interval, aggs, start_date, stop_date)
+
+    def request(self, con: "Connection", cache_dir: Optional[Union[Path, str, QueryCache]] = None,
+                engine: str = 'psql', cache_backend: str = 'pickle') -> pd.DataFrame:
+        start, stop = self._bounds(con)
+        return self._resample(super().request(con, cache_dir, engine, cache_backend), start, stop)
+
+    def request_iter(self, con: "Connection", chunk_rows: int = 100000,
+                     cache_dir: Optional[Union[Path, str, QueryCache]] = None,
+                     cache_backend: str = 'pickle') -> Iterator[pd.DataFrame]:
+        """
+        Request aggregates as DataFrame chunks
+        Change points are streamed in chunks of chunk_rows rows, intervals ending before the last change point
+        received are aggregated and emitted chunk by chunk, see Query.request_iter.
+        """
+        start, stop = self._bounds(con)
+        step = self._interval * 1000000
+        times = np.empty(0, dtype=np.int64)
+        values = np.empty(0, dtype=np.float64)
+        done = start
+        emitted = False
+        for df in super().request_iter(con, chunk_rows, cache_dir, cache_backend):
+            times = np.concatenate([times, to_epoch_us(df['time'])])
+            values = np.concatenate([values, df['value'].to_numpy(dtype=np.float64)])
+            if not len(times):
+                continue
+            # Intervals ending at or before the last change point are not affected by later change points
+            limit = min(times[-1] // step * step, stop)
+            if limit <= done:
+                continue
+            result = resample(times, values, done, limit, self._interval, self._aggs)
+            if len(result['time']):
+                emitted = True
+                yield resample_frame(self._item_id, result, self._aggs)
+            done = limit
+            keep = max(np.searchsorted(times, done, side='right') - 1, 0)
+            times, values = times[keep:], values[keep:]
+        result = resample(times, values, done, stop, self._interval, self._aggs)
+        if len(result['time']) or not emitted:
+            yield resample_frame(self._item_id, result, self._aggs)
+
+    async def request_async(self, con: "AsyncConnection",
+                            cache_dir: Optional[Union[Path, str, QueryCache]] = None,
+                            cache_backend: str = 'pickle') -> pd.DataFrame:
+        bounds = None
+        if self._start is None or self._stop is None:
+            bounds = await con.from_psql(render(self._BOUNDS_QUERY, self._params))
+        start, stop = self._range(bounds)
+        change_points = await super().request_async(con, cache_dir, cache_backend)
+        return self._resample(change_points, start, stop)
+
+    def _resample(self, change_points: pd.DataFrame, start: int, stop: int) -> pd.DataFrame:
+        times = to_epoch_us(change_points['time'])
+        values = change_points['value'].to_numpy()
+        if len(times) > 1 and np.any(times[1:] < times[:-1]):
+            order = np.argsort(times, kind='stable')
+            times, values = times[order], values[order]
+        return resample_frame(self._item_id, resample(times, values, start, stop, self._interval, self._aggs),
+                              self._aggs)
+
+    def _bounds(self, con: "Connection") -> Tuple[int, int]:
+        bounds = None
+        if isinstance(con, LocalConnection):
+            bounds = con.bounds(self._item_id)
+        elif self._start is None or self._stop is None:
+            bounds = con.from_prepared(self._BOUNDS_QUERY, self._params)
+        return self._range(bounds)
+
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        _, _, a, b = self._local_rows(con)
+        return con.measurements(self._item_id, a, b)
 
 
 class MeasurementsRange(Query):
     """Range of measurements for given item_id"""
     _QUERY = "SELECT DISTINCT round_timestamp(min(time)) as min_date, " \
              "round_timestamp(max(time)) as max_date " \
-             "FROM measurements WHERE item_id='{item_id}'"
+             "FROM measurements WHERE item_id = %(item_id)s"
+    _ROLLUP_QUERY = "SELECT DISTINCT round_timestamp(min(first_time)) as min_date, " \
+                    "round_timestamp(max(last_time)) as max_date " \
+                    "FROM measurements_daily WHERE item_id = %(item_id)s"
 
     def __init__(self, item_id: int):
         """
@@ -183,22 +830,27 @@ class MeasurementsRange(Query):
             'item_id': item_id
         }
 
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        bounds = con.bounds(self._params['item_id'])
+        # round_timestamp()
+        return pd.DataFrame({c: (bounds[c] + pd.Timedelta(milliseconds=500)).dt.floor('s') for c in bounds})
+
 
 class MeasurementsMissing(Query):
 
     _QUERY = """
     with
-     v_min_max as (SELECT DISTINCT max(time) - min(time) as time_total FROM measurements WHERE item_id={item_id}),
-     v_lag as (SELECT time, time - LAG(time) OVER (ORDER BY time) as time_diff FROM measurements WHERE item_id={item_id})
+     v_min_max as (SELECT DISTINCT max(time) - min(time) as time_total FROM measurements WHERE item_id=%(item_id)s),
+     v_lag as (SELECT time, time - LAG(time) OVER (ORDER BY time) as time_diff FROM measurements WHERE item_id=%(item_id)s)
     SELECT 
         DISTINCT
-       {item_id} as item_id,
+       %(item_id)s::integer as item_id,
        v_min_max.time_total,
        v_lag.time_diff
     FROM 
      v_min_max,
      v_lag
-    WHERE time_diff > '{threshold}'
+    WHERE time_diff > %(threshold)s
     """
 
     def __init__(self, item_id: int, threshold: str = '1hour 5min'):
@@ -211,18 +863,29 @@ class MeasurementsMissing(Query):
             'threshold': threshold
         }
 
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        times = np.asarray(con.columns(self._params['item_id'])[0])
+        diffs = np.diff(times)
+        diffs = np.unique(diffs[diffs > pd.Timedelta(self._params['threshold']).value // 1000])
+        total = times[-1] - times[0] if len(times) else 0
+        return pd.DataFrame({
+            'item_id': np.full(len(diffs), self._params['item_id'], dtype=np.int64),
+            'time_total': np.full(len(diffs), total, dtype=np.int64).view('timedelta64[us]'),
+            'time_diff': diffs.view('timedelta64[us]'),
+        })
+
 
 class MeasurementsMissingTotal(Query):
 
     _QUERY = """
     with
-     v_min_max as (SELECT DISTINCT max(time) - min(time) as time_total FROM measurements WHERE item_id={item_id}),
-     v_lag as (SELECT time, time - LAG(time) OVER (ORDER BY time) as time_diff FROM measurements WHERE item_id={item_id}),
+     v_min_max as (SELECT DISTINCT max(time) - min(time) as time_total FROM measurements WHERE item_id=%(item_id)s),
+     v_lag as (SELECT time, time - LAG(time) OVER (ORDER BY time) as time_diff FROM measurements WHERE item_id=%(item_id)s),
      v_hour_missing as (SELECT DISTINCT sum(EXTRACT(EPOCH FROM time_diff)) as missing FROM v_lag WHERE time_diff > '1hour 5sec'),
      v_day_missing as (SELECT DISTINCT sum(EXTRACT(EPOCH FROM time_diff)) as missing FROM v_lag WHERE time_diff > '1 day')
     SELECT 
         DISTINCT
-       {item_id} as item_id,
+       %(item_id)s::integer as item_id,
        v_min_max.time_total,
        COALESCE(v_hour_missing.missing, 0) / EXTRACT(EPOCH FROM v_min_max.time_total) as perc_missing_hour,
        COALESCE(v_day_missing.missing, 0) / EXTRACT(EPOCH FROM v_min_max.time_total) as perc_missing_day
@@ -231,6 +894,15 @@ class MeasurementsMissingTotal(Query):
      v_hour_missing,
      v_day_missing;
     """
+    _ROLLUP_QUERY = """
+    SELECT
+       %(item_id)s::integer as item_id,
+       max(last_time) - min(first_time) as time_total,
+       sum(gap_hour_seconds) / NULLIF(EXTRACT(EPOCH FROM max(last_time) - min(first_time)), 0) as perc_missing_hour,
+       sum(gap_day_seconds) / NULLIF(EXTRACT(EPOCH FROM max(last_time) - min(first_time)), 0) as perc_missing_day
+    FROM measurements_daily
+    WHERE item_id = %(item_id)s
+    """
 
     def __init__(self, item_id: int):
         """
@@ -240,3 +912,214 @@ class MeasurementsMissingTotal(Query):
         self._params = {
             'item_id': item_id
         }
+
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        times = con.columns(self._params['item_id'])[0]
+        return analyze_gaps([times]).missing_total(self._params['item_id'])
+
+
+class MeasurementsDaily(Query):
+    """Daily summaries of measurements, see refresh_rollups"""
+    _QUERY = "SELECT * FROM measurements_daily {item_ids} ORDER BY item_id, day"
+
+    def __init__(self, item_ids: Optional[List[int]] = None):
+        """
+        Per item and day (UTC) first and last time, count, maximum gap, seconds of gaps > 1 hour 5 seconds
+        and > 1 day and energy in Wh
+        :param item_ids: list of item_ids. If None all items are returned
+        """
+        self._params = {
+            'item_ids': _id_list(item_ids)
+        }
+        self._sql = {
+            'item_ids': _ids_filter(item_ids, "WHERE")
+        }
+
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        return _concat([daily_summaries(i, *con.columns(i)) for i in _local_items(con, self._params['item_ids'])],
+                       ['item_id', 'day', 'first_time', 'last_time', 'count', 'max_gap_seconds', 'gap_hour_seconds',
+                        'gap_day_seconds', 'energy_wh'])
+
+
+def _local_items(con: LocalConnection, item_ids: Optional[List[int]]) -> List[int]:
+    """Sorted item_ids with measurements, all items if item_ids is None"""
+    available = con.item_ids()
+    return available if item_ids is None else sorted(set(item_ids).intersection(available))
+
+
+def _concat(frames: List[pd.DataFrame], columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Rows of frames, frames of no rows keep the columns and dtypes of the result"""
+    frames = [df for df in frames if len(df)] or frames[:1]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _id_list(ids: Optional[Union[List[int], int]]) -> Optional[List[int]]:
+    """ids as list of int, None if ids is None"""
+    if ids is None:
+        return None
+    if not isinstance(ids, Iterable):
+        ids = [ids]
+    return [int(i) for i in ids]
+
+
+def _ids_filter(ids: Optional[Union[List[int], int]], prefix: str, column: str = "item_id",
+                param: str = "item_ids") -> str:
+    """SQL condition restricting column to the ids bound to param, empty if ids is None"""
+    if ids is None:
+        return ""
+    return f"{prefix} {column} = ANY(%({param})s)"
+
+
+def _bound_sql(date: Optional[str], param: str, default: str) -> str:
+    """Placeholder of the date bound to param, default SQL if date is None"""
+    return default if date is None else f"%({param})s"
+
+
+class AnnotationsBatch(Query):
+    """Query annotations of several items"""
+    _QUERY = "SELECT * FROM annotations WHERE start_date >= {start_date} " \
+             "and stop_date <= {stop_date} " \
+             "{item_ids} " \
+             "{label_ids} " \
+             "ORDER BY item_id, start_date"
+
+    def __init__(self, item_ids: Optional[List[int]] = None,
+                 label_ids: Optional[List[int]] = None,
+                 start_date: Optional[str] = None,
+                 stop_date: Optional[str] = None):
+        """
+        Query annotations of given items in a single query
+        :param item_ids: list of item_ids. If None annotations of all items are returned
+        :param label_ids: list of label_ids associated with annotation. If None all annotations are returned
+        :param start_date: Start of first annotation in ISO format yyy-MM-dd'T'HH:mm:ss
+        :param stop_date: End of last annotation in ISO format yyy-MM-dd'T'HH:mm:ss
+        """
+        self._params = {
+            'item_ids': _id_list(item_ids),
+            'start_date': start_date,
+            'stop_date': stop_date,
+            'label_ids': _id_list(label_ids)
+        }
+        self._sql = {
+            'item_ids': _ids_filter(item_ids, "and"),
+            'start_date': _bound_sql(start_date, 'start_date', "to_timestamp(0)"),
+            'stop_date': _bound_sql(stop_date, 'stop_date', "'infinity'"),
+            'label_ids': _ids_filter(label_ids, "and", "label_id", "label_ids")
+        }
+
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        p = self._params
+        return con.annotations(p['item_ids'], p['label_ids'], p['start_date'], p['stop_date'])
+
+
+class MeasurementsRangeBatch(Query):
+    """Range of measurements of several items"""
+    _QUERY = "SELECT item_id, round_timestamp(min(time)) as min_date, " \
+             "round_timestamp(max(time)) as max_date " \
+             "FROM measurements {item_ids} " \
+             "GROUP BY item_id ORDER BY item_id"
+    _ROLLUP_QUERY = "SELECT item_id, round_timestamp(min(first_time)) as min_date, " \
+                    "round_timestamp(max(last_time)) as max_date " \
+                    "FROM measurements_daily {item_ids} " \
+                    "GROUP BY item_id ORDER BY item_id"
+
+    def __init__(self, item_ids: Optional[List[int]] = None):
+        """
+        Range of measurements of given items in a single pass, one row per item_id
+        :param item_ids: list of item_ids. If None all items are returned
+        """
+        self._params = {
+            'item_ids': _id_list(item_ids)
+        }
+        self._sql = {
+            'item_ids': _ids_filter(item_ids, "WHERE")
+        }
+
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        columns = ['item_id', 'min_date', 'max_date']
+        return _concat([MeasurementsRange(i)._local(con).assign(item_id=i)[columns]
+                        for i in _local_items(con, self._params['item_ids'])], columns)
+
+
+class MeasurementsMissingBatch(Query):
+
+    _QUERY = """
+    with
+     v_lag as (SELECT item_id, time, time - LAG(time) OVER (PARTITION BY item_id ORDER BY time) as time_diff
+               FROM measurements {item_ids}),
+     v_min_max as (SELECT item_id, max(time) - min(time) as time_total FROM v_lag GROUP BY item_id)
+    SELECT
+        DISTINCT
+       item_id,
+       v_min_max.time_total,
+       v_lag.time_diff
+    FROM
+     v_lag JOIN v_min_max USING (item_id)
+    WHERE time_diff > %(threshold)s
+    ORDER BY item_id, time_diff
+    """
+
+    def __init__(self, item_ids: Optional[List[int]] = None, threshold: str = '1hour 5min'):
+        """
+        Gaps between measurements larger than threshold of given items in a single pass
+        :param item_ids: list of item_ids. If None all items are returned
+        :param threshold: Minimum gap as PostgreSQL interval
+        """
+        self._params = {
+            'item_ids': _id_list(item_ids),
+            'threshold': threshold
+        }
+        self._sql = {
+            'item_ids': _ids_filter(item_ids, "WHERE")
+        }
+
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        return _concat([MeasurementsMissing(i, self._params['threshold'])._local(con)
+                        for i in _local_items(con, self._params['item_ids'])], ['item_id', 'time_total', 'time_diff'])
+
+
+class MeasurementsMissingTotalBatch(Query):
+
+    _QUERY = """
+    with
+     v_lag as (SELECT item_id, time, time - LAG(time) OVER (PARTITION BY item_id ORDER BY time) as time_diff
+               FROM measurements {item_ids})
+    SELECT
+       item_id,
+       max(time) - min(time) as time_total,
+       COALESCE(sum(EXTRACT(EPOCH FROM time_diff)) FILTER (WHERE time_diff > '1hour 5sec'), 0)
+        / NULLIF(EXTRACT(EPOCH FROM max(time) - min(time)), 0) as perc_missing_hour,
+       COALESCE(sum(EXTRACT(EPOCH FROM time_diff)) FILTER (WHERE time_diff > '1 day'), 0)
+        / NULLIF(EXTRACT(EPOCH FROM max(time) - min(time)), 0) as perc_missing_day
+    FROM v_lag
+    GROUP BY item_id
+    ORDER BY item_id
+    """
+    _ROLLUP_QUERY = """
+    SELECT
+       item_id,
+       max(last_time) - min(first_time) as time_total,
+       sum(gap_hour_seconds) / NULLIF(EXTRACT(EPOCH FROM max(last_time) - min(first_time)), 0) as perc_missing_hour,
+       sum(gap_day_seconds) / NULLIF(EXTRACT(EPOCH FROM max(last_time) - min(first_time)), 0) as perc_missing_day
+    FROM measurements_daily {item_ids}
+    GROUP BY item_id
+    ORDER BY item_id
+    """
+
+    def __init__(self, item_ids: Optional[List[int]] = None):
+        """
+        Missing measurements of given items in a single pass, one row per item_id
+        :param item_ids: list of item_ids. If None all items are returned
+        """
+        self._params = {
+            'item_ids': _id_list(item_ids)
+        }
+        self._sql = {
+            'item_ids': _ids_filter(item_ids, "WHERE")
+        }
+
+    def _local(self, con: LocalConnection) -> pd.DataFrame:
+        return _concat([MeasurementsMissingTotal(i)._local(con) for i in _local_items(con, self._params['item_ids'])],
+                       ['item_id', 'time_total', 'perc_missing_hour', 'perc_missing_day'])
@@ -0,0 +1,310 @@
+"""Local copy of the dataset in columnar files, queried by LocalConnection without a database"""
+import gzip
+import re
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from ._expand import to_epoch_us
+
+if TYPE_CHECKING:
+    from ._db import Connection
+
+TABLES = ('houses', 'items', 'annotation_labels', 'annotations')
+# Columns of the tables without header in the TSV dump
+_COLUMNS = {
+    'houses': ['id', 'persons'],
+    'items': ['id', 'house', 'name', 'category'],
+    'annotation_labels': ['id', 'name'],
+    'annotations': ['id', 'item_id', 'label_id', 'start_date', 'stop_date'],
+    'measurements': ['item_id', 'time', 'value'],
+}
+_DATES = {'annotations': ('start_date', 'stop_date')}
+# Table of each file of the TSV dump, by file name
+_DUMP_FILES = (
+    ('annotation_labels', re.compile(r'annotation_labels')),
+    ('annotations', re.compile(r'annotations')),
+    ('measurements', re.compile(r'_data\b|measurements')),
+    ('items', re.compile(r'^items\b')),
+    ('houses', re.compile(r'^house')),
+)
+
+TimeLike = Union[str, pd.Timestamp, None]
+
+
+class LocalConnection:
+    """
+    Local copy of the dataset, used in place of Connection to run the same queries without a database
+
+    The directory holds one CSV file per table and the measurements of each item sorted by time in
+    measurements/<item_id>/time.npy (int64 microseconds since epoch, UTC) and value.npy (float32).
+    Measurement files are memory mapped and time ranges are found by binary search on time.npy, so a query
+    only reads the pages of the requested rows. Convert the dataset once with convert_database or convert_dump.
+
+    Examples
+    --------
+    >>> con = LocalConnection("deddiag_local")
+    >>> Measurements(10, "2017-01-01", "2017-02-01").request(con)
+    """
+    # Queries are never answered from rollups, the summaries are computed from the files
+    use_rollups = False
+
+    def __init__(self, directory: Union[Path, str]):
+        """
+        :param directory: Directory written by convert_database or convert_dump
+        """
+        self.directory = Path(directory)
+        if not (self.directory / "items.csv").exists():
+            raise FileNotFoundError(f"{self.directory} is not a local copy of the dataset, items.csv is missing")
+        self._tables: Dict[str, pd.DataFrame] = {}
+        self._columns: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def dsn(self) -> str:
+        """Identifies the local copy"""
+        return f"local:{self.directory.resolve()}"
+
+    @contextmanager
+    def statement_timeout(self, seconds: Optional[float]):
+        """Timeouts are not enforced on local files, see Connection.statement_timeout"""
+        yield
+
+    def table(self, name: str) -> pd.DataFrame:
+        """Copy of the table name, read once"""
+        with self._lock:
+            if name not in self._tables:
+                self._tables[name] = _read_table(self.directory / f"{name}.csv", name)
+        return self._tables[name].copy()
+
+    def item_ids(self) -> List[int]:
+        """Sorted ids of the items with measurements"""
+        directory = self.directory / "measurements"
+        if not directory.exists():
+            return []
+        return sorted(int(p.name) for p in directory.iterdir() if (p / "time.npy").exists())
+
+    def columns(self, item_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Memory mapped times and values of the measurements of item_id, empty if there are none"""
+        item_id = int(item_id)
+        with self._lock:
+            if item_id not in self._columns:
+                path = self.directory / "measurements" / str(item_id)
+                if (path / "time.npy").exists():
+                    columns = (np.load(path / "time.npy", mmap_mode='r'), np.load(path / "value.npy", mmap_mode='r'))
+                else:
+                    columns = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+                self._columns[item_id] = columns
+        return self._columns[item_id]
+
+    def search(self, item_id: int, start: TimeLike = None, stop: TimeLike = None,
+               closed: str = 'both') -> Tuple[int, int]:
+        """
+        Row range [a, b) of the measurements of item_id between start and stop, by binary search
+        :param item_id: item_id
+        :param start: Lower bound, unbounded if None
+        :param stop: Upper bound, unbounded if None
+        :param closed: Bounds included in the range, 'both', 'left', 'right' or 'neither'
+        """
+        times = self.columns(item_id)[0]
+        a = 0 if start is None else int(np.searchsorted(times, epoch_us(start),
+                                                        'left' if closed in ('both', 'left') else 'right'))
+        b = len(times) if stop is None else int(np.searchsorted(times, epoch_us(stop),
+                                                                'right' if closed in ('both', 'right') else 'left'))
+        return a, max(a, b)
+
+    def measurements(self, item_id: int, a: int = 0, b: Optional[int] = None) -> pd.DataFrame:
+        """Rows a until b (exclusive) of the measurements of item_id with the columns of the measurements table"""
+        times, values = self.columns(item_id)
+        times, values = times[a:b], values[a:b]
+        return pd.DataFrame({
+            'item_id': np.full(len(times), item_id, dtype=np.int64),
+            'time': pd.Series(np.asarray(times).view('datetime64[us]')).dt.tz_localize('UTC'),
+            'value': np.asarray(values, dtype=np.float64),
+        })
+
+    def bounds(self, item_id: int) -> pd.DataFrame:
+        """First and last time of the measurements of item_id as min_date and max_date, NaT if there are none"""
+        times = self.columns(item_id)[0]
+        bounds = times[[0, -1]] if len(times) else np.array([_NAT, _NAT], dtype=np.int64)
+        dates = pd.Series(bounds.view('datetime64[us]')).dt.tz_localize('UTC').array
+        return pd.DataFrame({'min_date': dates[:1], 'max_date': dates[1:]})
+
+    def annotations(self, item_ids: Optional[List[int]] = None, label_ids: Optional[List[int]] = None,
+                    start_date: TimeLike = None, stop_date: TimeLike = None) -> pd.DataFrame:
+        """Annotations within start_date and stop_date ordered by item_id and start_date, as AnnotationsBatch"""
+        df = self.table('annotations')
+        mask = np.ones(len(df), dtype=bool)
+        if item_ids is not None:
+            mask &= df['item_id'].isin(item_ids).to_numpy()
+        if label_ids is not None:
+            mask &= df['label_id'].isin(label_ids).to_numpy()
+        if start_date is not None:
+            mask &= to_epoch_us(df['start_date']) >= epoch_us(start_date)
+        if stop_date is not None:
+            mask &= to_epoch_us(df['stop_date']) <= epoch_us(stop_date)
+        return df[mask].sort_values(['item_id', 'start_date'], kind='stable').reset_index(drop=True)
+
+
+_NAT = np.iinfo(np.int64).min
+
+
+def epoch_us(t: Union[str, pd.Timestamp]) -> int:
+    """
+    Microseconds since epoch, naive timestamps are interpreted as UTC
+    '-infinity' and 'infinity' are the smallest and largest representable times, as on the database.
+    """
+    if isinstance(t, str) and t.strip().lower() in ('-infinity', 'infinity', 'inf', '-inf'):
+        return np.iinfo(np.int64).min + 1 if t.strip().startswith('-') else np.iinfo(np.int64).max
+    t = pd.Timestamp(t)
+    t = t.tz_localize('UTC') if t.tzinfo is None else t.tz_convert('UTC')
+    return int(t.value // 1000)
+
+
+def _read_table(path: Path, name: str) -> pd.DataFrame:
+    df = pd.read_csv(path)
+    for column in _DATES.get(name, ()):
+        df[column] = pd.to_datetime(df[column], utc=True, format='ISO8601').dt.as_unit('us')
+    return df
+
+
+class _ItemWriter:
+    """Measurements appended in chunks per item and saved sorted by time"""
+
+    def __init__(self, directory: Path):
+        self.directory = directory / "measurements"
+        self._tmp = Path(tempfile.mkdtemp(prefix='.deddiag_convert_', dir=directory))
+        self._files: Dict[int, Tuple] = {}
+
+    def append(self, df: pd.DataFrame):
+        """Append rows with item_id, time and value columns"""
+        if not len(df):
+            return
+        item_ids = df['item_id'].to_numpy(dtype=np.int64)
+        times = to_epoch_us(df['time'])
+        values = df['value'].to_numpy(dtype=np.float32)
+        for item_id in np.unique(item_ids):
+            mask = item_ids == item_id
+            if item_id not in self._files:
+                self._files[item_id] = (open(self._tmp / f"{item_id}.time", 'wb'),
+                                        open(self._tmp / f"{item_id}.value", 'wb'))
+            time_file, value_file = self._files[item_id]
+            time_file.write(times[mask].tobytes())
+            value_file.write(values[mask].tobytes())
+
+    def close(self) -> Dict[int, int]:
+        """Save time.npy and value.npy of every item, number of rows per item"""
+        rows = {}
+        try:
+            for item_id, (time_file, value_file) in self._files.items():
+                time_file.close()
+                value_file.close()
+                times = np.fromfile(time_file.name, dtype=np.int64)
+                values = np.fromfile(value_file.name, dtype=np.float32)
+                if len(times) > 1 and np.any(times[1:] < times[:-1]):
+                    order = np.argsort(times, kind='stable')
+                    times, values = times[order], values[order]
+                item_dir = self.directory / str(int(item_id))
+                item_dir.mkdir(parents=True, exist_ok=True)
+                np.save(item_dir / "time.npy", times)
+                np.save(item_dir / "value.npy", values)
+                rows[int(item_id)] = len(times)
+        finally:
+            shutil.rmtree(self._tmp, ignore_errors=True)
+        return rows
+
+
+def _write_table(directory: Path, name: str, df: pd.DataFrame):
+    df.to_csv(directory / f"{name}.csv", index=False)
+
+
+def convert_database(con: "Connection", directory: Union[Path, str], item_ids: Optional[Iterable[int]] = None,
+                     chunk_rows: int = 1000000) -> Dict[int, int]:
+    """
+    Copy the dataset from the database to a local copy read by LocalConnection
+    :param con: Connection
+    :param directory: Output directory, created if it does not exist
+    :param item_ids: Only copy measurements of these items, all items if None
+    :param chunk_rows: Rows of measurements held in memory at once, besides the item being saved
+    :return: Number of measurements per item
+    """
+    from ._loader import Houses, Items, AnnotationLabels, AnnotationsBatch, Measurements
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for name, query in (('houses', Houses()), ('items', Items()), ('annotation_labels', AnnotationLabels()),
+                        ('annotations', AnnotationsBatch())):
+        _write_table(directory, name, query.request(con))
+    if item_ids is None:
+        item_ids = pd.read_csv(directory / "items.csv")['id']
+    writer = _ItemWriter(directory)
+    for item_id in item_ids:
+        for chunk in Measurements(int(item_id)).request_iter(con, chunk_rows):
+            writer.append(chunk)
+    return writer.close()
+
+
+def convert_dump(source: Union[Path, str], directory: Union[Path, str], chunk_rows: int = 1000000) -> Dict[int, int]:
+    """
+    Convert the tab separated files of the published dataset to a local copy read by LocalConnection
+
+    Files are assigned to tables by their name, e.g. items.tsv, item_0010_annotations.tsv,
+    item_0010_annotation_labels.tsv and item_0010_data.tsv, and may be gzip compressed.
+    Tables split into several files, e.g. per house or item, are concatenated.
+    :param source: Directory of the extracted dataset, searched recursively
+    :param directory: Output directory, created if it does not exist
+    :param chunk_rows: Rows of measurements held in memory at once, besides the item being saved
+    :return: Number of measurements per item
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    files: Dict[str, List[Path]] = {}
+    for path in sorted(Path(source).rglob('*.tsv*')):
+        table = _dump_table(path.name)
+        if table is not None:
+            files.setdefault(table, []).append(path)
+    if 'items' not in files:
+        raise FileNotFoundError(f"No items.tsv found in {source}")
+
+    for table in TABLES:
+        columns = _COLUMNS[table]
+        parts = [pd.concat(_read_tsv(path, table, None)) for path in files.get(table, [])]
+        df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns)
+        _write_table(directory, table, df.drop_duplicates().sort_values(df.columns[0], kind='stable'))
+
+    writer = _ItemWriter(directory)
+    for path in files.get('measurements', []):
+        for chunk in _read_tsv(path, 'measurements', chunk_rows):
+            writer.append(chunk)
+    return writer.close()
+
+
+def _dump_table(file_name: str) -> Optional[str]:
+    for table, pattern in _DUMP_FILES:
+        if pattern.search(file_name.lower()):
+            return table
+    return None
+
+
+def _read_tsv(path: Path, table: str, chunk_rows: Optional[int]) -> Iterator[pd.DataFrame]:
+    """Chunks of a table file of the dump, which may or may not have a header"""
+    opener = gzip.open if path.suffix == '.gz' else open
+    with opener(path, 'rt') as f:
+        first = f.readline().rstrip('\n').split('\t')
+    columns = _COLUMNS[table]
+    # Headers start with a column name, rows with an id
+    header = not first[0].strip().lstrip('-').isdigit()
+    chunks = pd.read_csv(path, sep='\t', header=0 if header else None, names=None if header else columns,
+                         chunksize=chunk_rows or 1000000)
+    for chunk in chunks:
+        if table == 'measurements':
+            chunk['time'] = pd.to_datetime(chunk['time'], utc=True, format='ISO8601')
+        for column in _DATES.get(table, ()):
+            chunk[column] = pd.to_datetime(chunk[column], utc=True, format='ISO8601').dt.as_unit('us')
+        yield chunk
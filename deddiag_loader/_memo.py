@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple, Union
+
+import pandas as pd
+
+# Static tables memoized for the lifetime of the process once the memo is enabled
+DEFAULT_POLICIES: Dict[str, Optional[float]] = {
+    'Houses': None,
+    'Items': None,
+    'AnnotationLabels': None,
+}
+
+
+class QueryMemo:
+    """
+    In-process LRU memo of query results, shared by all Query instances
+
+    Only query classes with a policy are memoized. A policy is the time to live in seconds,
+    None keeps results for the lifetime of the process and 0 disables memoization of the class.
+
+    Examples
+    --------
+    >>> from deddiag_loader import memo, Items, Annotations
+    >>> memo.enable()                      # Houses, Items and AnnotationLabels are kept forever
+    >>> memo.set_policy(Annotations, 600)  # Annotations are kept for 10 minutes
+    >>> items = Items().request(con)       # Queried once, afterwards answered from memory
+    """
+
+    def __init__(self, max_entries: int = 256, policies: Optional[Dict[str, Optional[float]]] = None,
+                 enabled: bool = False, copy: bool = True):
+        """
+        :param max_entries: Maximum number of memoized results, least recently used results are dropped
+        :param policies: Time to live by query class name, defaults to DEFAULT_POLICIES
+        :param enabled: Memoize results
+        :param copy: Return copies of memoized DataFrames, so callers cannot modify the memoized result
+        """
+        self.max_entries = max_entries
+        self.policies = dict(DEFAULT_POLICIES if policies is None else policies)
+        self.enabled = enabled
+        self.copy = copy
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[float, pd.DataFrame]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def enable(self, policies: Optional[Dict[str, Optional[float]]] = None):
+        """
+        Enable memoization
+        :param policies: Replace policies, keep current policies if None
+        """
+        if policies is not None:
+            self.policies = dict(policies)
+        self.enabled = True
+
+    def disable(self):
+        """Disable memoization and drop all memoized results"""
+        self.enabled = False
+        self.clear()
+
+    def set_policy(self, query_cls: Union[type, str], ttl: Optional[float]):
+        """
+        Set time to live of a query class
+        :param query_cls: Query class or class name
+        :param ttl: Time to live in seconds, None for the lifetime of the process, 0 to never memoize
+        """
+        name = query_cls if isinstance(query_cls, str) else query_cls.__name__
+        self.policies[name] = ttl
+        if ttl == 0:
+            self.clear(name)
+
+    def clear(self, query_cls: Union[type, str, None] = None):
+        """
+        Drop memoized results
+        :param query_cls: Only drop results of this query class
+        """
+        name = query_cls if query_cls is None or isinstance(query_cls, str) else query_cls.__name__
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == name]:
+                    del self._entries[key]
+
+    def memoizes(self, query_cls: type) -> bool:
+        return self.enabled and self.policies.get(query_cls.__name__, 0) != 0
+
+    def get(self, query_cls: type, key: Hashable) -> Optional[pd.DataFrame]:
+        """
+        Memoized result or None
+        :param query_cls: Query class
+        :param key: Key of the result, e.g. connection and SQL
+        """
+        if not self.memoizes(query_cls):
+            return None
+        name = query_cls.__name__
+        ttl = self.policies[name]
+        with self._lock:
+            entry = self._entries.get((name, key))
+            if entry is None:
+                return None
+            created, df = entry
+            if ttl is not None and time.monotonic() - created > ttl:
+                del self._entries[(name, key)]
+                return None
+            self._entries.move_to_end((name, key))
+        return df.copy() if self.copy else df
+
+    def put(self, query_cls: type, key: Hashable, df: pd.DataFrame):
+        """
+        Memoize result, if the query class has a policy
+        :param query_cls: Query class
+        :param key: Key of the result, e.g. connection and SQL
+        :param df: Result
+        """
+        if not self.memoizes(query_cls):
+            return
+        with self._lock:
+            self._entries[(query_cls.__name__, key)] = (time.monotonic(), df.copy() if self.copy else df)
+            self._entries.move_to_end((query_cls.__name__, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+memo = QueryMemo()
@@ -0,0 +1,182 @@
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+# Query class of the spans recorded in the current thread or asyncio task
+_current_query: ContextVar[str] = ContextVar('deddiag_query', default='')
+
+
+class Span(NamedTuple):
+    """
+    Timed step of a query
+
+    Names are 'checkout' (pool wait), 'prepare', 'execute', 'fetch', 'decode' (DataFrame construction),
+    'cache_read' (hit), 'cache_miss', 'cache_write', 'memo_hit' and 'request' (the whole request).
+    With the psql engine the result is transferred by 'execute', with binary COPY by 'fetch'.
+    Spans outside of Query.request, e.g. of request_iter, have an empty query.
+    """
+    query: str
+    name: str
+    seconds: float
+    rows: int = 0
+    bytes: int = 0
+
+
+class _Timer:
+    __slots__ = ('_profiler', '_name', '_start', 'rows', 'bytes')
+
+    def __init__(self, profiler: "QueryProfiler", name: str):
+        self._profiler = profiler
+        self._name = name
+        self.rows = 0
+        self.bytes = 0
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._profiler.record(self._name, time.perf_counter() - self._start, self.rows, self.bytes)
+
+
+class _NullTimer:
+    """Shared timer of a disabled profiler, rows and bytes assigned to it are ignored"""
+    rows = 0
+    bytes = 0
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class _QueryLabel:
+    __slots__ = ('_name', '_token')
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __enter__(self):
+        self._token = _current_query.set(self._name)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _current_query.reset(self._token)
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class QueryProfiler:
+    """
+    Timing of the steps of queries, aggregated per query class and passed to callbacks
+
+    Disabled by default, in which case span() and query() return a shared no-op context manager.
+
+    Examples
+    --------
+    >>> from deddiag_loader import profiler
+    >>> profiler.enable()
+    >>> Measurements(10, "2017-01-01", "2017-02-01").request(con, cache_dir="cache")
+    >>> profiler.stats()       # count, seconds, rows and bytes per query class and span
+    >>> profiler.prometheus()  # the same in the Prometheus text format
+    >>> profiler.add_callback(lambda span: print(span))
+    """
+
+    def __init__(self, enabled: bool = False):
+        """
+        :param enabled: Record spans
+        """
+        self.enabled = enabled
+        self._callbacks: List[Callable[[Span], None]] = []
+        self._totals: Dict[Tuple[str, str], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def enable(self, callback: Optional[Callable[[Span], None]] = None):
+        """
+        Enable recording
+        :param callback: Also add this callback, see add_callback
+        """
+        if callback is not None:
+            self.add_callback(callback)
+        self.enabled = True
+
+    def disable(self):
+        """Disable recording, recorded totals and callbacks are kept"""
+        self.enabled = False
+
+    def add_callback(self, callback: Callable[[Span], None]):
+        """
+        Call callback with every recorded Span, e.g. to export it to a tracing system
+        Callbacks are called from the thread running the query and must be thread safe.
+        :param callback: Called with the Span
+        """
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback: Callable[[Span], None]):
+        self._callbacks.remove(callback)
+
+    def reset(self):
+        """Drop recorded totals"""
+        with self._lock:
+            self._totals.clear()
+
+    def query(self, query_cls: type):
+        """Attribute the spans recorded within the context to query_cls"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _QueryLabel(query_cls.__name__)
+
+    def span(self, name: str):
+        """
+        Time the context, rows and bytes can be assigned to the returned timer
+
+        Examples
+        --------
+        >>> with profiler.span('fetch') as span:
+        >>>     rows = cur.fetchall()
+        >>>     span.rows = len(rows)
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def record(self, name: str, seconds: float, rows: int = 0, nbytes: int = 0):
+        """Record a span timed by the caller"""
+        if not self.enabled:
+            return
+        span = Span(_current_query.get(), name, seconds, int(rows), int(nbytes))
+        with self._lock:
+            totals = self._totals.setdefault((span.query, name), [0, 0., 0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += span.rows
+            totals[3] += span.bytes
+        for callback in self._callbacks:
+            callback(span)
+
+    def stats(self) -> pd.DataFrame:
+        """Number of spans, total seconds, rows and bytes per query class and span name"""
+        with self._lock:
+            rows = [(query, name, *totals) for (query, name), totals in sorted(self._totals.items())]
+        df = pd.DataFrame(rows, columns=['query', 'span', 'count', 'seconds', 'rows', 'bytes'])
+        df['count'] = df['count'].astype('int64')
+        return df
+
+    def prometheus(self, prefix: str = 'deddiag') -> str:
+        """Recorded totals in the Prometheus text exposition format, e.g. to be served by an HTTP handler"""
+        df = self.stats()
+        lines = []
+        for column, metric in (('count', 'spans'), ('seconds', 'span_seconds'), ('rows', 'span_rows'),
+                               ('bytes', 'span_bytes')):
+            name = f"{prefix}_{metric}_total"
+            lines.append(f"# TYPE {name} counter")
+            for row in df.itertuples(index=False):
+                lines.append(f'{name}{{query="{row.query}",span="{row.span}"}} {getattr(row, column)}')
+        return "\n".join(lines) + "\n"
+
+
+profiler = QueryProfiler()
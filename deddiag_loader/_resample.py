@@ -0,0 +1,111 @@
+"""Time weighted aggregation of change point measurements into fixed intervals"""
+from typing import Dict, Iterable, List, Union
+
+import numpy as np
+import pandas as pd
+
+AGGREGATIONS = ('mean', 'min', 'max', 'energy')
+
+# SQL of the aggregations over pieces (value, dur) of the step function within a bucket, see MeasurementsResampled
+AGGREGATION_SQL = {
+    'mean': "sum(value * dur) / nullif(sum(dur), 0) AS mean",
+    'min': "min(value)::float8 AS min",
+    'max': "max(value)::float8 AS max",
+    'energy': "sum(value * dur) / 3600 AS energy",
+}
+
+_SECOND_US = 1000000
+
+
+def interval_seconds(interval: Union[str, pd.Timedelta]) -> int:
+    """Length of interval in whole seconds, e.g. '15min'"""
+    td = pd.Timedelta(interval)
+    if td < pd.Timedelta(seconds=1) or td % pd.Timedelta(seconds=1):
+        raise ValueError(f"interval must be a positive number of whole seconds, got {interval}")
+    return int(td.total_seconds())
+
+
+def check_aggs(aggs: Iterable[str]) -> List[str]:
+    aggs = list(aggs)
+    if not aggs:
+        raise ValueError("At least one aggregation is required")
+    for agg in aggs:
+        if agg not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation {agg}, expected one of {AGGREGATIONS}")
+    return aggs
+
+
+def resample(times: np.ndarray, values: np.ndarray, start: int, stop: int, interval: int,
+             aggs: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Time weighted aggregation of a step function into buckets aligned to multiples of interval since epoch
+
+    Each value holds from its time until the next change point. Only [start, stop) is aggregated and only
+    buckets covered by the step function for a positive duration are returned.
+    mean is weighted by duration, min/max are taken over all values in effect within the bucket and
+    energy is the integral in value-hours, i.e. Wh for values in W.
+    :param times: Sorted times of the change points in microseconds since epoch
+    :param values: Values of the change points
+    :param start: Start of the range in microseconds since epoch
+    :param stop: End of the range (exclusive) in microseconds since epoch
+    :param interval: Bucket length in seconds
+    :param aggs: Aggregations, see AGGREGATIONS
+    :return: Bucket start times in microseconds since epoch as 'time' and one array per aggregation
+    """
+    times = np.asarray(times, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    keep = times < stop
+    times, values = times[keep], values[keep]
+    step = interval * _SECOND_US
+    first, last = start // step, -(-stop // step)
+    if stop <= start or not len(times) or last <= first:
+        return {'time': np.empty(0, dtype=np.int64), **{agg: np.empty(0) for agg in aggs}}
+
+    buckets = np.arange(first, last, dtype=np.int64) * step
+    edges = np.clip(np.append(buckets, last * step), start, stop)
+    # Integral of the step function from the first change point until each change point, in value-seconds
+    durations = np.diff(times) / _SECOND_US
+    cumulative = np.concatenate([[0.], np.cumsum(values[:-1] * durations)])
+
+    idx = np.searchsorted(times, edges, side='right') - 1
+    valid = idx >= 0
+    at = np.maximum(idx, 0)
+    integral = np.where(valid, cumulative[at] + values[at] * (edges - times[at]) / _SECOND_US, 0.)
+    covered = np.maximum(edges - times[0], 0) / _SECOND_US
+    bucket_integral = np.diff(integral)
+    bucket_covered = np.diff(covered)
+    selected = bucket_covered > 0
+
+    result = {'time': buckets[selected]}
+    for agg in aggs:
+        if agg == 'mean':
+            result[agg] = bucket_integral[selected] / bucket_covered[selected]
+        elif agg == 'energy':
+            result[agg] = bucket_integral[selected] / 3600
+        else:
+            result[agg] = _extreme(times, values, edges, np.fmin if agg == 'min' else np.fmax)[selected]
+    return result
+
+
+def _extreme(times: np.ndarray, values: np.ndarray, edges: np.ndarray, ufunc: np.ufunc) -> np.ndarray:
+    """Minimum or maximum of the values in effect within each bucket [edges[i], edges[i + 1])"""
+    j0 = np.searchsorted(times, edges[:-1], side='left')
+    j1 = np.searchsorted(times, edges[1:], side='left')
+    # Value carried into the bucket from the last change point before it, none if a change point is at the edge
+    carried_at = np.searchsorted(times, edges[:-1], side='right') - 1
+    carried = np.where((carried_at >= 0) & (carried_at < j0), values[np.maximum(carried_at, 0)], np.nan)
+    inner = np.full(len(j0), np.nan)
+    nonempty = j1 > j0
+    if nonempty.any():
+        # Change points within the buckets are contiguous and times < edges[-1], so reduceat ends at the next start
+        inner[nonempty] = ufunc.reduceat(values[:j1[-1]], j0[nonempty])
+    return ufunc(carried, inner)
+
+
+def to_frame(item_id: int, result: Dict[str, np.ndarray], aggs: List[str]) -> pd.DataFrame:
+    """Result of resample() as DataFrame with the columns of MeasurementsResampled"""
+    return pd.DataFrame({
+        'item_id': np.full(len(result['time']), item_id, dtype=np.int64),
+        'time': pd.Series(result['time'].view('datetime64[us]')).dt.tz_localize('UTC'),
+        **{agg: result[agg] for agg in aggs},
+    })
@@ -0,0 +1,149 @@
+"""Per item daily summaries of the measurements table, used by range and missing data queries when available"""
+import logging
+from typing import TYPE_CHECKING, Iterable, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+if TYPE_CHECKING:
+    from ._db import Connection
+
+TABLE = 'measurements_daily'
+
+_CREATE = f"""
+CREATE TABLE IF NOT EXISTS {TABLE} (
+    item_id integer NOT NULL,
+    day date NOT NULL,
+    first_time timestamptz NOT NULL,
+    last_time timestamptz NOT NULL,
+    count bigint NOT NULL,
+    max_gap_seconds double precision,
+    gap_hour_seconds double precision NOT NULL,
+    gap_day_seconds double precision NOT NULL,
+    energy_wh double precision NOT NULL,
+    PRIMARY KEY (item_id, day)
+)
+"""
+
+# Gaps are counted on the day of the measurement ending them, energy on the day of the measurement starting the
+# segment until the next measurement. The last measurement before since is only read to compute the first gap.
+_REFRESH = f"""
+DELETE FROM {TABLE} WHERE item_id = %(item_id)s and day >= (%(since)s::timestamptz AT TIME ZONE 'UTC')::date;
+INSERT INTO {TABLE}
+WITH v_lag AS (
+    SELECT time, value,
+           EXTRACT(EPOCH FROM time - LAG(time) OVER w)::float8 as gap,
+           EXTRACT(EPOCH FROM LEAD(time) OVER w - time)::float8 as duration
+    FROM measurements
+    WHERE item_id = %(item_id)s
+      and time >= COALESCE((SELECT max(time) FROM measurements WHERE item_id = %(item_id)s and time < %(since)s),
+                           %(since)s)
+    WINDOW w AS (ORDER BY time)
+)
+SELECT %(item_id)s,
+       (time AT TIME ZONE 'UTC')::date as day,
+       min(time),
+       max(time),
+       count(*),
+       max(gap),
+       COALESCE(sum(gap) FILTER (WHERE gap > 3605), 0),
+       COALESCE(sum(gap) FILTER (WHERE gap > 86400), 0),
+       COALESCE(sum(value * duration), 0) / 3600
+FROM v_lag
+WHERE time >= %(since)s
+GROUP BY 2
+"""
+
+
+def rollups_available(con: "Connection") -> bool:
+    """True if con uses rollups and the rollup table exists, checked once per connection"""
+    if not getattr(con, 'use_rollups', False):
+        return False
+    if con._rollups is None:
+        con._rollups = bool(con.from_psql(f"SELECT to_regclass('{TABLE}') IS NOT NULL as exists")['exists'].iloc[0])
+    return con._rollups
+
+
+def create_rollups(con: "Connection"):
+    """Create the rollup table, refresh_rollups() fills it"""
+    with con.connection() as c:
+        with c.cursor() as cur:
+            cur.execute(_CREATE)
+        c.commit()
+    con._rollups = None
+
+
+def drop_rollups(con: "Connection"):
+    """Drop the rollup table, queries use the measurements table again"""
+    with con.connection() as c:
+        with c.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        c.commit()
+    con._rollups = None
+
+
+def refresh_rollups(con: "Connection", item_ids: Optional[Iterable[int]] = None,
+                    since: Union[str, pd.Timestamp, None] = None) -> int:
+    """
+    Recompute daily summaries of items
+
+    Without since, summaries are refreshed incrementally from the last summarized day of each item,
+    which is recomputed as it may have been incomplete. Rows inserted into earlier days require since.
+    :param con: Connection
+    :param item_ids: Items to refresh, all items if None
+    :param since: Recompute days from this day (UTC), all days if since is None and the item has no summaries
+    :return: Number of summarized days written
+    """
+    create_rollups(con)
+    if item_ids is None:
+        item_ids = con.from_psql("SELECT id FROM items ORDER BY id")['id'].tolist()
+    first_day = None
+    if since is not None:
+        day = pd.Timestamp(since)
+        first_day = (day.tz_localize('UTC') if day.tzinfo is None else day.tz_convert('UTC')).floor('D')
+    written = 0
+    with con.connection() as c:
+        with c.cursor() as cur:
+            for item_id in item_ids:
+                item_since: Union[str, pd.Timestamp, None] = first_day
+                if item_since is None:
+                    cur.execute(f"SELECT max(day) FROM {TABLE} WHERE item_id = %s", (int(item_id),))
+                    last_day = cur.fetchone()[0]
+                    item_since = '-infinity' if last_day is None else pd.Timestamp(last_day).tz_localize('UTC')
+                cur.execute(_REFRESH, {'item_id': int(item_id), 'since': str(item_since)})
+                written += cur.rowcount
+                c.commit()
+                logging.info(f"Refreshed rollups of item {item_id} since {item_since}")
+    return written
+
+
+def daily_summaries(item_id: int, times: np.ndarray, values: np.ndarray) -> pd.DataFrame:
+    """
+    Daily summaries of all measurements of an item computed on the client, with the rows of the rollup table
+    :param item_id: item_id
+    :param times: Sorted times in microseconds since epoch
+    :param values: Values
+    """
+    times = np.asarray(times, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    gaps = np.concatenate([[np.nan], np.diff(times) / 1e6])
+    durations = np.concatenate([np.diff(times) / 1e6, [np.nan]])
+    days = times // 86400000000
+    starts = np.flatnonzero(np.concatenate([[True], days[1:] != days[:-1]])) if len(times) else np.empty(0, int)
+    stops = np.append(starts[1:], len(times)) if len(times) else starts
+
+    def per_day(x: np.ndarray, ufunc: np.ufunc = np.add) -> np.ndarray:
+        return ufunc.reduceat(x, starts) if len(starts) else np.empty(0)
+
+    return pd.DataFrame({
+        'item_id': np.full(len(starts), item_id, dtype=np.int64),
+        'day': [d.date() for d in pd.to_datetime(days[starts] * 86400, unit='s')],
+        'first_time': pd.Series(times[starts].view('datetime64[us]')).dt.tz_localize('UTC'),
+        'last_time': pd.Series(times[stops - 1].view('datetime64[us]')).dt.tz_localize('UTC'),
+        'count': (stops - starts).astype(np.int64),
+        # The first gap of the item is NULL, fmax ignores it as max() does
+        'max_gap_seconds': per_day(gaps, np.fmax),
+        'gap_hour_seconds': per_day(np.where(gaps > 3605, gaps, 0.)),
+        'gap_day_seconds': per_day(np.where(gaps > 86400, gaps, 0.)),
+        'energy_wh': per_day(np.nan_to_num(values * durations)) / 3600,
+    })
@@ -0,0 +1,183 @@
+import json
+import logging
+from pathlib import Path
+from typing import TYPE_CHECKING, List, NamedTuple, Tuple, Union
+from uuid import uuid4
+
+import pandas as pd
+
+from ._cache import BACKENDS, CacheBackend, _as_time, _lock_file
+from ._loader import Measurements, MeasurementsExpanded
+
+if TYPE_CHECKING:
+    from ._db import Connection
+
+
+class Segment(NamedTuple):
+    start: pd.Timestamp
+    stop: pd.Timestamp
+    file: str
+
+
+class SegmentCache:
+    """
+    Time range aware cache of Measurements and MeasurementsExpanded
+
+    Results are stored per query class and item as segments, each holding all rows with start <= time <= stop.
+    Requests are answered from the stored segments, only the time ranges not covered yet are queried from the
+    database and stored as new segments. Segments fully covered by a request are merged into a single segment.
+
+    Naive dates are interpreted as UTC.
+
+    Examples
+    --------
+    >>> cache = SegmentCache("cache")
+    >>> df = cache.request(con, Measurements(10, "2017-01-01", "2017-02-01"))
+    >>> df = cache.request(con, Measurements(10, "2017-01-15", "2017-02-15"))  # Only 2017-02-01 - 2017-02-15 is queried
+    """
+    _INDEX_FILE = 'index.json'
+    _LOCK_FILE = 'index.lock'
+
+    def __init__(self, cache_dir: Union[Path, str], backend: Union[str, CacheBackend] = 'pickle',
+                 lock_stale: float = 3600):
+        """
+        :param cache_dir: Cache directory
+        :param backend: Storage format of the segments, see QueryCache
+        :param lock_stale: Seconds after which the lock of an item is considered abandoned and broken
+        """
+        self.cache_dir = Path(cache_dir)
+        if self.cache_dir.exists() and self.cache_dir.is_file():
+            raise NotADirectoryError(self.cache_dir)
+        if isinstance(backend, str):
+            if backend not in BACKENDS:
+                raise ValueError(f"Unknown cache backend {backend}, expected one of {list(BACKENDS)}")
+            backend = BACKENDS[backend]()
+        self.backend = backend
+        self.lock_stale = lock_stale
+
+    def request(self, con: "Connection", query: Union[Measurements, MeasurementsExpanded],
+                engine: str = 'psql') -> pd.DataFrame:
+        """
+        Request query result, querying the database only for time ranges not cached yet
+        The segments of an item are read, extended and merged by one process at a time, holding an O_EXCL lock
+        file next to its index like QueryCache.
+        :param con: Connection
+        :param query: Measurements or MeasurementsExpanded with start_date and stop_date
+        :param engine: Fetch engine used for missing time ranges, see Query.request
+        """
+        if not isinstance(query, (Measurements, MeasurementsExpanded)):
+            raise TypeError(f"SegmentCache only supports Measurements and MeasurementsExpanded, got {type(query)}")
+        params = query._params
+        if params['start_date'] is None or params['stop_date'] is None:
+            raise ValueError("SegmentCache requires start_date and stop_date")
+        if params.get('limit') is not None:
+            raise ValueError("SegmentCache does not support limit")
+
+        item_id = params['item_id']
+        start = self._normalize(query, params['start_date'])
+        stop = self._normalize(query, params['stop_date'])
+        if stop < start:
+            raise ValueError(f"stop_date {stop} is before start_date {start}")
+
+        item_dir = self.cache_dir / type(query).__name__ / str(item_id)
+        item_dir.mkdir(parents=True, exist_ok=True)
+        with _lock_file(item_dir / self._LOCK_FILE, stale=self.lock_stale):
+            return self._request(con, query, item_dir, start, stop, engine)
+
+    def _request(self, con: "Connection", query: Union[Measurements, MeasurementsExpanded], item_dir: Path,
+                 start: pd.Timestamp, stop: pd.Timestamp, engine: str) -> pd.DataFrame:
+        item_id = query._params['item_id']
+        segments = self._read_index(item_dir)
+        gaps = self.gaps(segments, start, stop)
+        for gap_start, gap_stop in gaps:
+            logging.info(f"Querying {type(query).__name__} of item {item_id} from {gap_start} to {gap_stop}")
+            df = type(query)(item_id, gap_start.isoformat(), gap_stop.isoformat()).request(con, engine=engine)
+            segments.append(self._write_segment(item_dir, gap_start, gap_stop, df))
+        segments.sort()
+
+        parts = [s for s in segments if s.stop >= start and s.start <= stop]
+        pieces = []
+        last = None
+        for s in parts:
+            df = self.backend.read(item_dir / s.file, start=max(start, s.start), stop=min(stop, s.stop))
+            if last is not None:
+                df = df[df['time'] > _as_time(last, df['time'])]
+            pieces.append(df)
+            last = min(stop, s.stop)
+        # Empty results of read_sql_query have object columns, which would turn the time column into objects
+        pieces = [df for df in pieces if len(df)] or pieces[:1]
+        result = pd.concat(pieces, ignore_index=True) if len(pieces) > 1 else pieces[0].reset_index(drop=True)
+
+        inner = [s for s in parts if start <= s.start and s.stop <= stop]
+        if len(inner) > 1:
+            time = result['time']
+            merged = self._write_segment(item_dir, inner[0].start, inner[-1].stop,
+                                         result[(time >= _as_time(inner[0].start, time)) &
+                                                (time <= _as_time(inner[-1].stop, time))])
+            segments = [s for s in segments if s not in inner] + [merged]
+            segments.sort()
+        if gaps or len(inner) > 1:
+            self._write_index(item_dir, segments)
+            for s in inner if len(inner) > 1 else []:
+                (item_dir / s.file).unlink()
+        return result
+
+    @staticmethod
+    def gaps(segments: List[Segment], start: pd.Timestamp, stop: pd.Timestamp) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+        """
+        Time ranges of [start, stop] not covered by segments
+        :param segments: Non-overlapping segments
+        :param start: Start of range
+        :param stop: End of range
+        """
+        gaps = []
+        cur = start
+        covered = False
+        for s in sorted(segments):
+            if s.stop < cur:
+                continue
+            if s.start > stop:
+                break
+            if s.start > cur:
+                gaps.append((cur, s.start))
+            cur = s.stop
+            covered = True
+            if cur >= stop:
+                return gaps
+        if cur < stop or not covered:
+            gaps.append((cur, stop))
+        return gaps
+
+    @staticmethod
+    def _normalize(query: Union[Measurements, MeasurementsExpanded], t: Union[str, pd.Timestamp]) -> pd.Timestamp:
+        t = pd.Timestamp(t)
+        t = t.tz_localize('UTC') if t.tzinfo is None else t.tz_convert('UTC')
+        if isinstance(query, MeasurementsExpanded):
+            # get_measurements returns one row per second, from round_timestamp(start) to round_timestamp(stop)
+            t = (t + pd.Timedelta(milliseconds=500)).floor('s')
+        return t
+
+    def _write_segment(self, item_dir: Path, start: pd.Timestamp, stop: pd.Timestamp, df: pd.DataFrame) -> Segment:
+        df = df.copy()
+        if getattr(df['time'].dtype, 'tz', None) is not None:
+            df['time'] = df['time'].dt.tz_convert('UTC')
+        file = f"{uuid4().hex}.{self.backend.FILE_EXT}"
+        tmp_path = item_dir / f"{file}.tmp"
+        self.backend.write(tmp_path, df.reset_index(drop=True))
+        tmp_path.replace(item_dir / file)
+        return Segment(start, stop, file)
+
+    def _read_index(self, item_dir: Path) -> List[Segment]:
+        path = item_dir / self._INDEX_FILE
+        if not path.exists():
+            return []
+        with path.open() as f:
+            return [Segment(pd.Timestamp(s['start']), pd.Timestamp(s['stop']), s['file']) for s in json.load(f)['segments']]
+
+    def _write_index(self, item_dir: Path, segments: List[Segment]):
+        path = item_dir / self._INDEX_FILE
+        tmp_path = item_dir / f"{self._INDEX_FILE}.tmp"
+        with tmp_path.open('w') as f:
+            json.dump({'segments': [{'start': s.start.isoformat(), 'stop': s.stop.isoformat(), 'file': s.file}
+                                    for s in segments]}, f, indent=1)
+        tmp_path.replace(path)
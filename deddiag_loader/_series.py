@@ -0,0 +1,203 @@
+"""Compact in-memory representation of the measurements of a single item"""
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ._expand import ExpandedView, to_epoch_us
+
+_SECOND_US = 1000000
+_INT32_MAX = np.iinfo(np.int32).max
+
+
+class MeasurementSeries:
+    """
+    Measurements of a single item with 8 bytes per row or less instead of 24
+
+    The item_id is stored once, times as offsets from the first time and values as float32,
+    optionally run-length encoded for long runs of equal values, e.g. standby power.
+    Times are stored as start and step if they are evenly spaced, as for MeasurementsExpanded, otherwise as
+    int32 offsets from start in seconds or microseconds if they fit, else as int32 differences between
+    consecutive times with the few larger differences stored separately.
+
+    Examples
+    --------
+    >>> series = MeasurementsExpandedClient(10, "2017-01-01", "2018-01-01").request_series(con, rle=True)
+    >>> series.nbytes / len(series)  # Bytes per row
+    >>> series.values                # float32 values
+    >>> df = series.to_frame()       # Same columns as the query result
+    """
+
+    def __init__(self, item_id: Optional[int], start: int, length: int, step: Optional[int] = None,
+                 offsets: Optional[np.ndarray] = None, unit: int = 1,
+                 large: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                 values: Optional[np.ndarray] = None, run_starts: Optional[np.ndarray] = None,
+                 columns: Optional[Dict[str, np.ndarray]] = None):
+        """
+        Use from_frame() or Query.request_series() instead
+        :param item_id: item_id, None for an empty series of an unknown item
+        :param start: First time in microseconds since epoch
+        :param length: Number of rows
+        :param step: Microseconds between rows of evenly spaced times, not required for a single row
+        :param offsets: Offsets of the times from start in units, if times are not evenly spaced
+        :param unit: Microseconds per offset unit
+        :param large: If given, offsets are differences between consecutive times instead of offsets from
+                      start, except at the rows (index, difference) of large, where they are 0
+        :param values: float32 values, or values of the runs if run_starts is given
+        :param run_starts: First row of each run of equal values
+        :param columns: Further columns, e.g. labels
+        """
+        self.item_id = item_id
+        self.start = start
+        self.length = length
+        self._step = step
+        self._offsets = offsets
+        self._unit = unit
+        self._large = large
+        self._values = np.empty(0, dtype=np.float32) if values is None else values
+        self._run_starts = run_starts
+        self.columns = {} if columns is None else columns
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, rle: bool = False, item_id: Optional[int] = None) -> "MeasurementSeries":
+        """
+        Compact measurements of a single item
+        :param df: DataFrame with item_id, time and value columns, further columns are kept as NumPy arrays
+        :param rle: Run-length encode the values
+        :param item_id: item_id of an empty DataFrame
+        """
+        if len(df):
+            item_ids = df['item_id'].to_numpy()
+            if np.any(item_ids != item_ids[0]):
+                raise ValueError("MeasurementSeries only holds measurements of a single item")
+            item_id = int(item_ids[0])
+        times = to_epoch_us(df['time'])
+        if len(times) > 1 and np.any(times[1:] < times[:-1]):
+            raise ValueError("times must be sorted")
+        columns = {c: df[c].to_numpy() for c in df.columns if c not in ('item_id', 'time', 'value')}
+        return cls._from_arrays(item_id, times, df['value'].to_numpy(dtype=np.float32), rle, columns)
+
+    @classmethod
+    def from_view(cls, view: ExpandedView, rle: bool = False) -> "MeasurementSeries":
+        """
+        Compact an ExpandedView without expanding the values if rle is set
+        :param view: ExpandedView
+        :param rle: Run-length encode the values
+        """
+        pos, length = view._positions, view.length
+        j0 = np.searchsorted(pos, 0, side='right')
+        j1 = np.searchsorted(pos, length - 1, side='right')
+        run_starts = np.concatenate([[0], pos[j0:j1]]).astype(np.int64)
+        values = view._values[j0:j1 + 1].astype(np.float32)
+        if length == 0:
+            run_starts, values = run_starts[:0], values[:0]
+        if rle:
+            run_starts, values = _merge_runs(run_starts, values)
+            return cls(view.item_id, view.start, length, _SECOND_US, values=values,
+                       run_starts=_smallest_int(run_starts))
+        counts = np.diff(np.append(run_starts, length))
+        return cls(view.item_id, view.start, length, _SECOND_US, values=np.repeat(values, counts))
+
+    @classmethod
+    def _from_arrays(cls, item_id: Optional[int], times: np.ndarray, values: np.ndarray, rle: bool,
+                     columns: Dict[str, np.ndarray]) -> "MeasurementSeries":
+        length = len(times)
+        start = int(times[0]) if length else 0
+        run_starts = None
+        if rle:
+            run_starts, values = _merge_runs(np.arange(length, dtype=np.int64), values)
+            run_starts = _smallest_int(run_starts)
+        diffs = np.diff(times)
+        if length < 2 or np.all(diffs == diffs[0]):
+            step = int(diffs[0]) if length >= 2 else _SECOND_US
+            return cls(item_id, start, length, step, values=values, run_starts=run_starts, columns=columns)
+        offsets = times - start
+        unit = _SECOND_US if not np.any(offsets % _SECOND_US) else 1
+        offsets = _smallest_int(offsets // unit)
+        large = None
+        if offsets.dtype == np.int64:
+            # Store differences between consecutive times as int32, the few larger ones (gaps) separately
+            deltas = np.concatenate([[0], diffs // unit])
+            index = np.flatnonzero(deltas > _INT32_MAX)
+            large = (index, deltas[index])
+            deltas[index] = 0
+            offsets = deltas.astype(np.int32)
+        return cls(item_id, start, length, offsets=offsets, unit=unit, large=large, values=values,
+                   run_starts=run_starts, columns=columns)
+
+    def __len__(self) -> int:
+        return self.length
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of all arrays"""
+        arrays = [self._offsets, self._values, self._run_starts, *(self._large or ()), *self.columns.values()]
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    @property
+    def times_us(self) -> np.ndarray:
+        """Times in microseconds since epoch"""
+        if self._offsets is None:
+            step = 0 if self._step is None else self._step
+            return self.start + np.arange(self.length, dtype=np.int64) * step
+        offsets = self._offsets.astype(np.int64)
+        if self._large is not None:
+            index, deltas = self._large
+            offsets[index] = deltas
+            offsets = np.cumsum(offsets)
+        return self.start + offsets * self._unit
+
+    @property
+    def time(self) -> np.ndarray:
+        """Times as datetime64[us] in UTC"""
+        return self.times_us.view('datetime64[us]')
+
+    @property
+    def values(self) -> np.ndarray:
+        """float32 values, a view of the stored values unless they are run-length encoded"""
+        if self._run_starts is None:
+            return self._values
+        counts = np.diff(np.append(self._run_starts.astype(np.int64), self.length))
+        return np.repeat(self._values, counts)
+
+    @property
+    def runs(self) -> pd.DataFrame:
+        """First row, length and value of each run of equal values"""
+        starts = np.arange(self.length) if self._run_starts is None else self._run_starts.astype(np.int64)
+        values = self._values
+        if self._run_starts is None:
+            starts, values = _merge_runs(starts, values)
+        return pd.DataFrame({'start': starts, 'length': np.diff(np.append(starts, self.length)), 'value': values})
+
+    def to_numpy(self) -> np.ndarray:
+        """Structured array with time (datetime64[us]) and value (float32) fields"""
+        out = np.empty(self.length, dtype=[('time', 'datetime64[us]'), ('value', np.float32)])
+        out['time'] = self.time
+        out['value'] = self.values
+        return out
+
+    def to_frame(self) -> pd.DataFrame:
+        """DataFrame with item_id, time (UTC), value and further columns"""
+        return pd.DataFrame({
+            'item_id': np.full(self.length, self.item_id, dtype=np.int64),
+            'time': pd.Series(self.time).dt.tz_localize('UTC'),
+            'value': self.values,
+            **self.columns,
+        })
+
+
+def _merge_runs(starts: np.ndarray, values: np.ndarray):
+    """Merge consecutive runs of equal values, NaN runs included"""
+    if len(values) < 2:
+        return starts, values
+    a, b = values[1:], values[:-1]
+    changed = ~((a == b) | (np.isnan(a) & np.isnan(b)))
+    keep = np.concatenate([[True], changed])
+    return starts[keep], values[keep]
+
+
+def _smallest_int(a: np.ndarray) -> np.ndarray:
+    """a as int32 if it fits, int64 otherwise"""
+    if not len(a) or (a.min() >= -_INT32_MAX and a.max() <= _INT32_MAX):
+        return a.astype(np.int32)
+    return a.astype(np.int64)
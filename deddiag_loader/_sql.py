@@ -0,0 +1,91 @@
+"""Bind parameters of query templates: literal rendering, positional placeholders and cache keys"""
+import datetime
+import json
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+# Named placeholders as used by psycopg2, e.g. %(item_id)s
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%%")
+
+
+def literal(value: Any) -> str:
+    """Value as escaped SQL literal"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, (bool, np.bool_)):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        value = float(value)
+        return repr(value) if np.isfinite(value) else f"'{value}'::float8"
+    if isinstance(value, (list, tuple, np.ndarray)):
+        # An untyped empty array literal takes the type of its context, as ARRAY[] cannot
+        return f"ARRAY[{','.join(literal(v) for v in value)}]" if len(value) else "'{}'"
+    if isinstance(value, (datetime.date, datetime.time)):
+        value = value.isoformat()
+    value = str(value)
+    if '\x00' in value:
+        raise ValueError("SQL literals cannot contain NUL characters")
+    # Backslashes are not special with standard_conforming_strings, the default since PostgreSQL 9.1
+    return "'" + value.replace("'", "''") + "'"
+
+
+def render(template: str, params: Dict[str, Any]) -> str:
+    """Template with its placeholders replaced by escaped literals of params"""
+    return _PLACEHOLDER.sub(lambda m: literal(params[m.group(1)]) if m.group(1) else '%', template)
+
+
+@lru_cache(maxsize=1024)
+def positional(template: str) -> Tuple[str, Tuple[str, ...]]:
+    """
+    Template with $n placeholders, as used by PREPARE
+    :return: SQL and parameter name of each $n
+    """
+    names: List[str] = []
+
+    def replace(m: re.Match) -> str:
+        name = m.group(1)
+        if name is None:
+            return '%'
+        if name not in names:
+            names.append(name)
+        return f"${names.index(name) + 1}"
+
+    return _PLACEHOLDER.sub(replace, template), tuple(names)
+
+
+def cache_key(template: str, params: Dict[str, Any], engine: str = 'psql') -> str:
+    """
+    Key identifying the result of template with params, independent of whitespace and parameter order
+    Results of the 'copy' engine keep the column types of the database (e.g. int32, float32) instead of the
+    int64 and float64 of 'psql', so the engine is part of the key. Keys of 'psql' are unchanged.
+    """
+    sql, names = positional(template)
+    values = {name: _normalize(params[name]) for name in names}
+    key = f"{_normalize_sql(template)} -- {json.dumps(values, sort_keys=True)}"
+    return key if engine == 'psql' else f"{key} -- engine={engine}"
+
+
+@lru_cache(maxsize=1024)
+def _normalize_sql(template: str) -> str:
+    return ' '.join(template.split())
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if value is None:
+        return None
+    return str(value)
@@ -0,0 +1,93 @@
+"""Dataset overview of all houses and items, as printed by the stats command"""
+import logging
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Union
+
+import pandas as pd
+
+from ._batch import request_many_iter
+from ._cache import QueryCache
+from ._loader import Query, Houses, Items, MeasurementsRangeBatch, AnnotationsBatch, MeasurementsMissingTotal, \
+    MeasurementsMissingTotalBatch
+from ._rollup import rollups_available
+
+if TYPE_CHECKING:
+    from ._db import Connection
+
+
+def dataset_stats(con: "Connection", include_annotations: bool = False, include_missing: bool = False,
+                  jobs: int = 5, cache_dir: Optional[Union[Path, str, QueryCache]] = None,
+                  progress: Optional[Callable[[int, int, Query], None]] = None) -> pd.DataFrame:
+    """
+    Range, annotation count and missing data of every item, indexed by house and item
+
+    All queries are scheduled at once and run concurrently on jobs pooled connections. Without rollups the
+    missing data is queried per item, so the run takes about as long as the slowest item if jobs is at least
+    the number of items, instead of scanning all measurements in a single query.
+    :param con: Connection
+    :param include_annotations: Include annotation count column
+    :param include_missing: Include missing data columns
+    :param jobs: Number of concurrent queries
+    :param cache_dir: Query cache directory or QueryCache
+    :param progress: Called with the number of completed queries, the number of queries and the completed query
+    """
+    items = Items().request(con, cache_dir)
+    queries: Dict[str, Query] = {'houses': Houses(), 'ranges': MeasurementsRangeBatch()}
+    if include_annotations:
+        queries['annotations'] = AnnotationsBatch()
+    if include_missing:
+        if rollups_available(con):
+            queries['missing'] = MeasurementsMissingTotalBatch()
+        else:
+            for item_id in items['id']:
+                queries[f'missing_{item_id}'] = MeasurementsMissingTotal(int(item_id))
+
+    keys = list(queries)
+    results: Dict[str, pd.DataFrame] = {}
+    for done, (i, df) in enumerate(request_many_iter(con, list(queries.values()), workers=jobs,
+                                                     cache_dir=cache_dir), 1):
+        results[keys[i]] = df
+        if progress is not None:
+            progress(done, len(keys), queries[keys[i]])
+
+    ranges = results['ranges'].set_index('item_id')
+    columns = ["House", "Item", "Category", "Type", "First date", "Last date", "Duration"]
+    if include_annotations:
+        columns += ["Annotations"]
+        annotation_counts = results['annotations'].groupby('item_id').size()
+    if include_missing:
+        columns += ["Missing > 1h5sec", "Missing > 1day"]
+        missing = pd.concat([df for key, df in results.items() if key.startswith('missing')]).set_index('item_id')
+
+    data: List[list] = []
+    for _, house in results['houses'].iterrows():
+        house_id = f"House {house.id:2}"
+        for _, item in items.loc[items.house == house.id].sort_values('id').iterrows():
+            if item['id'] not in ranges.index:
+                logging.warning(f"Skipping item {item['id']} without measurements")
+                continue
+            m_range = ranges.loc[item['id']]
+
+            category = item['category']
+            name_type = item['name'] if item['name'].lower() != item['category'].lower() else ""
+            line = [
+                house_id,
+                item['id'],
+                category,
+                name_type,
+                str(m_range.min_date),
+                str(m_range.max_date),
+                f"{(m_range.max_date - m_range.min_date).days} days"
+            ]
+            if include_annotations:
+                line += [str(annotation_counts.get(item['id'], 0))]
+            if include_missing:
+                item_missing = missing.loc[item['id']]
+                line += [
+                    "{:.2f}%".format(item_missing.perc_missing_hour * 100),
+                    "{:.2f}%".format(item_missing.perc_missing_day * 100)
+                ]
+
+            data.append(line)
+
+    return pd.DataFrame(data, columns=columns).set_index(["House", "Item"])
@@ -0,0 +1,158 @@
+import json
+import logging
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional, Union
+from uuid import uuid4
+
+import pandas as pd
+
+from ._cache import BACKENDS, CacheBackend, QueryCache, TimeLike, _as_time
+from ._loader import MeasurementsSince
+
+if TYPE_CHECKING:
+    from ._db import Connection
+
+
+class MeasurementsSync:
+    """
+    Incrementally synchronized local mirror of the measurements of items
+
+    Every item has a watermark, the maximum time fetched so far. A refresh only queries rows with
+    time > watermark - overlap and appends them as a new part, so its cost depends on the new rows only.
+    Rows of older parts within the overlap are superseded by the new part, so rows arriving late, up to
+    overlap after newer rows, are picked up. Rows arriving later than that are not.
+
+    Examples
+    --------
+    >>> sync = MeasurementsSync("cache", overlap="10min")
+    >>> new_rows = sync.refresh(con, 10)  # First refresh fetches everything, later ones only new rows
+    >>> df = sync.read(10, "2017-01-01", "2017-02-01")
+    """
+    _STATE_FILE = 'state.json'
+
+    def __init__(self, cache_dir: Union[Path, str, QueryCache], backend: Union[str, CacheBackend] = 'pickle',
+                 overlap: Union[str, pd.Timedelta] = '10min', max_parts: int = 64):
+        """
+        :param cache_dir: Cache directory or QueryCache, items are stored in its sync subdirectory
+        :param backend: Storage format of the parts, see QueryCache. Ignored if cache_dir is a QueryCache.
+        :param overlap: Time before the watermark queried again on refresh to pick up late rows
+        :param max_parts: Parts of an item are compacted into a single part when exceeding max_parts
+        """
+        if isinstance(cache_dir, QueryCache):
+            backend = cache_dir.backend
+            cache_dir = cache_dir.cache_dir
+        if isinstance(backend, str):
+            if backend not in BACKENDS:
+                raise ValueError(f"Unknown cache backend {backend}, expected one of {list(BACKENDS)}")
+            backend = BACKENDS[backend]()
+        self.sync_dir = Path(cache_dir) / 'sync'
+        self.backend = backend
+        self.overlap = pd.Timedelta(overlap)
+        self.max_parts = max_parts
+
+    def watermark(self, item_id: int) -> Optional[pd.Timestamp]:
+        """Maximum time of the stored measurements of item_id, None if it was never synchronized"""
+        watermark = self._read_state(item_id)['watermark']
+        return None if watermark is None else pd.Timestamp(watermark)
+
+    def refresh(self, con: "Connection", item_id: int, engine: str = 'psql') -> pd.DataFrame:
+        """
+        Fetch measurements of item_id newer than watermark - overlap and append them
+        :param con: Connection
+        :param item_id: item_id
+        :param engine: Fetch engine, see Query.request
+        :return: Fetched rows
+        """
+        state = self._read_state(item_id)
+        watermark = state['watermark']
+        since = None if watermark is None else (pd.Timestamp(watermark) - self.overlap).isoformat()
+        df = MeasurementsSince(item_id, since).request(con, engine=engine)
+        if df.empty:
+            return df
+        df = df.copy()
+        if getattr(df['time'].dtype, 'tz', None) is not None:
+            df['time'] = df['time'].dt.tz_convert('UTC')
+        item_dir = self._item_dir(item_id)
+        item_dir.mkdir(parents=True, exist_ok=True)
+        file = f"{uuid4().hex}.{self.backend.FILE_EXT}"
+        tmp_path = item_dir / f"{file}.tmp"
+        self.backend.write(tmp_path, df.reset_index(drop=True))
+        tmp_path.replace(item_dir / file)
+
+        latest = _as_time(df['time'].max(), tz='UTC')
+        if watermark is not None:
+            latest = max(latest, pd.Timestamp(watermark))
+        state['parts'].append({'since': since, 'file': file})
+        state['watermark'] = latest.isoformat()
+        self._write_state(item_id, state)
+        logging.info(f"Synchronized {len(df)} rows of item {item_id} since {since}, watermark {latest}")
+        if len(state['parts']) > self.max_parts:
+            self.compact(item_id)
+        return df
+
+    def read(self, item_id: int, start: TimeLike = None, stop: TimeLike = None) -> pd.DataFrame:
+        """
+        Stored measurements of item_id with start <= time <= stop
+        :param item_id: item_id
+        :param start: First measurement, naive times are interpreted as UTC
+        :param stop: Last measurement, naive times are interpreted as UTC
+        """
+        state = self._read_state(item_id)
+        if not state['parts']:
+            raise KeyError(f"Item {item_id} was never synchronized")
+        item_dir = self._item_dir(item_id)
+        pieces = []
+        for part, superseded in zip(state['parts'], self._superseded(state['parts'])):
+            # Rows at superseded are kept, the later part only holds rows with time > superseded
+            part_stop = superseded
+            if stop is not None:
+                stop = _as_time(stop, tz='UTC')
+                part_stop = stop if part_stop is None else min(stop, part_stop)
+            pieces.append(self.backend.read(item_dir / part['file'], start=start, stop=part_stop))
+        return pd.concat(pieces, ignore_index=True) if len(pieces) > 1 else pieces[0].reset_index(drop=True)
+
+    def compact(self, item_id: int):
+        """Merge all parts of item_id into a single part"""
+        state = self._read_state(item_id)
+        if len(state['parts']) < 2:
+            return
+        item_dir = self._item_dir(item_id)
+        df = self.read(item_id)
+        file = f"{uuid4().hex}.{self.backend.FILE_EXT}"
+        tmp_path = item_dir / f"{file}.tmp"
+        self.backend.write(tmp_path, df)
+        tmp_path.replace(item_dir / file)
+        old = state['parts']
+        state['parts'] = [{'since': old[0]['since'], 'file': file}]
+        self._write_state(item_id, state)
+        for part in old:
+            (item_dir / part['file']).unlink()
+
+    @staticmethod
+    def _superseded(parts: List[dict]) -> List[Optional[pd.Timestamp]]:
+        """Time after which rows of each part are superseded by a later part, None if they are not"""
+        result: List[Optional[pd.Timestamp]] = []
+        bound = None
+        for part in reversed(parts):
+            result.append(bound)
+            since = None if part['since'] is None else pd.Timestamp(part['since'])
+            if since is not None:
+                bound = since if bound is None else min(bound, since)
+        return result[::-1]
+
+    def _item_dir(self, item_id: int) -> Path:
+        return self.sync_dir / str(item_id)
+
+    def _read_state(self, item_id: int) -> dict:
+        path = self._item_dir(item_id) / self._STATE_FILE
+        if not path.exists():
+            return {'watermark': None, 'parts': []}
+        with path.open() as f:
+            return json.load(f)
+
+    def _write_state(self, item_id: int, state: dict):
+        path = self._item_dir(item_id) / self._STATE_FILE
+        tmp_path = path.with_name(f"{self._STATE_FILE}.tmp")
+        with tmp_path.open('w') as f:
+            json.dump(state, f, indent=1)
+        tmp_path.replace(path)
@@ -24,8 +24,9 @@ def get_version(rel_path):
 
 setup(name='deddiag-loader',
       version=get_version("deddiag_loader/__init__.py"),
-      packages=find_packages(),
+      packages=find_packages(exclude=["tests", "tests.*"]),
       install_requires=["pandas", "sqlalchemy", "psycopg2", "click"],
+      extras_require={"arrow": ["pyarrow"], "async": ["asyncpg"], "duckdb": ["duckdb"]},
       author='Marc Wenninger',
       author_email='pypi@walwe.de',
       description='Loader for DEDDIAG, a Domestic Energy Demand Dataset of Individual Appliances Germany',
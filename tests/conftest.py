@@ -0,0 +1,43 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'benchmarks'))
+
+import synthetic  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def synthetic_data():
+    """Tables of the tiny synthetic dataset"""
+    return synthetic.generate(*synthetic.SIZES['tiny'], seed=0)
+
+
+@pytest.fixture(scope='session')
+def local_dir(synthetic_data, tmp_path_factory):
+    """Directory of the tiny synthetic dataset in the layout of LocalConnection"""
+    directory = tmp_path_factory.mktemp('local')
+    synthetic.save_files(synthetic_data, str(directory))
+    return directory
+
+
+@pytest.fixture
+def connections(tmp_path):
+    """Factory of a LocalConnection and a DuckDBConnection on the same tables, see synthetic.generate"""
+    pytest.importorskip('duckdb')
+    from deddiag_loader import DuckDBConnection, LocalConnection, convert_parquet
+
+    opened = []
+
+    def make(data):
+        synthetic.save_files(data, str(tmp_path / 'local'))
+        local = LocalConnection(tmp_path / 'local')
+        convert_parquet(local, tmp_path / 'parquet')
+        duckdb = DuckDBConnection(tmp_path / 'parquet')
+        opened.append(duckdb)
+        return local, duckdb
+
+    yield make
+    for con in opened:
+        con.close()
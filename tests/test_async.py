@@ -0,0 +1,130 @@
+import asyncio
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+from deddiag_loader import AsyncConnection, Connection, Items, Measurements
+
+START = datetime(2017, 1, 1, tzinfo=timezone.utc)
+# Rows as returned by psycopg2 and asyncpg, which both return timestamptz as aware datetimes
+ROWS = {
+    Measurements: (['item_id', 'time', 'value'],
+                   [(1, START + timedelta(seconds=i * 1.5), None if i == 3 else i / 4) for i in range(10)]),
+    Items: (['id', 'house', 'name', 'category'], [(1, 1, 'Fridge', 'Fridge'), (2, 1, 'Freezer', None)]),
+}
+
+
+class FakeCursor:
+    """DBAPI cursor returning the rows of a query class for every statement"""
+
+    def __init__(self, columns, rows):
+        self._columns, self._rows = columns, rows
+        self.description = None
+
+    def execute(self, sql, params=None):
+        if not sql.startswith('PREPARE'):
+            self.description = [(c, None, None, None, None, None, None) for c in self._columns]
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeDBAPIConnection:
+
+    def __init__(self, columns, rows):
+        self._columns, self._rows = columns, rows
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self._columns, self._rows)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeConnection(Connection):
+    """Connection whose pooled connections return rows instead of querying PostgreSQL"""
+
+    def __init__(self, columns, rows):
+        self._fake = columns, rows
+        super().__init__()
+
+    def _get_conn(self):
+        return FakeDBAPIConnection(*self._fake)
+
+
+Attribute = namedtuple('Attribute', ['name'])
+
+
+class FakeStatement:
+
+    def __init__(self, columns, rows):
+        self._columns, self._rows = columns, rows
+
+    def get_attributes(self):
+        return [Attribute(c) for c in self._columns]
+
+    async def fetch(self):
+        return list(self._rows)
+
+
+class FakePool:
+    """asyncpg pool returning rows instead of querying PostgreSQL"""
+
+    def __init__(self, columns, rows):
+        self._fake = columns, rows
+
+    async def acquire(self):
+        return self
+
+    async def release(self, con):
+        pass
+
+    async def prepare(self, query):
+        return FakeStatement(*self._fake)
+
+    async def close(self):
+        pass
+
+
+def _async_connection(columns, rows) -> AsyncConnection:
+    con = AsyncConnection()
+    con._pool = FakePool(columns, rows)
+    return con
+
+
+@pytest.mark.filterwarnings('ignore:pandas only supports SQLAlchemy')
+@pytest.mark.parametrize('query', [Measurements(1, '2017-01-01', '2017-01-02'), Items()])
+def test_request_async_equals_request(query, tmp_path):
+    rows = ROWS[type(query)]
+    expected = query.request(FakeConnection(*rows))
+
+    async def run():
+        con = _async_connection(*rows)
+        try:
+            return [await query.request_async(con), await query.request_async(con, tmp_path),
+                    await query.request_async(con, tmp_path)]
+        finally:
+            await con.close()
+
+    for df in asyncio.run(run()):
+        pd.testing.assert_frame_equal(df, expected)
+    if 'time' in expected:
+        assert str(expected['time'].dtype).endswith(', UTC]')
+        assert expected['value'].isna().sum() == 1
@@ -0,0 +1,36 @@
+import pandas as pd
+import pytest
+
+import suite
+import synthetic
+
+
+@pytest.fixture(scope='module')
+def contexts(tmp_path_factory):
+    """Contexts of the benchmark suite on LocalConnection and DuckDBConnection of the small synthetic dataset"""
+    pytest.importorskip('duckdb')
+    from deddiag_loader import LocalConnection, convert_parquet
+
+    directory = tmp_path_factory.mktemp('backends')
+    synthetic.save_files(synthetic.generate(*synthetic.SIZES['small'], seed=0), str(directory / 'local'))
+    convert_parquet(LocalConnection(directory / 'local'), directory / 'parquet')
+    local = suite._context({'local': str(directory / 'local')}, str(directory))
+    duckdb = suite._context({'duckdb': str(directory / 'parquet')}, str(directory))
+    yield local, duckdb
+    duckdb.con.close()
+
+
+def _sorted(df: pd.DataFrame) -> pd.DataFrame:
+    """Rows in a defined order, DISTINCT queries return them in any order"""
+    return df.sort_values(list(df.columns), ignore_index=True)
+
+
+@pytest.mark.parametrize('name', list(suite.QUERIES))
+def test_local_equals_duckdb(contexts, name):
+    local, duckdb = contexts
+    assert (local.item_id, local.label_ids, local.start, local.stop) == \
+           (duckdb.item_id, duckdb.label_ids, duckdb.start, duckdb.stop)
+    expected = suite.QUERIES[name](duckdb).request(duckdb.con)
+    df = suite.QUERIES[name](local).request(local.con)
+    assert len(expected) > 0
+    pd.testing.assert_frame_equal(_sorted(df), _sorted(expected), check_exact=False, rtol=1e-6)
@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+
+from deddiag_loader import Items, Measurements, MeasurementsResampled, request_many, request_many_iter
+from deddiag_loader import _batch
+
+
+def _queries():
+    hours = pd.date_range('2017-01-01', periods=7, freq='3h', tz='UTC')
+    return [Measurements(item_id, start.isoformat(), stop.isoformat())
+            for start, stop in zip(hours[:-1], hours[1:]) for item_id in (1, 2)] + \
+        [MeasurementsResampled(item_id, '15min') for item_id in (1, 2)]
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_request_many_equals_request(connections, synthetic_data, workers):
+    for con in connections(synthetic_data):
+        queries = _queries()
+        expected = [query.request(con) for query in queries]
+        for df, expected_df in zip(request_many(con, queries, workers), expected):
+            pd.testing.assert_frame_equal(df, expected_df)
+        results = dict(request_many_iter(con, queries, workers))
+        assert sorted(results) == list(range(len(queries)))
+        for i, df in results.items():
+            pd.testing.assert_frame_equal(df, expected[i])
+
+
+class FlakyItems(Items):
+    """Items query losing its connection on the first attempts"""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    def request(self, con, *args, **kwargs):
+        from psycopg2 import OperationalError
+        if self.failures:
+            self.failures -= 1
+            raise OperationalError("server closed the connection unexpectedly")
+        return super().request(con, *args, **kwargs)
+
+
+def test_request_many_retries(connections, synthetic_data, monkeypatch):
+    monkeypatch.setattr(_batch.time, 'sleep', lambda seconds: None)
+    local, _ = connections(synthetic_data)
+    df, = request_many(local, [FlakyItems(2)], retries=2)
+    pd.testing.assert_frame_equal(df, Items().request(local))
+    with pytest.raises(Exception, match='server closed the connection'):
+        request_many(local, [FlakyItems(3)], retries=2)
+
+
+class InterruptedItems(Items):
+    """Items query failing as if DuckDB interrupted it"""
+
+    def request(self, con, *args, **kwargs):
+        import duckdb
+        raise duckdb.InterruptException("INTERRUPT Error: Interrupted!")
+
+
+def test_interrupt_raises_timeout(connections, synthetic_data):
+    _, duckdb = connections(synthetic_data)
+    with pytest.raises(TimeoutError, match='InterruptedItems exceeded timeout of 0.5s'):
+        request_many(duckdb, [InterruptedItems()], timeout=0.5)
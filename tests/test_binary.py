@@ -0,0 +1,74 @@
+import struct
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from deddiag_loader import _binary
+
+NAMES = ['item_id', 'time', 'value', 'on']
+OIDS = [_binary._INT4, _binary._TIMESTAMPTZ, _binary._FLOAT4, _binary._BOOL]
+START = pd.Timestamp('2017-01-01', tz='UTC')
+
+
+def _copy(rows) -> bytes:
+    """Binary COPY output of rows, None is written as NULL"""
+    formats = ['>i', '>q', '>f', '>?']
+    out = [_binary._SIGNATURE, struct.pack('>ii', 0, 0)]
+    for row in rows:
+        out.append(struct.pack('>h', len(row)))
+        for fmt, value in zip(formats, row):
+            if value is None:
+                out.append(struct.pack('>i', -1))
+            else:
+                if fmt == '>q':
+                    value = (value - pd.Timestamp('2000-01-01', tz='UTC')) // pd.Timedelta(microseconds=1)
+                data = struct.pack(fmt, value)
+                out.append(struct.pack('>i', len(data)) + data)
+    out.append(struct.pack('>h', -1))
+    return b''.join(out)
+
+
+def _rows(n: int, nulls=()):
+    rows = [[i % 3, START + pd.Timedelta(seconds=i), i / 4, i % 2 == 0] for i in range(n)]
+    for row, column in nulls:
+        rows[row][column] = None
+    return rows
+
+
+@pytest.mark.parametrize('n,nulls', [
+    (10, []),
+    (10, [(0, 0)]),
+    (10, [(4, 1), (4, 2)]),
+    (10, [(9, 3)]),
+    (10, [(i, 2) for i in range(10)]),
+    (40, [(3, 0), (17, 1), (18, 2), (39, 3)]),
+])
+@pytest.mark.parametrize('block_rows', [4, 1 << 16])
+def test_decode(monkeypatch, n, nulls, block_rows):
+    monkeypatch.setattr(_binary, '_BLOCK_ROWS', block_rows)
+    rows = _rows(n, nulls)
+    df = _binary.decode(memoryview(_copy(rows)), NAMES, OIDS)
+    expected = pd.DataFrame(rows, columns=NAMES)
+    null_columns = {NAMES[column] for _, column in nulls}
+    assert len(df) == n
+    assert df['item_id'].dtype == (np.float64 if 'item_id' in null_columns else np.int32)
+    assert df['value'].dtype == np.float32
+    assert df['on'].dtype == (object if 'on' in null_columns else bool)
+    assert str(df['time'].dtype) == 'datetime64[us, UTC]'
+    for name in NAMES:
+        assert df[name].isna().tolist() == expected[name].isna().tolist()
+        present = ~expected[name].isna()
+        assert df[name][present].tolist() == expected[name][present].tolist()
+
+
+def test_decode_empty():
+    df = _binary.decode(_copy([]), NAMES, OIDS)
+    assert list(df.columns) == NAMES and len(df) == 0
+
+
+def test_decode_rejects_invalid_input():
+    with pytest.raises(ValueError):
+        _binary.decode(b'COPY' + _copy([])[4:], NAMES, OIDS)
+    with pytest.raises(TypeError):
+        _binary.decode(_copy([]), ['name'], [25])
@@ -0,0 +1,82 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from deddiag_loader import QueryCache
+from deddiag_loader import _cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Strictly increasing time.time() of the cache, so access times never tie"""
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(_cache.time, 'time', lambda: float(next(ticks)))
+
+
+def _frame(i: int) -> pd.DataFrame:
+    return pd.DataFrame({'item_id': np.full(1000, i), 'value': np.arange(1000, dtype=np.float64)})
+
+
+def _cache_for(tmp_path, policy: str) -> QueryCache:
+    probe = QueryCache(tmp_path / 'probe')
+    probe.save('probe', _frame(0))
+    size = probe.file_path('probe').stat().st_size
+    return QueryCache(tmp_path / 'cache', max_bytes=int(2.5 * size), policy=policy)
+
+
+def _cached(cache: QueryCache):
+    return sorted(q for q in 'abc' if cache.file_path(q).exists())
+
+
+def test_lru_evicts_least_recently_used(tmp_path, clock):
+    cache = _cache_for(tmp_path, 'lru')
+    cache.save('a', _frame(1))
+    cache.save('b', _frame(2))
+    cache.read('a')
+    cache.save('c', _frame(3))
+    assert _cached(cache) == ['a', 'c']
+    pd.testing.assert_frame_equal(cache.read('a'), _frame(1))
+
+
+def test_lfu_evicts_least_frequently_used(tmp_path, clock):
+    cache = _cache_for(tmp_path, 'lfu')
+    cache.save('a', _frame(1))
+    cache.save('b', _frame(2))
+    cache.read('a')
+    cache.read('b')
+    cache.read('a')
+    cache.save('c', _frame(3))
+    assert _cached(cache) == ['a', 'c']
+    assert cache.entries().set_index('query').loc['a', 'hits'] == 2
+
+
+def test_entry_just_written_is_kept(tmp_path, clock):
+    cache = _cache_for(tmp_path, 'lru')
+    cache.save('a', pd.concat([_frame(1)] * 5, ignore_index=True))
+    assert _cached(cache) == ['a']
+
+
+@pytest.mark.parametrize('backend', ['pickle', 'parquet'])
+def test_interrupted_save_iter_leaves_no_entry(tmp_path, backend):
+    if backend == 'parquet':
+        pytest.importorskip('pyarrow')
+    cache = QueryCache(tmp_path, backend)
+
+    def failing():
+        yield _frame(1)
+        raise ConnectionError("lost")
+
+    with pytest.raises(ConnectionError):
+        list(cache.save_iter('a', failing()))
+    chunks = cache.save_iter('b', [_frame(1), _frame(2)])
+    next(chunks)
+    chunks.close()
+    assert list(tmp_path.iterdir()) == []
+    for query in 'ab':
+        with pytest.raises(FileNotFoundError):
+            cache.read(query)
+
+    written = list(cache.save_iter('a', [_frame(1), _frame(2)]))
+    pd.testing.assert_frame_equal(cache.read('a'), pd.concat(written, ignore_index=True))
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from deddiag_loader import WindowDataset
+from deddiag_loader._loader import Query
+
+
+class FrameQuery:
+    """Query returning a fixed DataFrame in chunks"""
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+
+    def request_iter(self, con, chunk_rows: int, cache_dir=None):
+        return Query._rechunk([self.df], chunk_rows)
+
+
+def _frame(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'value': rng.normal(size=n), 'labels': rng.random(n) < 0.3})
+
+
+def _windows(dataset: WindowDataset):
+    batches = list(dataset)
+    if not batches:
+        return np.empty((0, dataset.window), dtype=np.float32), np.empty(0, dtype=bool)
+    return np.concatenate([x for x, _ in batches]), np.concatenate([y for _, y in batches])
+
+
+@pytest.mark.parametrize('n,window,step,chunk_rows', [
+    (1000, 10, 100, 50),
+    (1000, 10, 1, 7),
+    (1000, 64, 16, 100),
+    (1000, 10, 250, 1),
+    (1000, 300, 7, 128),
+    (95, 10, 100, 10),
+    (5, 10, 1, 2),
+])
+@pytest.mark.parametrize('label_reduction', ['any', 'majority', 'center'])
+def test_chunked_equals_unchunked(n, window, step, chunk_rows, label_reduction):
+    query = FrameQuery(_frame(n))
+    expected = _windows(WindowDataset(None, query, window, step, label_reduction, chunk_rows=n + 1))
+    x, y = _windows(WindowDataset(None, query, window, step, label_reduction, batch_size=3, chunk_rows=chunk_rows))
+    assert len(expected[0]) == max((n - window) // step + 1, 0)
+    np.testing.assert_array_equal(x, expected[0])
+    np.testing.assert_array_equal(y, expected[1])
+
+
+def test_windows_start_every_step():
+    df = _frame(1000)
+    x, _ = _windows(WindowDataset(None, FrameQuery(df), window=10, step=100, chunk_rows=50))
+    values = df['value'].to_numpy(dtype=np.float32)
+    np.testing.assert_array_equal(x, np.stack([values[i:i + 10] for i in range(0, 991, 100)]))
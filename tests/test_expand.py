@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from deddiag_loader import MeasurementsExpanded, MeasurementsExpandedClient
+
+
+@pytest.mark.parametrize('start,stop', [
+    ('2017-01-01 06:00:00', '2017-01-01 07:30:00'),
+    ('2017-01-01 06:00:00.600', '2017-01-01 06:10:00.400'),
+    ('2016-12-31 23:50:00', '2017-01-01 00:05:00'),
+    ('2017-01-01 23:50:00', '2017-01-02 00:30:00'),
+    ('2017-01-01 12:00:00', '2017-01-01 12:00:00'),
+])
+def test_client_equals_query(connections, synthetic_data, start, stop):
+    local, duckdb = connections(synthetic_data)
+    expected = MeasurementsExpanded(2, start, stop).request(duckdb)
+    query = MeasurementsExpandedClient(2, start, stop)
+    for con in (local, duckdb):
+        pd.testing.assert_frame_equal(query.request(con), expected, check_dtype=False)
+        chunks = list(query.request_iter(con, chunk_rows=997))
+        assert all(len(df) <= 997 for df in chunks)
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected, check_dtype=False)
+
+
+def test_view_slices(connections, synthetic_data):
+    _, duckdb = connections(synthetic_data)
+    query = MeasurementsExpandedClient(1, '2017-01-01 06:00:00', '2017-01-01 08:00:00')
+    expected = query.request(duckdb)
+    view = query.request_view(duckdb)
+    assert len(view) == len(expected) == 7201
+    values = expected['value'].to_numpy()
+    np.testing.assert_array_equal(view[100:3700], values[100:3700])
+    np.testing.assert_array_equal(view[5:7000:60], values[5:7000:60])
+    np.testing.assert_array_equal(view[[0, 59, -1]], values[[0, 59, -1]])
+    assert view[4321] == values[4321]
+    pd.testing.assert_frame_equal(view.to_frame(), expected)
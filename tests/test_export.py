@@ -0,0 +1,67 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import synthetic
+from deddiag_loader import LocalConnection, MeasurementsExpandedWithLabelsClient, save_memmap
+from deddiag_loader._expand import to_epoch_us
+from deddiag_loader._export import MANIFEST_FILE, NO_LABEL_STORED, MemmapExport, export_partitions, partitions
+from deddiag_loader._labels import NO_LABEL
+
+
+@pytest.mark.parametrize('mode', ['mask', 'multi_hot', 'label_id'])
+def test_save_memmap_equals_request(connections, tmp_path, mode):
+    local, _ = connections(synthetic.generate(*synthetic.SIZES['small'], seed=0))
+    query = MeasurementsExpandedWithLabelsClient(6, None, '2017-01-01 20:00:00', '2017-01-02 02:30:00', mode)
+    expected = query.request(local)
+    index = save_memmap(local, query, tmp_path, chunk_rows=10000)
+    export = MemmapExport(tmp_path)
+    assert len(export) == index['rows'] == len(expected)
+    assert export.columns == [c for c in expected.columns if c != 'item_id']
+    np.testing.assert_array_equal(export['time'], to_epoch_us(expected['time']) // 10 ** 6)
+    np.testing.assert_array_equal(export['value'], expected['value'].to_numpy(dtype=np.float32))
+    for column in export.columns[2:]:
+        values = expected[column].to_numpy()
+        if column == 'label_id':
+            values = np.where(values == NO_LABEL, NO_LABEL_STORED, values)
+        np.testing.assert_array_equal(export[column], values)
+    assert list(index['days']) == ['2017-01-01', '2017-01-02']
+    for date in index['days']:
+        day = export.day(date)
+        days = expected['time'].dt.strftime('%Y-%m-%d') == date
+        np.testing.assert_array_equal(day['value'], expected.loc[days, 'value'].to_numpy(dtype=np.float32))
+        assert len(day['time']) == days.sum()
+    with pytest.raises(KeyError):
+        export.day('2017-01-03')
+
+
+def _export(con, directory, **kwargs):
+    parts = partitions(con, **kwargs)
+    return parts, list(export_partitions(con, directory, parts, workers=2))
+
+
+def test_resume_skips_completed_partitions(local_dir, tmp_path):
+    con = LocalConnection(local_dir)
+    parts, stats = _export(con, tmp_path)
+    assert len(stats) == len(parts) > 0
+    assert _export(con, tmp_path)[1] == []
+
+
+def test_reexports_partition_of_other_range(synthetic_data, local_dir, tmp_path):
+    con = LocalConnection(local_dir)
+    item_id = int(synthetic_data['items']['id'].iloc[0])
+    short, stats = _export(con, tmp_path, item_ids=[item_id], stop_date='2017-01-01 06:00:00')
+    assert [s['rows'] for s in stats] == [int((p.stop - p.start).total_seconds()) + 1 for p in short]
+
+    full, stats = _export(con, tmp_path, item_ids=[item_id])
+    assert [p.path for p in full] == [p.path for p in short]
+    assert sum(s['rows'] for s in stats) > sum(int((p.stop - p.start).total_seconds()) for p in short)
+    for part in full:
+        export = MemmapExport(tmp_path / part.path)
+        assert pd.Timestamp(export.index['stop_date']) == part.stop
+        assert len(export) == int((part.stop - part.start).total_seconds()) + 1
+    with (tmp_path / MANIFEST_FILE).open() as f:
+        manifest = json.load(f)
+    assert {p.path: p.stop.isoformat() for p in full} == {k: v['stop'] for k, v in manifest['partitions'].items()}
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import synthetic
+from deddiag_loader import MeasurementsExpandedClient, MeasurementsExpandedWithLabels, \
+    MeasurementsExpandedWithLabelsClient
+from deddiag_loader._labels import NO_LABEL
+
+
+@pytest.fixture
+def labeled(connections):
+    """Connections of the small synthetic dataset, item 6 with overlapping annotations of two labels"""
+    data = synthetic.generate(*synthetic.SIZES['small'], seed=0)
+    annotations = data['annotations']
+    label_id = int(annotations.loc[annotations['item_id'] == 6, 'label_id'].iloc[0])
+    other = int(data['annotation_labels']['id'].max()) + 1
+    extra = pd.DataFrame({
+        'id': [100, 101],
+        'item_id': [6, 6],
+        'label_id': [other, other],
+        'start_date': pd.to_datetime(['2017-01-01 16:00:00', '2017-01-01 20:02:00'], utc=True),
+        'stop_date': pd.to_datetime(['2017-01-01 16:17:00', '2017-01-01 20:24:00.500'], format='ISO8601', utc=True),
+    })
+    data = {**data, 'annotations': pd.concat([annotations, extra], ignore_index=True),
+            'annotation_labels': pd.concat([data['annotation_labels'],
+                                            pd.DataFrame({'id': [other], 'name': ['Other']})], ignore_index=True)}
+    return connections(data), label_id, other
+
+
+@pytest.mark.parametrize('item_id,start,stop', [
+    (4, '2017-01-02 10:00:00', '2017-01-02 17:00:00'),
+    (6, '2017-01-01 15:50:00', '2017-01-01 20:30:00'),
+    (6, '2017-01-02 00:00:00', '2017-01-02 00:10:00'),
+])
+def test_mask_equals_query(labeled, item_id, start, stop):
+    (local, duckdb), label_id, other = labeled
+    for label_ids in (None, [label_id], [other]):
+        expected = MeasurementsExpandedWithLabels(item_id, label_ids, start, stop).request(duckdb)
+        query = MeasurementsExpandedWithLabelsClient(item_id, label_ids, start, stop)
+        for con in (local, duckdb):
+            pd.testing.assert_frame_equal(query.request(con), expected, check_dtype=False)
+            chunks = list(query.request_iter(con, chunk_rows=1000))
+            pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected, check_dtype=False)
+
+
+def test_label_modes(labeled):
+    (_, duckdb), label_id, other = labeled
+    start, stop = '2017-01-01 15:50:00', '2017-01-01 20:30:00'
+    measurements = MeasurementsExpandedClient(6, start, stop).request(duckdb)
+    multi_hot = MeasurementsExpandedWithLabelsClient(6, None, start, stop, 'multi_hot').request(duckdb)
+    label = MeasurementsExpandedWithLabelsClient(6, None, start, stop, 'label_id').request(duckdb)
+    covered = {}
+    for lid in (label_id, other):
+        mask = MeasurementsExpandedWithLabels(6, [lid], start, stop).request(duckdb)['labels'].to_numpy()
+        np.testing.assert_array_equal(multi_hot[f'label_{lid}'].to_numpy(), mask)
+        covered[lid] = mask
+    assert (covered[label_id] & covered[other]).any()
+    first, second = sorted(covered)
+    expected = np.where(covered[first], first, np.where(covered[second], second, NO_LABEL))
+    np.testing.assert_array_equal(label['label_id'].to_numpy(), expected)
+    pd.testing.assert_frame_equal(label[list(measurements.columns)], measurements)
@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+
+import synthetic
+from deddiag_loader import Annotations, AnnotationsBatch, Measurements, MeasurementsMissing, \
+    MeasurementsMissingBatch, MeasurementsMissingTotal, MeasurementsMissingTotalBatch, MeasurementsRange, \
+    MeasurementsRangeBatch
+from deddiag_loader._cache import QueryCache
+
+
+@pytest.mark.parametrize('chunk_rows', [1000, 4096, 10053, 20000])
+def test_request_iter_chunks(connections, synthetic_data, chunk_rows):
+    for con in connections(synthetic_data):
+        query = Measurements(1, '2017-01-01', '2017-01-09')
+        expected = query.request(con)
+        chunks = list(query.request_iter(con, chunk_rows))
+        assert all(0 < len(df) <= chunk_rows for df in chunks)
+        assert len(chunks) >= -(-len(expected) // chunk_rows)
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected)
+
+
+def test_request_iter_cached_chunks(connections, synthetic_data, tmp_path):
+    _, duckdb = connections(synthetic_data)
+    query = Measurements(2)
+    expected = query.request(duckdb)
+    cache = QueryCache(tmp_path / 'cache')
+    written = list(query.request_iter(duckdb, 3000, cache))
+    read = list(query.request_iter(duckdb, 700, cache))
+    assert max(len(df) for df in read) == 700
+    for chunks in (written, read):
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected)
+
+
+def test_request_iter_empty(connections, synthetic_data):
+    for con in connections(synthetic_data):
+        chunks = list(Measurements(1, '2030-01-01', '2030-01-02').request_iter(con, 100))
+        assert len(chunks) == 1 and chunks[0].empty
+
+
+@pytest.mark.parametrize('batch,single', [
+    (MeasurementsRangeBatch, MeasurementsRange),
+    (MeasurementsMissingBatch, MeasurementsMissing),
+    (MeasurementsMissingTotalBatch, MeasurementsMissingTotal),
+    (AnnotationsBatch, Annotations),
+])
+def test_batch_equals_single_queries(connections, batch, single):
+    data = synthetic.generate(*synthetic.SIZES['small'], seed=0)
+    item_ids = [1, 4, 5, 6]
+    for con in connections(data):
+        # MeasurementsRange has no item_id column
+        expected = pd.concat([single(i).request(con).assign(item_id=i) for i in item_ids], ignore_index=True)
+        df = batch(item_ids).request(con)
+        assert len(df) > 0
+        # Rows of DISTINCT queries come in any order
+        columns = list(df.columns)
+        pd.testing.assert_frame_equal(df.sort_values(columns, ignore_index=True),
+                                      expected[columns].sort_values(columns, ignore_index=True), check_dtype=False)
@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+from deddiag_loader import Items, Measurements, profiler, request_many
+from deddiag_loader._profile import QueryProfiler
+
+
+@pytest.fixture
+def spans():
+    """Spans recorded by the enabled global profiler"""
+    recorded = []
+    profiler.reset()
+    profiler.enable(recorded.append)
+    yield recorded
+    profiler.disable()
+    profiler.remove_callback(recorded.append)
+    profiler.reset()
+
+
+def test_disabled_records_nothing():
+    p = QueryProfiler()
+    with p.query(Items), p.span('execute') as span:
+        span.rows = 10
+    p.record('fetch', 1.)
+    assert p.stats().empty
+
+
+def test_request_spans(connections, synthetic_data, spans, tmp_path):
+    _, duckdb = connections(synthetic_data)
+    # Spans of the conversion to Parquet
+    spans.clear()
+    profiler.reset()
+    df = Measurements(1).request(duckdb, cache_dir=tmp_path)
+    Measurements(1).request(duckdb, cache_dir=tmp_path)
+    names = [s.name for s in spans]
+    assert {'checkout', 'execute', 'fetch', 'decode', 'cache_miss', 'cache_write', 'cache_read'} <= set(names)
+    assert names.count('request') == 2
+    assert all(s.query == 'Measurements' for s in spans)
+    assert [s.rows for s in spans if s.name in ('request', 'fetch', 'cache_read')] == [len(df)] * 4
+
+    stats = profiler.stats().set_index(['query', 'span'])
+    assert stats.loc[('Measurements', 'request'), 'count'] == 2
+    assert stats.loc[('Measurements', 'request'), 'rows'] == 2 * len(df)
+    assert stats.loc[('Measurements', 'request'), 'seconds'] >= stats.loc[('Measurements', 'execute'), 'seconds']
+    assert f'deddiag_spans_total{{query="Measurements",span="request"}} 2' in profiler.prometheus().splitlines()
+
+
+def test_concurrent_spans_keep_their_query(connections, synthetic_data, spans):
+    local, duckdb = connections(synthetic_data)
+    spans.clear()
+    queries = [Items(), Measurements(1), Measurements(2), Items()]
+    for con in (local, duckdb):
+        request_many(con, queries, workers=4)
+    requests = [s for s in spans if s.name == 'request']
+    assert sorted(s.query for s in requests) == ['Items'] * 4 + ['Measurements'] * 4
+    assert {s.query for s in spans} == {'Items', 'Measurements'}
+    rows = pd.Series({s.query: s.rows for s in requests})
+    assert rows['Items'] == len(synthetic_data['items'])
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from deddiag_loader import MeasurementsResampled, MeasurementsResampledClient
+from deddiag_loader._resample import AGGREGATIONS, resample
+
+START = pd.Timestamp('2017-01-01', tz='UTC')
+
+
+def _with_measurements(data, seconds, values):
+    item_id = int(data['items']['id'].iloc[0])
+    measurements = pd.DataFrame({'item_id': item_id, 'time': START + pd.to_timedelta(seconds, unit='s'),
+                                 'value': np.asarray(values, dtype=np.float32)})
+    return item_id, {**data, 'measurements': measurements}
+
+
+def test_extreme_with_change_point_at_edge():
+    times = np.array([0, 60, 90, 180]) * 1000000
+    result = resample(times, np.array([100., 5., 7., 3.]), 0, 240 * 1000000, 60, ['min', 'max'])
+    np.testing.assert_array_equal(result['max'], [100., 7., 7., 3.])
+    np.testing.assert_array_equal(result['min'], [100., 5., 7., 3.])
+
+
+@pytest.mark.parametrize('seconds,values,interval,start,stop', [
+    ([0, 60, 90, 180], [100, 5, 7, 3], '1min', 0, 240),
+    ([0, 60, 90, 180], [100, 5, 7, 3], '1min', 30, 200),
+    ([0, 60, 90, 180], [100, 5, 7, 3], '1min', 60, 180),
+    ([0, 30, 30, 60, 61, 125], [1, 9, 2, 4, 8, 6], '1min', 0, 300),
+    ([0, 30, 30, 60, 61, 125], [1, 9, 2, 4, 8, 6], '2min', 0, 300),
+    ([10, 20, 3600, 3601, 7300], [5, 0, 50, 20, 1], '15min', 0, 9000),
+])
+def test_client_equals_query(connections, synthetic_data, seconds, values, interval, start, stop):
+    item_id, data = _with_measurements(synthetic_data, seconds, values)
+    local, duckdb = connections(data)
+    start, stop = (START + pd.Timedelta(seconds=s) for s in (start, stop))
+    expected = MeasurementsResampled(item_id, interval, AGGREGATIONS, start, stop).request(duckdb)
+    for con in (local, duckdb):
+        df = MeasurementsResampledClient(item_id, interval, AGGREGATIONS, start, stop).request(con)
+        pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+    pd.testing.assert_frame_equal(MeasurementsResampled(item_id, interval, AGGREGATIONS, start, stop).request(local),
+                                  expected, check_dtype=False)
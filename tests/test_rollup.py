@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import synthetic
+from deddiag_loader import MeasurementsDaily, MeasurementsMissingTotal, MeasurementsMissingTotalBatch, \
+    MeasurementsRange, MeasurementsRangeBatch
+from deddiag_loader._rollup import daily_summaries
+
+
+@pytest.fixture
+def small(connections):
+    return connections(synthetic.generate(*synthetic.SIZES['small'], seed=0))
+
+
+def test_daily_summaries_equal_query(small):
+    local, duckdb = small
+    expected = MeasurementsDaily().request(duckdb)
+    assert expected['item_id'].nunique() == 6 and expected['gap_hour_seconds'].gt(0).any()
+    df = MeasurementsDaily().request(local)
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False, check_exact=False, rtol=1e-9)
+    times, values = local.columns(6)
+    pd.testing.assert_frame_equal(daily_summaries(6, times, values), df[df['item_id'] == 6].reset_index(drop=True))
+
+
+def test_daily_summaries_of_no_measurements():
+    df = daily_summaries(1, np.empty(0, dtype=np.int64), np.empty(0))
+    assert len(df) == 0 and 'energy_wh' in df
+
+
+@pytest.mark.parametrize('query', [
+    MeasurementsRange(1), MeasurementsRange(5), MeasurementsRangeBatch(), MeasurementsRangeBatch([2, 6]),
+    MeasurementsMissingTotal(1), MeasurementsMissingTotal(6), MeasurementsMissingTotalBatch(),
+])
+def test_rollup_queries_equal_measurement_queries(small, query):
+    _, duckdb = small
+    expected = query.request(duckdb)
+    # The measurements_daily view of DuckDB stands in for the rollup table
+    duckdb.use_rollups, duckdb._rollups = True, True
+    assert query._template(duckdb) == query._ROLLUP_QUERY.format(**{**query._params, **getattr(query, '_sql', {})})
+    pd.testing.assert_frame_equal(query.request(duckdb), expected, check_dtype=False, check_exact=False, rtol=1e-9)
@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+from deddiag_loader import Measurements, SegmentCache
+from deddiag_loader._segments import Segment
+
+
+def T(s: str) -> pd.Timestamp:
+    return pd.Timestamp(s, tz='UTC')
+
+
+@pytest.fixture
+def requested(monkeypatch):
+    """(start_date, stop_date) of each Measurements query sent to the connection"""
+    ranges = []
+    request = Measurements.request
+
+    def record(self, con, *args, **kwargs):
+        ranges.append((T(self._params['start_date']), T(self._params['stop_date'])))
+        return request(self, con, *args, **kwargs)
+
+    monkeypatch.setattr(Measurements, 'request', record)
+    return ranges
+
+
+@pytest.mark.parametrize('backend', ['pickle', 'parquet'])
+def test_only_gaps_are_queried(connections, synthetic_data, requested, tmp_path, backend):
+    if backend == 'parquet':
+        pytest.importorskip('pyarrow')
+    _, con = connections(synthetic_data)
+    cache = SegmentCache(tmp_path / 'segments', backend)
+    steps = [
+        (('02:00', '04:00'), [('02:00', '04:00')]),
+        (('03:00', '06:00'), [('04:00', '06:00')]),
+        (('08:00', '09:00'), [('08:00', '09:00')]),
+        (('01:00', '10:00'), [('01:00', '02:00'), ('06:00', '08:00'), ('09:00', '10:00')]),
+        (('02:30', '09:30'), []),
+    ]
+    for (start, stop), gaps in steps:
+        requested.clear()
+        start, stop = f'2017-01-01 {start}', f'2017-01-01 {stop}'
+        df = cache.request(con, Measurements(1, start, stop))
+        assert requested == [(T(f'2017-01-01 {a}'), T(f'2017-01-01 {b}')) for a, b in gaps]
+        expected = Measurements(1, start, stop).request(con)
+        assert len(expected) > 0
+        pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+    # The request of 01:00 - 10:00 covered all segments, which were merged into one
+    assert len(list((tmp_path / 'segments' / 'Measurements' / '1').glob(f'*.{cache.backend.FILE_EXT}'))) == 1
+
+
+def test_gaps():
+    segments = [Segment(T('2017-01-02'), T('2017-01-03'), 'a'), Segment(T('2017-01-05'), T('2017-01-06'), 'b')]
+    assert SegmentCache.gaps([], T('2017-01-01'), T('2017-01-02')) == [(T('2017-01-01'), T('2017-01-02'))]
+    assert SegmentCache.gaps(segments, T('2017-01-02'), T('2017-01-03')) == []
+    assert SegmentCache.gaps(segments, T('2017-01-02 12:00'), T('2017-01-05 12:00')) == \
+        [(T('2017-01-03'), T('2017-01-05'))]
+    assert SegmentCache.gaps(segments, T('2017-01-01'), T('2017-01-07')) == [
+        (T('2017-01-01'), T('2017-01-02')), (T('2017-01-03'), T('2017-01-05')), (T('2017-01-06'), T('2017-01-07'))]
@@ -0,0 +1,65 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from deddiag_loader._sql import cache_key, literal, positional, render
+
+
+@pytest.mark.parametrize('value,expected', [
+    (None, "NULL"),
+    (True, "TRUE"),
+    (np.bool_(False), "FALSE"),
+    (np.int32(7), "7"),
+    (0.25, "0.25"),
+    (float('inf'), "'inf'::float8"),
+    ([1, 2], "ARRAY[1,2]"),
+    ([], "'{}'"),
+    (datetime.date(2017, 1, 2), "'2017-01-02'"),
+    (pd.Timestamp('2017-01-02 03:04:05', tz='UTC'), "'2017-01-02T03:04:05+00:00'"),
+    ("1hour 5min", "'1hour 5min'"),
+    ("O'Brien\\", "'O''Brien\\'"),
+])
+def test_literal(value, expected):
+    assert literal(value) == expected
+
+
+def test_literal_rejects_nul():
+    with pytest.raises(ValueError):
+        literal("a\x00b")
+
+
+def test_render():
+    template = "SELECT * FROM t WHERE a = %(a)s and b = ANY(%(b)s) and c LIKE 'x%%' and d = %(a)s"
+    assert render(template, {'a': "it's", 'b': [1, 2]}) == \
+        "SELECT * FROM t WHERE a = 'it''s' and b = ANY(ARRAY[1,2]) and c LIKE 'x%' and d = 'it''s'"
+
+
+def test_positional():
+    sql, names = positional("SELECT %(b)s, %(a)s, %(b)s, 'x%%'")
+    assert sql == "SELECT $1, $2, $1, 'x%'"
+    assert names == ('b', 'a')
+    assert positional("SELECT 1") == ("SELECT 1", ())
+
+
+def test_cache_key():
+    template = "SELECT * FROM t WHERE a = %(a)s and b = %(b)s"
+    key = cache_key(template, {'a': 1, 'b': [1, 2], 'unused': 3})
+    assert key == cache_key("SELECT *\n  FROM t WHERE a = %(a)s   and b = %(b)s", {'b': (1, 2), 'a': np.int64(1)})
+    assert key != cache_key(template, {'a': 2, 'b': [1, 2]})
+    assert key != cache_key(template.replace('b =', 'b <'), {'a': 1, 'b': [1, 2]})
+    assert cache_key(template, {'a': 1, 'b': [1, 2]}, 'psql') == key
+    assert cache_key(template, {'a': 1, 'b': [1, 2]}, 'copy') != key
+
+
+def test_rendered_literals_round_trip(connections, synthetic_data):
+    _, duckdb = connections(synthetic_data)
+    values = {'s': "O'Brien \\ %s", 'i': 42, 'f': 0.5, 'n': None, 'b': True}
+    df = duckdb.from_psql(render("SELECT %(s)s AS s, %(i)s AS i, %(f)s AS f, %(n)s AS n, %(b)s AS b", values))
+    row = df.iloc[0].to_dict()
+    assert pd.isna(row.pop('n'))
+    assert row == {k: v for k, v in values.items() if k != 'n'}
+    template = "SELECT name FROM items WHERE id = %(id)s and name <> %(s)s"
+    pd.testing.assert_frame_equal(duckdb.from_prepared(template, {'id': 1, 's': values['s']}),
+                                  duckdb.from_psql(render(template, {'id': 1, 's': values['s']})))
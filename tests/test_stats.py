@@ -0,0 +1,42 @@
+import threading
+
+import pandas as pd
+import pytest
+
+import synthetic
+from deddiag_loader import MeasurementsMissingTotal
+from deddiag_loader._stats import dataset_stats
+
+
+@pytest.fixture
+def small(connections):
+    return connections(synthetic.generate(*synthetic.SIZES['small'], seed=0))
+
+
+def test_stats_equal_for_any_jobs(small):
+    local, duckdb = small
+    expected = dataset_stats(duckdb, include_annotations=True, include_missing=True, jobs=1)
+    assert len(expected) == 6
+    assert expected['Annotations'].astype(int).sum() == 20
+    for con in (local, duckdb):
+        calls = []
+        df = dataset_stats(con, True, True, jobs=4, progress=lambda done, total, query: calls.append((done, total)))
+        pd.testing.assert_frame_equal(df, expected)
+        # houses, ranges, annotations and the missing data of each item
+        assert calls == [(i, 9) for i in range(1, 10)]
+    duckdb.use_rollups, duckdb._rollups = True, True
+    pd.testing.assert_frame_equal(dataset_stats(duckdb, True, True, jobs=4), expected)
+
+
+def test_missing_data_queried_concurrently(small, monkeypatch):
+    _, duckdb = small
+    # Every missing data query waits for all others, which only returns if all run at the same time
+    barrier = threading.Barrier(6, timeout=10)
+    request = MeasurementsMissingTotal.request
+
+    def wait(self, *args, **kwargs):
+        barrier.wait()
+        return request(self, *args, **kwargs)
+
+    monkeypatch.setattr(MeasurementsMissingTotal, 'request', wait)
+    assert len(dataset_stats(duckdb, include_missing=True, jobs=6)) == 6